@@ -44,7 +44,55 @@ def ray_cast(scene, origin, direction):
     return scene.ray_cast(scene.view_layers[0].depsgraph, origin, direction)
 
 
-def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
+def occluded(scene, origin, direction, t_max):
+    """shadow query, only hits closer than the light block it
+    Parameters
+    ----------
+    scene : bpy.types.Scene
+        The Blender scene we will cast a ray in
+    origin : Vector, float array of 3 items
+        Origin of the ray
+    direction : Vector, float array of 3 items
+        Normalized direction of the ray
+    t_max : float
+        Distance to the light, hits beyond it do not block the light
+    Returns
+    -------
+    is_occluded : bool
+        If anything lies between origin and origin + t_max * direction
+    """
+    return scene.ray_cast(
+        scene.view_layers[0].depsgraph, origin, direction, distance=t_max
+    )[0]
+
+
+def material_table(scene):
+    """collect the simpleRT_material of every mesh object once per render
+    Parameters
+    ----------
+    scene : bpy.types.Scene
+        The scene that will be rendered
+    Returns
+    -------
+    materials : dict
+        "index" maps an object name to its object id, every other entry is
+        a NumPy array of one ObjectSettings property indexed by object id
+    """
+    objects = [o for o in scene.objects if o.type == "MESH"]
+    mats = [o.simpleRT_material for o in objects]
+    return dict(
+        index={o.name: i for i, o in enumerate(objects)},
+        diffuse_color=np.array([m.diffuse_color[:3] for m in mats]).reshape(-1, 3),
+        specular_color=np.array([m.specular_color[:3] for m in mats]).reshape(-1, 3),
+        specular_hardness=np.array([m.specular_hardness for m in mats]),
+        use_fresnel=np.array([m.use_fresnel for m in mats], dtype=bool),
+        mirror_reflectivity=np.array([m.mirror_reflectivity for m in mats]),
+        ior=np.array([m.ior for m in mats]),
+        transmission=np.array([m.transmission for m in mats]),
+    )
+
+
+def RT_trace_ray(scene, ray_orig, ray_dir, lights, materials, depth=0):
 
     color = np.zeros(3)
 
@@ -71,10 +119,11 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
     """
     ambient_color = scene.simpleRT.ambient_color
     eps = 1e-3
-    mat = hit_obj.simpleRT_material
-    diffuse_color = Vector(mat.diffuse_color).xyz
-    specular_color = Vector(mat.specular_color).xyz
-    specular_hardness = mat.specular_hardness
+    # material of the hit object, from the table built at render start
+    mat = materials["index"][hit_obj.name]
+    diffuse_color = materials["diffuse_color"][mat]
+    specular_color = materials["specular_color"][mat]
+    specular_hardness = materials["specular_hardness"][mat]
 
     hit_by_light = False
 
@@ -86,9 +135,10 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
             light.data.simpleRT_light.color * light.data.simpleRT_light.energy
         )
 
-        has_light_hit, _, _, _, _, _ = ray_cast(
-            scene, hit_loc + hit_norm * eps, (light.location - hit_loc).normalized()
-        ) 
+        light_vec = light.location - hit_loc
+        has_light_hit = occluded(
+            scene, hit_loc + hit_norm * eps, light_vec.normalized(), light_vec.length
+        )
 
         if has_light_hit:
             continue 
@@ -151,6 +201,8 @@ def RT_render_scene(scene, width, height, depth, buf):
 
     # get all the lights from the scene
     scene_lights = [o for o in scene.objects if o.type == "LIGHT"]
+    # read the materials of all the objects once, not at every hit
+    materials = material_table(scene)
 
     # get the location and orientation of the active camera
     cam_location = scene.camera.location
@@ -173,7 +225,7 @@ def RT_render_scene(scene, width, height, depth, buf):
             ray_dir = ray_dir.normalized()
             # populate the RGB component of the buffer with ray tracing result
             buf[y, x, 0:3] = RT_trace_ray(
-                scene, cam_location, ray_dir, scene_lights, depth
+                scene, cam_location, ray_dir, scene_lights, materials, depth
             )
             # populate the alpha component of the buffer
             # to make the pixel not transparent
@@ -44,7 +44,55 @@ def ray_cast(scene, origin, direction):
     return scene.ray_cast(scene.view_layers[0].depsgraph, origin, direction)
 
 
-def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
+def occluded(scene, origin, direction, t_max):
+    """shadow query, only hits closer than the light block it
+    Parameters
+    ----------
+    scene : bpy.types.Scene
+        The Blender scene we will cast a ray in
+    origin : Vector, float array of 3 items
+        Origin of the ray
+    direction : Vector, float array of 3 items
+        Normalized direction of the ray
+    t_max : float
+        Distance to the light, hits beyond it do not block the light
+    Returns
+    -------
+    is_occluded : bool
+        If anything lies between origin and origin + t_max * direction
+    """
+    return scene.ray_cast(
+        scene.view_layers[0].depsgraph, origin, direction, distance=t_max
+    )[0]
+
+
+def material_table(scene):
+    """collect the simpleRT_material of every mesh object once per render
+    Parameters
+    ----------
+    scene : bpy.types.Scene
+        The scene that will be rendered
+    Returns
+    -------
+    materials : dict
+        "index" maps an object name to its object id, every other entry is
+        a NumPy array of one ObjectSettings property indexed by object id
+    """
+    objects = [o for o in scene.objects if o.type == "MESH"]
+    mats = [o.simpleRT_material for o in objects]
+    return dict(
+        index={o.name: i for i, o in enumerate(objects)},
+        diffuse_color=np.array([m.diffuse_color[:3] for m in mats]).reshape(-1, 3),
+        specular_color=np.array([m.specular_color[:3] for m in mats]).reshape(-1, 3),
+        specular_hardness=np.array([m.specular_hardness for m in mats]),
+        use_fresnel=np.array([m.use_fresnel for m in mats], dtype=bool),
+        mirror_reflectivity=np.array([m.mirror_reflectivity for m in mats]),
+        ior=np.array([m.ior for m in mats]),
+        transmission=np.array([m.transmission for m in mats]),
+    )
+
+
+def RT_trace_ray(scene, ray_orig, ray_dir, lights, materials, depth=0):
 
     color = np.zeros(3)
 
@@ -70,10 +118,11 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
     """
     ambient_color = scene.simpleRT.ambient_color
     eps = 1e-3
-    mat = hit_obj.simpleRT_material
-    diffuse_color = Vector(mat.diffuse_color).xyz
-    specular_color = Vector(mat.specular_color).xyz
-    specular_hardness = mat.specular_hardness
+    # material of the hit object, from the table built at render start
+    mat = materials["index"][hit_obj.name]
+    diffuse_color = materials["diffuse_color"][mat]
+    specular_color = materials["specular_color"][mat]
+    specular_hardness = materials["specular_hardness"][mat]
 
     hit_by_light = False
 
@@ -85,9 +134,10 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
             light.data.simpleRT_light.color * light.data.simpleRT_light.energy
         )
 
-        has_light_hit, _, _, _, _, _ = ray_cast(
-            scene, hit_loc + hit_norm * eps, (light.location - hit_loc).normalized()
-        ) 
+        light_vec = light.location - hit_loc
+        has_light_hit = occluded(
+            scene, hit_loc + hit_norm * eps, light_vec.normalized(), light_vec.length
+        )
 
         if has_light_hit:
             continue 
@@ -125,13 +175,13 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
     """
     Step 3.a: Recursion & Reflection 
     """
-    #reflectivity = mat.mirror_reflectivity # Constant 
+    #reflectivity = materials["mirror_reflectivity"][mat] # Constant 
     
     """
     Step 3.b: Fresnel
     """
     n1 = 1.0
-    n2 = mat.ior
+    n2 = materials["ior"][mat]
     r0 = ((n1 - n2) / (n1 + n2)) ** 2
     reflectivity = r0 + (1 - r0) * ((1 + ray_dir.dot(hit_norm)) ** 5)
 
@@ -141,19 +191,22 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
         ref_dir = ray_dir - 2 * hit_norm.dot(ray_dir) * hit_norm
         # recursive call for reflection and transmission
         reflection_color = RT_trace_ray(
-            scene, ref_orig, ref_dir, lights, depth - 1
+            scene, ref_orig, ref_dir, lights, materials, depth - 1
         )
         color += reflection_color * reflectivity # use Fresnel reflectivity
 
     """
     Step 4: Transmission 
     """
-    if depth > 0 and mat.transmission > 0:
+    transmission = materials["transmission"][mat]
+    if depth > 0 and transmission > 0:
+        # a Python float, a NumPy scalar would turn the Vector math into arrays
+        ior = float(materials["ior"][mat])
         # first compute the refractive index ratio
         if ray_inside_object:
-            ior_ratio = mat.ior / 1 # ratio = n1 / n2, n1 is always the ior of medium the ray starts
+            ior_ratio = ior / 1 # ratio = n1 / n2, n1 is always the ior of medium the ray starts
         else:
-            ior_ratio = 1 / mat.ior
+            ior_ratio = 1 / ior
         
         cos_theta_i = hit_norm.dot(-ray_dir)
         sin2_theta_t = ior_ratio**2 * (1 - cos_theta_i**2)
@@ -165,8 +218,9 @@ def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
             refracted_dir = ior_ratio * ray_dir + (ior_ratio * cos_theta_i - cos_theta_t) * hit_norm
 
             refracted_dir = refracted_dir.normalized()
-            color += (1 - reflectivity) * mat.transmission * RT_trace_ray(
-                scene, hit_loc - hit_norm * eps, refracted_dir, lights, depth - 1
+            color += (1 - reflectivity) * transmission * RT_trace_ray(
+                scene, hit_loc - hit_norm * eps, refracted_dir, lights, materials,
+                depth - 1,
             )
 
     return color
@@ -192,6 +246,8 @@ def RT_render_scene(scene, width, height, depth, buf):
 
     # get all the lights from the scene
     scene_lights = [o for o in scene.objects if o.type == "LIGHT"]
+    # read the materials of all the objects once, not at every hit
+    materials = material_table(scene)
 
     # get the location and orientation of the active camera
     cam_location = scene.camera.location
@@ -214,7 +270,7 @@ def RT_render_scene(scene, width, height, depth, buf):
             ray_dir = ray_dir.normalized()
             # populate the RGB component of the buffer with ray tracing result
             buf[y, x, 0:3] = RT_trace_ray(
-                scene, cam_location, ray_dir, scene_lights, depth
+                scene, cam_location, ray_dir, scene_lights, materials, depth
             )
             # populate the alpha component of the buffer
             # to make the pixel not transparent
@@ -0,0 +1,30 @@
+#  conftest.py
+#
+#  Shared fixtures of the simpleRT tests, run with `python -m pytest` from
+#  this folder. The scenes are built with simpleRT_headless.py, so the NumPy
+#  engines are tested without Blender.
+
+import pytest
+
+from simpleRT_headless import Depsgraph, cornell_box
+from simpleRT_scene import snapshot_scene
+from simpleRT_wavefront import WavefrontTracer
+
+
+# small enough for every render of the tests to take a few seconds
+WIDTH = HEIGHT = 8
+DEPTH = 2
+TILE_SIZE = 4
+
+
+@pytest.fixture
+def snapshot():
+    """Snapshot of the glass Cornell box with its BVH built"""
+    snapshot = snapshot_scene(Depsgraph(cornell_box(resolution=(WIDTH, HEIGHT))))
+    snapshot.build_bvh()
+    return snapshot
+
+
+@pytest.fixture
+def tracer(snapshot):
+    return WavefrontTracer(snapshot)
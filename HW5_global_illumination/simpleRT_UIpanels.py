@@ -30,9 +30,186 @@ class ObjectSettings(bpy.types.PropertyGroup):
 class RenderSettings(bpy.types.PropertyGroup):
     samples: bpy.props.IntProperty(default=4, soft_min=0)
     recursion_depth: bpy.props.IntProperty(default=2, soft_min=0)
+    use_roulette: bpy.props.BoolProperty(
+        default=False,
+        description="End dim paths at random (Russian roulette), allows a higher depth",
+    )
+    roulette_min_depth: bpy.props.IntProperty(
+        default=3,
+        min=0,
+        description="Bounces always traced before Russian roulette may end a path",
+    )
     ambient_color: bpy.props.FloatVectorProperty(
         default=(0.05, 0.05, 0.05), subtype="COLOR"
     )
+    use_mis: bpy.props.BoolProperty(
+        default=False,
+        description="Combine area light sampling with BSDF sampling (multiple importance sampling)",
+    )
+    mis_heuristic: bpy.props.EnumProperty(
+        items=(
+            ("BALANCE", "Balance", "Weights proportional to the pdfs"),
+            ("POWER", "Power", "Weights proportional to the squared pdfs"),
+        ),
+        default="POWER",
+    )
+    use_light_tree: bpy.props.BoolProperty(
+        default=False,
+        description="Shade every hit with a few lights picked from a light tree instead of every light",
+    )
+    light_samples: bpy.props.IntProperty(
+        default=1,
+        min=1,
+        soft_max=16,
+        description="Lights picked from the light tree per hit; ambient lights the hits where none of them is visible",
+    )
+    use_irradiance_cache: bpy.props.BoolProperty(
+        default=False,
+        description="Interpolate the diffuse GI between sparse irradiance records",
+    )
+    irradiance_accuracy: bpy.props.FloatProperty(
+        default=0.25,
+        min=0.01,
+        soft_max=1.0,
+        description="Error allowed when reusing a record at the first hits, doubled every bounce after; smaller means more records",
+    )
+    irradiance_rays: bpy.props.IntProperty(
+        default=64,
+        min=4,
+        soft_max=512,
+        description="Hemisphere rays traced per irradiance record",
+    )
+    irradiance_prepass: bpy.props.BoolProperty(
+        default=False,
+        description="Fill the cache before rendering and share it read-only with the workers",
+    )
+    use_photons: bpy.props.BoolProperty(
+        default=False,
+        description="Add the caustics of glass and mirrors from a photon map",
+    )
+    photon_count: bpy.props.IntProperty(
+        default=50000,
+        min=1000,
+        soft_max=1000000,
+        description="Photons shot from the lights per photon pass",
+    )
+    photon_passes: bpy.props.IntProperty(
+        default=4,
+        min=1,
+        soft_max=64,
+        description="Photon passes, each gathered in a smaller radius; more passes give sharper caustics",
+    )
+    use_bvh: bpy.props.BoolProperty(
+        default=False,
+        description="Intersect rays with simpleRT's own BVH instead of Scene.ray_cast()",
+    )
+    integrator: bpy.props.EnumProperty(
+        items=(
+            ("RECURSIVE", "Recursive", "Depth-first RT_trace_ray, one ray at a time"),
+            ("PATH", "Path", "Iterative path tracing, one lobe per bounce"),
+            ("WAVEFRONT", "Wavefront", "Breadth-first, every stage batched with NumPy"),
+        ),
+        default="RECURSIVE",
+    )
+    workers: bpy.props.IntProperty(
+        default=0,
+        min=0,
+        description="Worker processes rendering tiles (wavefront only), 0 renders in Blender's process",
+    )
+    seed: bpy.props.IntProperty(default=0, min=0)
+    sampler: bpy.props.EnumProperty(
+        items=(
+            ("SOBOL", "Sobol", "Owen-scrambled Sobol points, shuffled per pixel"),
+            ("HALTON", "Halton", "Halton points, rotated per pixel (Cranley-Patterson)"),
+            ("RANDOM", "Random", "Independent random numbers"),
+        ),
+        default="SOBOL",
+    )
+    tile_size: bpy.props.IntProperty(default=64, min=8, soft_max=512)
+    tile_order: bpy.props.EnumProperty(
+        items=(
+            ("SCANLINE", "Scanline", "Row by row from the bottom"),
+            ("SPIRAL", "Spiral", "Outwards from the centre of the frame"),
+            ("HILBERT", "Hilbert", "Along a Hilbert curve"),
+        ),
+        default="SCANLINE",
+    )
+    use_adaptive: bpy.props.BoolProperty(
+        default=False,
+        description="Spend the samples on the noisiest pixels, adds a Samples pass",
+    )
+    adaptive_threshold: bpy.props.FloatProperty(
+        default=0.05,
+        min=0.0,
+        soft_max=0.5,
+        description="Relative error of a pixel under which it stops being sampled",
+    )
+    adaptive_min_samples: bpy.props.IntProperty(
+        default=4,
+        min=2,
+        description="Samples every pixel takes before its error is estimated",
+    )
+    use_denoise: bpy.props.BoolProperty(
+        default=False,
+        description="Filter the final image guided by the first-hit albedo, normal and depth",
+    )
+    denoise_iterations: bpy.props.IntProperty(
+        default=3,
+        min=1,
+        soft_max=8,
+        description="A-trous filter passes, each one reaching twice as far",
+    )
+    use_checkpoint: bpy.props.BoolProperty(
+        default=False,
+        description="Save the samples to a file while rendering, and resume or extend the render saved there",
+    )
+    checkpoint_path: bpy.props.StringProperty(
+        default="//simpleRT_checkpoint.npz",
+        subtype="FILE_PATH",
+        description="Checkpoint file, ignored when it holds another scene or other settings",
+    )
+    checkpoint_interval: bpy.props.FloatProperty(
+        default=60.0,
+        min=1.0,
+        soft_max=3600.0,
+        subtype="TIME_ABSOLUTE",
+        unit="TIME_ABSOLUTE",
+        description="Seconds between two checkpoints",
+    )
+    use_stats: bpy.props.BoolProperty(
+        default=False,
+        description="Count rays by type and time intersection, shading and display, shown live in the status bar",
+    )
+    use_distributed: bpy.props.BoolProperty(
+        default=False,
+        description="Hand the render out as tasks in a shared folder to render nodes (wavefront, no adaptive sampling)",
+    )
+    farm_directory: bpy.props.StringProperty(
+        default="//simpleRT_farm",
+        subtype="DIR_PATH",
+        description="Folder shared with the nodes running simpleRT_distributed.py worker",
+    )
+    farm_tasks: bpy.props.IntProperty(
+        default=8,
+        min=1,
+        soft_max=256,
+        description="Tasks the render is split into",
+    )
+    farm_split: bpy.props.EnumProperty(
+        items=(
+            ("SAMPLES", "Samples", "Every task renders the whole frame for a range of samples"),
+            ("TILES", "Tiles", "Every task renders all the samples of some tiles"),
+        ),
+        default="SAMPLES",
+    )
+    farm_timeout: bpy.props.FloatProperty(
+        default=600.0,
+        min=0.0,
+        soft_max=3600.0,
+        subtype="TIME_ABSOLUTE",
+        unit="TIME_ABSOLUTE",
+        description="Give up when no node made progress for this many seconds, 0 waits forever",
+    )
 
 
 # SimpleRT material panel
@@ -194,10 +371,98 @@ class SimpleRTRenderPanel(bpy.types.Panel):
 
         col_1.label(text="samples")
         col_1.label(text="depth")
+        col_1.label(text="roulette")
+        col_1.label(text="min depth")
         col_1.label(text="ambient")
+        col_1.label(text="MIS")
+        col_1.label(text="heuristic")
+        col_1.label(text="light tree")
+        col_1.label(text="light samples")
+        col_1.label(text="irradiance cache")
+        col_1.label(text="accuracy")
+        col_1.label(text="rays")
+        col_1.label(text="pre-pass")
+        col_1.label(text="caustics")
+        col_1.label(text="photons")
+        col_1.label(text="photon passes")
+        col_1.label(text="BVH")
+        col_1.label(text="integrator")
+        col_1.label(text="workers")
+        col_1.label(text="seed")
+        col_1.label(text="sampler")
+        col_1.label(text="tile size")
+        col_1.label(text="tile order")
+        col_1.label(text="adaptive")
+        col_1.label(text="threshold")
+        col_1.label(text="min samples")
+        col_1.label(text="denoise")
+        col_1.label(text="iterations")
+        col_1.label(text="checkpoint")
+        col_1.label(text="file")
+        col_1.label(text="interval")
+        col_1.label(text="ray stats")
+        col_1.label(text="distributed")
+        col_1.label(text="folder")
+        col_1.label(text="tasks")
+        col_1.label(text="split")
+        col_1.label(text="timeout")
         col_2.prop(sc, "samples", text="")
         col_2.prop(sc, "recursion_depth", text="")
+        col_2.prop(sc, "use_roulette", text="")
+        row = col_2.row()
+        row.prop(sc, "roulette_min_depth", text="")
+        row.active = sc.use_roulette
         col_2.prop(sc, "ambient_color", text="")
+        col_2.prop(sc, "use_mis", text="")
+        row = col_2.row()
+        row.prop(sc, "mis_heuristic", text="")
+        row.active = sc.use_mis
+        col_2.prop(sc, "use_light_tree", text="")
+        row = col_2.row()
+        row.prop(sc, "light_samples", text="")
+        row.active = sc.use_light_tree
+        col_2.prop(sc, "use_irradiance_cache", text="")
+        sub = col_2.column()
+        sub.prop(sc, "irradiance_accuracy", text="")
+        sub.prop(sc, "irradiance_rays", text="")
+        sub.prop(sc, "irradiance_prepass", text="")
+        sub.active = sc.use_irradiance_cache
+        col_2.prop(sc, "use_photons", text="")
+        sub = col_2.column()
+        sub.prop(sc, "photon_count", text="")
+        sub.prop(sc, "photon_passes", text="")
+        sub.active = sc.use_photons
+        col_2.prop(sc, "use_bvh", text="")
+        col_2.prop(sc, "integrator", text="")
+        row = col_2.row()
+        row.prop(sc, "workers", text="")
+        row.active = sc.integrator == "WAVEFRONT"
+        col_2.prop(sc, "seed", text="")
+        col_2.prop(sc, "sampler", text="")
+        col_2.prop(sc, "tile_size", text="")
+        col_2.prop(sc, "tile_order", text="")
+        col_2.prop(sc, "use_adaptive", text="")
+        sub = col_2.column()
+        sub.prop(sc, "adaptive_threshold", text="")
+        sub.prop(sc, "adaptive_min_samples", text="")
+        sub.active = sc.use_adaptive
+        col_2.prop(sc, "use_denoise", text="")
+        row = col_2.row()
+        row.prop(sc, "denoise_iterations", text="")
+        row.active = sc.use_denoise
+        col_2.prop(sc, "use_checkpoint", text="")
+        sub = col_2.column()
+        sub.prop(sc, "checkpoint_path", text="")
+        sub.prop(sc, "checkpoint_interval", text="")
+        sub.active = sc.use_checkpoint
+        col_2.prop(sc, "use_stats", text="")
+        col_2.prop(sc, "use_distributed", text="")
+        sub = col_2.column()
+        sub.prop(sc, "farm_directory", text="")
+        sub.prop(sc, "farm_tasks", text="")
+        sub.prop(sc, "farm_split", text="")
+        sub.prop(sc, "farm_timeout", text="")
+        sub.active = sc.use_distributed
 
 
 def register():
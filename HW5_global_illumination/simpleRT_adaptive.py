@@ -0,0 +1,213 @@
+#  simpleRT_adaptive.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Per-pixel sample accumulation and adaptive sampling. Every pixel keeps
+#  the running sum of its samples, their count and the sum of their
+#  squared luminance, which gives the variance of its mean. Pixels whose
+#  estimated relative error drops below a threshold stop being sampled,
+#  and the rest of the sample budget goes to the noisy ones. The buffer
+#  also sums the AOVs of the first camera hit (albedo, normal, distance),
+#  which guide the denoiser.
+
+import numpy as np
+
+
+# first-hit AOVs of one sample (AOV_CHANNELS,): diffuse albedo, shading
+# normal and distance from the camera, all 0 when the camera ray misses
+AOV_ALBEDO = slice(0, 3)
+AOV_NORMAL = slice(3, 6)
+AOV_DEPTH = 6
+AOV_CHANNELS = 7
+
+# channels of an accumulation buffer (height, width, ACCUM_CHANNELS)
+SUM = slice(0, 3)
+COUNT = 3
+LUMINANCE_SQ = 4
+AOV = slice(5, 5 + AOV_CHANNELS)
+ACCUM_CHANNELS = 5 + AOV_CHANNELS
+
+# Rec. 709 luma weights
+LUMINANCE = np.array((0.2126, 0.7152, 0.0722))
+# a noisy pixel never takes more than this many times the nominal samples
+MAX_SAMPLES_FACTOR = 4
+
+
+def add_samples(accum, pixels, colors, aovs=None):
+    """Accumulate one sample for each of the given pixels
+
+    Parameters
+    ----------
+    accum : numpy.ndarray, (h, w, ACCUM_CHANNELS)
+        Accumulation buffer, or a tile view of one
+    pixels : None or numpy.ndarray of int, (n,)
+        Flat (row-major) pixel indices; None means every pixel, in order
+    colors : numpy.ndarray, (n, 3)
+    aovs : None or numpy.ndarray, (n, AOV_CHANNELS)
+        First-hit AOVs of the samples
+    """
+    lum_sq = (colors @ LUMINANCE) ** 2
+    if pixels is None:
+        h, w = accum.shape[:2]
+        accum[:, :, SUM] += colors.reshape(h, w, 3)
+        accum[:, :, COUNT] += 1
+        accum[:, :, LUMINANCE_SQ] += lum_sq.reshape(h, w)
+        if aovs is not None:
+            accum[:, :, AOV] += aovs.reshape(h, w, AOV_CHANNELS)
+        return
+    rows, cols = np.divmod(pixels, accum.shape[1])
+    accum[rows, cols, SUM] += colors
+    accum[rows, cols, COUNT] += 1
+    accum[rows, cols, LUMINANCE_SQ] += lum_sq
+    if aovs is not None:
+        accum[rows, cols, AOV] += aovs
+
+
+def resolve(accum):
+    """RGBA image of an accumulation buffer: mean color, opaque where sampled"""
+    count = accum[:, :, COUNT:COUNT + 1]
+    rgba = np.empty(accum.shape[:2] + (4,))
+    rgba[:, :, 0:3] = accum[:, :, SUM] / np.maximum(count, 1)
+    rgba[:, :, 3:4] = count > 0
+    return rgba
+
+
+def resolve_aovs(accum):
+    """Mean first-hit AOVs of every pixel, (h, w, AOV_CHANNELS)"""
+    return accum[:, :, AOV] / np.maximum(accum[:, :, COUNT:COUNT + 1], 1)
+
+
+def mean_variance(accum):
+    """Mean luminance of every pixel and the estimated variance of that mean"""
+    n = accum[:, :, COUNT]
+    safe_n = np.maximum(n, 1)
+    mean = (accum[:, :, SUM] @ LUMINANCE) / safe_n
+    variance = np.maximum(accum[:, :, LUMINANCE_SQ] / safe_n - mean ** 2, 0)
+    # unbiased sample variance, then variance of the mean
+    variance *= safe_n / np.maximum(n - 1, 1)
+    return mean, variance / safe_n
+
+
+def relative_error(accum):
+    """Estimated relative standard error of the mean luminance of every pixel"""
+    mean, variance = mean_variance(accum)
+    # a small floor keeps near-black pixels from chasing noise forever
+    return np.sqrt(variance) / (mean + 1e-2)
+
+
+class AdaptiveSampler:
+    """Decides which pixels of a tile get the next samples
+
+    The tile gets the same budget of samples * pixels as uniform sampling,
+    less the samples the buffer already holds when a render is resumed.
+    Every pixel first takes min_samples; after that only the pixels whose
+    relative_error() is above the threshold keep being sampled, the noisiest
+    first, up to MAX_SAMPLES_FACTOR * samples each, until the budget is
+    spent or every pixel has converged.
+
+    Parameters
+    ----------
+    accum : numpy.ndarray, (h, w, ACCUM_CHANNELS)
+        Accumulation buffer of the tile
+    samples : int
+        Nominal samples per pixel, sets the budget
+    min_samples : int
+        Samples every pixel takes before its error is trusted
+    threshold : float
+        Relative error under which a pixel stops being sampled
+    """
+
+    def __init__(self, accum, samples, min_samples, threshold):
+        self.accum = accum
+        taken = int(accum[:, :, COUNT].sum())
+        self.budget = samples * accum.shape[0] * accum.shape[1] - taken
+        self.min_samples = max(min(min_samples, samples), 2)
+        self.max_samples = MAX_SAMPLES_FACTOR * samples
+        self.threshold = threshold
+
+    def next_pixels(self):
+        """Flat indices of the pixels to sample in the next round, empty when done"""
+        if self.budget <= 0:
+            return np.zeros(0, dtype=np.int64)
+        count = self.accum[:, :, COUNT].ravel()
+
+        below_min = count < self.min_samples
+        if below_min.any():
+            pixels = np.nonzero(below_min)[0]
+        else:
+            error = relative_error(self.accum).ravel()
+            pixels = np.nonzero((error > self.threshold) & (count < self.max_samples))[0]
+            # the noisiest pixels first when the budget runs out
+            pixels = pixels[np.argsort(-error[pixels], kind="stable")]
+
+        pixels = pixels[:self.budget]
+        self.budget -= len(pixels)
+        return pixels
+
+
+def sample_rounds(accum, samples, adaptive=None):
+    """Pixels to sample in each round of a tile
+
+    A generator of flat pixel index arrays. Samples of a round must be
+    added to accum (add_samples) before asking for the next round.
+
+    Parameters
+    ----------
+    accum : numpy.ndarray, (h, w, ACCUM_CHANNELS)
+        Accumulation buffer of the tile
+    samples : int
+    adaptive : None or (min_samples, threshold)
+        None gives `samples` rounds over every pixel (uniform sampling),
+        otherwise the rounds come from an AdaptiveSampler. Pixels that
+        already hold samples (a resumed render) only take the ones they miss
+    """
+    if adaptive is None:
+        for _ in range(samples):
+            pixels = np.nonzero(accum[:, :, COUNT].ravel() < samples)[0]
+            if len(pixels) == 0:
+                return
+            yield pixels
+        return
+
+    sampler = AdaptiveSampler(accum, samples, *adaptive)
+    pixels = sampler.next_pixels()
+    while len(pixels):
+        yield pixels
+        pixels = sampler.next_pixels()
+
+
+def pixel_samples(accum, pixels, tile, width, sampler, rng=None, first=0):
+    """Sample stream and subpixel offsets of the next sample of tile pixels
+
+    Every pixel draws the sample whose index is the number of samples it
+    already has, so adaptive rounds keep walking its sequence; plus first
+    when the buffer starts at that sample (one range of a distributed render).
+
+    Parameters
+    ----------
+    accum : numpy.ndarray, (h, w, ACCUM_CHANNELS)
+        Accumulation buffer of the tile
+    pixels : numpy.ndarray, (n,)
+        Flat indices of the pixels to sample in the tile
+    tile : (x, y, w, h)
+    width : int
+        Width of the frame, pixels are numbered in the frame
+    sampler : Sampler
+    rng : numpy.random.Generator or None
+        Source of the RANDOM sampler
+    first : int
+        Sample index of the first sample of the buffer
+
+    Returns
+    -------
+    samples : SampleStream
+        One path per pixel in `pixels`
+    offsets : numpy.ndarray, (h * w, 2)
+        Offsets of the given pixels, 0 for the others
+    """
+    x, y, w, _ = tile
+    count = accum[:, :, COUNT].ravel()[pixels].astype(np.int64) + first
+    samples = sampler.stream((y + pixels // w) * width + x + pixels % w, count, rng)
+    offsets = np.zeros((accum.shape[0] * accum.shape[1], 2))
+    offsets[pixels] = samples.pixel_offsets(len(pixels))
+    return samples, offsets
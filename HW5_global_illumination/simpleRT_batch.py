@@ -0,0 +1,209 @@
+#  simpleRT_batch.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Headless batch renders, for nightly renders and performance sweeps:
+#
+#      blender -b --python simpleRT_batch.py -- jobs.json [--output DIR]
+#
+#  Registers simpleRT (properties and engine) from the modules next to this
+#  file, renders every job of the job file, writes the images and a JSON
+#  report with the wall time, camera rays per second and the time of every
+#  stage of each render (see last_render in simpleRT_plugin.py). The report
+#  is rewritten after every job, so an interrupted batch keeps the jobs done.
+#  Blender exits with status 1 when a job failed.
+#
+#  The job file renders every scene with every variant, plus single jobs:
+#
+#      {
+#          "output": "renders",
+#          "format": "PNG",
+#          "scenes": ["cornell_box.blend"],
+#          "variants": [
+#              {"name": "preview", "samples": 4, "resolution": [240, 240]},
+#              {"name": "final", "samples": 64, "recursion_depth": 4,
+#               "integrator": "WAVEFRONT", "workers": 8}
+#          ],
+#          "jobs": [{"scene": "glass.blend", "name": "glass", "use_photons": true}]
+#      }
+#
+#  Paths are relative to the job file, an empty scene is the .blend file
+#  Blender was started with. A variant sets any property of the simpleRT
+#  render settings by name (samples, recursion_depth, integrator, ...), and
+#  resolution as [width, height] at 100%. With "use_stats": true the report
+#  also holds the rays by type, rays per second and the intersection,
+#  shading and display times of the render (see simpleRT_stats.py).
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import bpy
+
+# the engine modules import each other by name
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+import simpleRT_plugin
+import simpleRT_UIpanels
+
+
+REPORT_FILE = "report.json"
+# job entries that are not render settings
+JOB_KEYS = ("name", "scene", "resolution", "format")
+
+
+def expand_jobs(spec, base=""):
+    """Jobs of a job file, every scene with every variant then the single jobs
+
+    Parameters
+    ----------
+    spec : dict
+        Loaded job file
+    base : str
+        Folder the scene paths are relative to
+
+    Returns
+    -------
+    jobs : list of dict
+        name, scene (absolute path or ""), resolution or None, format and
+        settings (simpleRT properties by name) of every job
+    """
+    entries = []
+    for scene in spec.get("scenes", []):
+        for i, variant in enumerate(spec.get("variants", [{}])):
+            stem = os.path.splitext(os.path.basename(scene))[0] or "scene"
+            name = "%s_%s" % (stem, variant.get("name", i))
+            entries.append(dict(variant, scene=scene, name=name))
+    for i, job in enumerate(spec.get("jobs", [])):
+        entries.append(dict(job, name=job.get("name", "job%d" % i)))
+
+    jobs = []
+    for entry in entries:
+        scene = entry.get("scene") or ""
+        if scene:
+            scene = os.path.abspath(os.path.join(base, scene))
+        jobs.append(dict(
+            name=entry["name"],
+            scene=scene,
+            resolution=entry.get("resolution"),
+            format=entry.get("format", spec.get("format", "PNG")),
+            settings={k: v for k, v in entry.items() if k not in JOB_KEYS},
+        ))
+    names = [job["name"] for job in jobs]
+    if len(set(names)) != len(names):
+        raise ValueError("job names must be unique, their images would overwrite each other")
+    return jobs
+
+
+def load_scene(path):
+    """Open path unless it is the file already open, returns the scene to render"""
+    if path and os.path.abspath(bpy.data.filepath or "") != path:
+        bpy.ops.wm.open_mainfile(filepath=path)
+    return bpy.context.scene
+
+
+def apply_job(scene, job, image):
+    """Set the engine, resolution, output and simpleRT settings of a job"""
+    scene.render.engine = simpleRT_plugin.SimpleRTRenderEngine.bl_idname
+    if job["resolution"] is not None:
+        scene.render.resolution_x, scene.render.resolution_y = job["resolution"]
+        scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = job["format"]
+    scene.render.filepath = image
+    for name, value in job["settings"].items():
+        if not hasattr(scene.simpleRT, name):
+            raise ValueError("no simpleRT setting %r" % (name,))
+        setattr(scene.simpleRT, name, value)
+
+
+def render_job(job, output):
+    """Render a job into output, returns its report entry"""
+    entry = dict(
+        name=job["name"], scene=job["scene"], resolution=job["resolution"],
+        settings=job["settings"],
+    )
+    try:
+        start = time.perf_counter()
+        scene = load_scene(job["scene"])
+        entry["load_time"] = time.perf_counter() - start
+        image = os.path.join(output, job["name"])
+        apply_job(scene, job, image)
+
+        simpleRT_plugin.last_render.clear()
+        start = time.perf_counter()
+        bpy.ops.render.render(write_still=True, scene=scene.name)
+        entry["wall_time"] = time.perf_counter() - start
+    except Exception as error:
+        entry.update(status="failed", error="%s: %s" % (type(error).__name__, error))
+        return entry
+
+    if not simpleRT_plugin.last_render:
+        # the engine raised, Blender printed the error and went on
+        entry.update(status="failed", error="the engine did not finish, see the log")
+        return entry
+    entry.update(simpleRT_plugin.last_render)
+    entry["image"] = scene.render.frame_path(frame=scene.frame_current)
+    entry["status"] = "cancelled" if entry["cancelled"] else "ok"
+    return entry
+
+
+def write_report(path, report):
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(report, f, indent=2)
+    os.replace(temp, path)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="blender -b --python simpleRT_batch.py --",
+        description="Render simpleRT jobs headless and report their timings",
+    )
+    parser.add_argument("jobs", help="job file, see simpleRT_batch.py")
+    parser.add_argument("--output", help="image and report folder (default: the job file's)")
+    parser.add_argument("--dry-run", action="store_true", help="list the jobs and stop")
+    args = parser.parse_args(argv)
+
+    with open(args.jobs) as f:
+        spec = json.load(f)
+    base = os.path.dirname(os.path.abspath(args.jobs))
+    jobs = expand_jobs(spec, base)
+    output = os.path.abspath(args.output or os.path.join(base, spec.get("output", "renders")))
+    if args.dry_run:
+        for job in jobs:
+            print(job["name"], job["scene"] or "<current file>", job["settings"])
+        return 0
+
+    os.makedirs(output, exist_ok=True)
+    simpleRT_UIpanels.register()
+    simpleRT_plugin.register()
+    report = dict(
+        started=datetime.datetime.now().isoformat(timespec="seconds"),
+        host=platform.node(),
+        cpu_count=os.cpu_count(),
+        blender=bpy.app.version_string,
+        python=platform.python_version(),
+        jobs=[],
+    )
+    report_path = os.path.join(output, REPORT_FILE)
+    for i, job in enumerate(jobs, 1):
+        print("simpleRT batch: job %d/%d %s" % (i, len(jobs), job["name"]))
+        entry = render_job(job, output)
+        print("simpleRT batch: %s %s" % (job["name"], entry.get("error", entry["status"])))
+        report["jobs"].append(entry)
+        write_report(report_path, report)
+    failed = sum(entry["status"] == "failed" for entry in report["jobs"])
+    print("simpleRT batch: %d jobs, %d failed, report in %s" % (len(jobs), failed, report_path))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    # Blender's own arguments come before "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sys.exit(main(argv))
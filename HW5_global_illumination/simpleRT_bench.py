@@ -0,0 +1,387 @@
+#  simpleRT_bench.py
+#
+#  Support file for simpleRT render engine.
+#
+#  End-to-end render benchmarks on procedural scenes (simpleRT_headless.py):
+#  the Cornell box, and Cornell boxes with a finer sphere (triangles), more
+#  point lights (lights) or more glass spheres (glass). Every engine renders
+#  every scene at the base settings, then the Cornell box is swept over
+#  resolutions, sample counts and recursion depths, and over worker counts
+#  for the engines that use processes, which gives their scaling curve.
+#
+#      python simpleRT_bench.py [--save-baseline base.json]
+#      python simpleRT_bench.py --baseline base.json [--tolerance 0.15]
+#      blender -b hw3.blend --python simpleRT_bench.py -- --engines recursive,hw3
+#
+#  Plain Python only runs the wavefront engine. Inside Blender the HW5
+#  plugin's recursive and path integrators run too, and the HW3 steps on
+#  the scene of the open .blend file (they ray cast through Blender and
+#  read its simpleRT properties, so they cannot use the procedural scenes).
+#  A case is slower than its baseline when its time is more than
+#  1 + tolerance times the baseline time; any such case fails the run.
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+from math import ceil, sqrt
+
+import numpy as np
+
+# the engine modules import each other by name
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+from simpleRT_adaptive import ACCUM_CHANNELS
+from simpleRT_headless import cornell_box, Depsgraph, light_object, material, uv_sphere
+from simpleRT_parallel import render_tiles
+from simpleRT_sampler import Sampler
+from simpleRT_scene import snapshot_scene
+from simpleRT_stats import RayStats
+from simpleRT_tiles import TILE_SIZE, make_tiles
+from simpleRT_wavefront import WavefrontTracer
+
+try:
+    import bpy
+    import simpleRT_plugin
+except ImportError:
+    # outside Blender, only the NumPy engines
+    bpy = None
+
+
+ENGINES = ("wavefront", "recursive", "path", "hw3")
+# procedural scenes and the sizes they are benchmarked at
+SCENES = {
+    "cornell": (0,),
+    "triangles": (16, 48, 128),
+    "lights": (1, 8, 32),
+    "glass": (1, 4, 9),
+}
+# settings of every case a sweep does not change
+BASE = dict(resolution=32, samples=4, depth=2, workers=0, tile_size=TILE_SIZE)
+# the worker sweep needs several tiles per worker, or the others sit idle
+SCALING = dict(resolution=128, tile_size=16)
+HW3_FOLDER = os.path.join(os.path.dirname(HERE), "HW3_simple_RT")
+
+
+def bench_scene(kind, size=0):
+    """Procedural headless scene
+
+    Parameters
+    ----------
+    kind : str
+        "cornell": the Cornell box of simpleRT_headless.py with its glass
+        sphere; "triangles": with a diffuse sphere of size segments (about
+        size^2 triangles); "lights": lit by size point lights as well;
+        "glass": with size glass spheres
+    size : int
+
+    Returns
+    -------
+    scene : simpleRT_headless.Scene
+    """
+    if kind == "cornell":
+        return cornell_box()
+    scene = cornell_box(glass=False)
+    if kind == "triangles":
+        scene.objects.append(uv_sphere(
+            "Sphere", radius=0.3, segments=size, rings=max(size // 2, 2),
+            location=(0.4, -0.4, 0.9), simpleRT_material=material(),
+        ))
+    elif kind == "lights":
+        # a grid under the ceiling, as bright as the area light all together
+        n = ceil(sqrt(size))
+        for i in range(size):
+            x = -0.8 + 1.6 * (i % n + 0.5) / n
+            y = -0.8 + 1.6 * (i // n + 0.5) / n
+            scene.objects.append(light_object(
+                "Point.%03d" % i, energy=20.0 / size, location=(x, y, 1.9)
+            ))
+    elif kind == "glass":
+        n = ceil(sqrt(size))
+        radius = 0.3 / n
+        glass = material(
+            diffuse_color=(0, 0, 0), specular_color=(1, 1, 1), use_fresnel=True, ior=1.5,
+            transmission=1.0,
+        )
+        for i in range(size):
+            x = 0.1 + 0.7 * (i % n + 0.5) / n
+            y = -0.6 + 0.7 * (i // n + 0.5) / n
+            scene.objects.append(uv_sphere(
+                "Glass.%03d" % i, radius=radius, segments=16, rings=8,
+                location=(x, y, radius), simpleRT_material=glass,
+            ))
+    else:
+        raise ValueError("unknown scene %r" % (kind,))
+    return scene
+
+
+def make_cases(engines, scenes, resolutions, sample_counts, depths, workers):
+    """Cases of a benchmark run, each one a dict of engine, scene, size and settings
+
+    Every engine renders every scene at BASE, then the Cornell box along
+    every sweep; the worker sweep renders at SCALING. The HW3 steps have no
+    samples nor procedural scenes.
+    """
+    cases = []
+
+    def add(engine, scene, size, **settings):
+        case = dict(BASE, engine=engine, scene=scene, size=size, **settings)
+        if engine == "hw3":
+            case.update(scene="blend", size=0, samples=1)
+        if engine != "wavefront":
+            case["workers"] = 0
+        case["id"] = "{engine}/{scene}{size}/{resolution}px/{samples}spp/d{depth}/w{workers}"\
+            "/t{tile_size}"\
+            .format(**dict(case, size=":%d" % case["size"] if case["size"] else ""))
+        if case["id"] not in seen:
+            seen.add(case["id"])
+            cases.append(case)
+
+    seen = set()
+    for engine in engines:
+        for scene in scenes:
+            for size in SCENES[scene]:
+                add(engine, scene, size)
+        for resolution in resolutions:
+            add(engine, "cornell", 0, resolution=resolution)
+        for samples in sample_counts:
+            add(engine, "cornell", 0, samples=samples)
+        for depth in depths:
+            add(engine, "cornell", 0, depth=depth)
+        if engine == "wavefront":
+            for count in workers:
+                add(engine, "cornell", 0, workers=count, **SCALING)
+    return cases
+
+
+def run_case(case, snapshot=None, repeat=1, count_rays=False):
+    """Best time of repeat renders of a case, and the rates derived from it
+
+    With count_rays, the counters of simpleRT_stats.py are on and the ray
+    counts and rays per second of the best render are added.
+    """
+    w = h = case["resolution"]
+    depth, samples = case["depth"], case["samples"]
+    best = float("inf")
+    extra = {}
+    for _ in range(repeat):
+        if count_rays and snapshot is not None:
+            snapshot.stats = RayStats()
+        start = time.perf_counter()
+        if case["engine"] == "wavefront":
+            tracer = WavefrontTracer(snapshot)
+            for _ in render_tiles(
+                tracer, w, h, depth, samples, Sampler(), case["workers"],
+                tiles=make_tiles(w, h, case["tile_size"]),
+            ):
+                pass
+        elif case["engine"] in ("recursive", "path"):
+            trace_ray = {
+                "recursive": simpleRT_plugin.RT_trace_ray,
+                "path": simpleRT_plugin.RT_trace_path,
+            }[case["engine"]]
+            accum = np.zeros((h, w, ACCUM_CHANNELS))
+            for _ in simpleRT_plugin.RT_render_scene(
+                snapshot, w, h, depth, samples, accum, make_tiles(w, h, case["tile_size"]),
+                trace_ray=trace_ray,
+            ):
+                pass
+        else:
+            extra["steps"] = run_hw3(w, h, depth)
+        seconds = time.perf_counter() - start
+        if seconds < best and snapshot is not None and snapshot.stats is not None:
+            extra["ray_stats"] = snapshot.stats.summary(seconds)
+        best = min(best, seconds)
+    if snapshot is not None:
+        snapshot.stats = None
+    camera_rays = w * h * samples
+    return dict(
+        seconds=best,
+        seconds_per_pass=best / samples,
+        camera_rays=camera_rays,
+        camera_rays_per_second=camera_rays / best,
+        **extra,
+    )
+
+
+def run_hw3(width, height, depth):
+    """Time every HW3 step on the scene of the open .blend file, by step"""
+    scene = bpy.context.scene
+    steps = {}
+    for path in sorted(glob.glob(os.path.join(HW3_FOLDER, "step*.py"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location("simpleRT_hw3_" + name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        buf = np.zeros((height, width, 4))
+        start = time.perf_counter()
+        for _ in module.RT_render_scene(scene, width, height, depth, buf):
+            pass
+        steps[name] = time.perf_counter() - start
+    return steps
+
+
+def compare(results, baseline, tolerance):
+    """Cases of results slower than baseline by more than tolerance
+
+    Returns a list of (id, seconds, baseline seconds), slowest first.
+    """
+    slower = []
+    for case_id, result in results.items():
+        base = baseline.get(case_id)
+        if base is not None and result["seconds"] > base["seconds"] * (1 + tolerance):
+            slower.append((case_id, result["seconds"], base["seconds"]))
+    return sorted(slower, key=lambda s: s[2] / s[1])
+
+
+def scaling_curves(cases, results):
+    """Speedup and efficiency over worker counts, by engine and scene
+
+    The time with 0 workers (the calling process) is the reference.
+    """
+    curves = {}
+    for case in cases:
+        key = "%s/%s" % (case["engine"], case["id"].split("/")[1])
+        others = dict(case, workers=None, id=None)
+        curves.setdefault(key, {}).setdefault(json.dumps(others, sort_keys=True), {})[
+            case["workers"]
+        ] = results[case["id"]]["seconds"]
+    scaling = {}
+    for key, groups in curves.items():
+        for times in groups.values():
+            if len(times) < 2 or 0 not in times:
+                continue
+            scaling[key] = [
+                dict(
+                    workers=n,
+                    seconds=times[n],
+                    speedup=times[0] / times[n],
+                    efficiency=times[0] / times[n] / max(n, 1),
+                )
+                for n in sorted(times)
+            ]
+    return scaling
+
+
+def main(argv=None):
+    def numbers(text):
+        return [int(v) for v in text.split(",") if v]
+
+    def names(text):
+        return [v for v in text.split(",") if v]
+
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="simpleRT render benchmarks")
+    parser.add_argument(
+        "--engines", type=names, default=None,
+        help="comma-separated, of %s (default: all that can run here)" % ", ".join(ENGINES),
+    )
+    parser.add_argument("--scenes", type=names, default=list(SCENES))
+    parser.add_argument("--resolutions", type=numbers, default=[16, 32, 64])
+    parser.add_argument("--sample-counts", type=numbers, default=[1, 4, 16])
+    parser.add_argument("--depths", type=numbers, default=[1, 2, 4])
+    parser.add_argument(
+        "--workers", type=numbers,
+        default=sorted({0, 1, 2, 4, cores} & set(range(cores + 1))),
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many renders")
+    parser.add_argument(
+        "--count-rays", action="store_true",
+        help="count the rays by type and report rays per second (HW5 engines)",
+    )
+    parser.add_argument("--output", help="write all the results to this JSON file")
+    parser.add_argument("--baseline", help="compare to the results saved in this file")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--save-baseline", help="save the results as a baseline")
+    args = parser.parse_args(argv)
+
+    available = ENGINES if bpy is not None else ("wavefront",)
+    engines = args.engines or list(available)
+    for engine in engines:
+        if engine not in available:
+            parser.error("engine %r needs %s" % (
+                engine, "Blender" if engine in ENGINES else "to exist"
+            ))
+    for scene in args.scenes:
+        if scene not in SCENES:
+            parser.error("unknown scene %r" % (scene,))
+
+    cases = make_cases(
+        engines, args.scenes, args.resolutions, args.sample_counts, args.depths, args.workers
+    )
+    # one snapshot and BVH per scene, timed on their own
+    snapshots = {}
+    builds = {}
+    results = {}
+    for i, case in enumerate(cases, 1):
+        key = (case["scene"], case["size"])
+        if case["engine"] != "hw3" and key not in snapshots:
+            start = time.perf_counter()
+            snapshot = snapshot_scene(Depsgraph(bench_scene(*key)))
+            middle = time.perf_counter()
+            snapshot.build_bvh()
+            builds["%s:%d" % key] = dict(
+                triangles=len(snapshot.triangles),
+                lights=len(snapshot.light_table.intensity),
+                snapshot_seconds=middle - start,
+                bvh_seconds=time.perf_counter() - middle,
+            )
+            snapshots[key] = snapshot
+        results[case["id"]] = result = run_case(
+            case, snapshots.get(key), args.repeat, args.count_rays
+        )
+        line = "[%d/%d] %-44s %9.3f s %12.0f camera rays/s" % (
+            i, len(cases), case["id"], result["seconds"], result["camera_rays_per_second"]
+        )
+        if "ray_stats" in result:
+            line += " %12.0f rays/s" % result["ray_stats"]["rays_per_second"]
+        print(line)
+
+    scaling = scaling_curves(cases, results)
+    for key, curve in scaling.items():
+        print("scaling %s: %s" % (key, ", ".join(
+            "%d workers %.2fx" % (point["workers"], point["speedup"]) for point in curve
+        )))
+
+    report = dict(
+        host=platform.node(),
+        cpu_count=cores,
+        python=platform.python_version(),
+        numpy=np.__version__,
+        blender=bpy.app.version_string if bpy is not None else None,
+        builds=builds,
+        cases=results,
+        scaling=scaling,
+    )
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("host") != report["host"]:
+            print("warning: the baseline was measured on %s" % baseline.get("host"))
+        slower = compare(results, baseline["cases"], args.tolerance)
+        for case_id, seconds, base in slower:
+            print("REGRESSION %s: %.3f s, baseline %.3f s (%+.0f%%)" % (
+                case_id, seconds, base, 100 * (seconds / base - 1)
+            ))
+        print("%d of %d cases slower than the baseline by more than %.0f%%" % (
+            len(slower), len(results), 100 * args.tolerance
+        ))
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    # inside Blender, the benchmark's arguments come after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
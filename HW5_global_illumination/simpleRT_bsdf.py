@@ -0,0 +1,186 @@
+#  simpleRT_bsdf.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Direction sampling for the diffuse bounce. A sampler maps two uniform
+#  numbers to a direction in the local frame of the surface (z along the
+#  normal) and returns its pdf; sample_diffuse() rotates it to world space
+#  with a branchless orthonormal basis and returns the weight the bounce
+#  is multiplied by. Everything works on single vectors and on batches.
+#
+#  HW5 weights a diffuse bounce by cos(theta) over a pdf of 1 / (2 pi), so
+#  its diffuse BRDF is diffuse_color / (2 pi); the weights below keep that
+#  normalization whatever the sampler.
+#
+#  The Blinn-Phong shading of the direct light can also be importance
+#  sampled (half vectors around the normal), with the densities of both
+#  samplers available for multiple importance sampling in simpleRT_mis.py.
+
+from math import pi
+
+import numpy as np
+
+
+# diffuse BRDF of the HW5 estimator, per unit of diffuse_color
+DIFFUSE_BRDF = 1 / (2 * pi)
+
+
+def onb(normal):
+    """Tangent and bitangent completing unit normals into orthonormal bases
+
+    Branchless construction of Duff et al., "Building an Orthonormal
+    Basis, Revisited" (JCGT 2017): no axis test, no matrix allocation.
+
+    Parameters
+    ----------
+    normal : numpy.ndarray, (..., 3)
+        Unit vectors
+
+    Returns
+    -------
+    tangent, bitangent : numpy.ndarray, (..., 3)
+    """
+    n = np.asarray(normal, dtype=np.float64)
+    x, y, z = n[..., 0], n[..., 1], n[..., 2]
+    sign = np.copysign(1.0, z)
+    a = -1.0 / (sign + z)
+    b = x * y * a
+    tangent = np.stack((1.0 + sign * x * x * a, sign * b, -sign * x), axis=-1)
+    bitangent = np.stack((b, sign + y * y * a, -y), axis=-1)
+    return tangent, bitangent
+
+
+def to_world(local, normal):
+    """rotate local directions (z along the normal) to world space"""
+    normal = np.asarray(normal, dtype=np.float64)
+    tangent, bitangent = onb(normal)
+    return (
+        local[..., 0:1] * tangent
+        + local[..., 1:2] * bitangent
+        + local[..., 2:3] * normal
+    )
+
+
+def sample_cosine(u1, u2):
+    """Cosine-weighted hemisphere sampling (Malley's method)
+
+    Uniform points on the unit disk, projected up onto the hemisphere.
+
+    Parameters
+    ----------
+    u1, u2 : float or numpy.ndarray, (n,)
+        Uniform in [0, 1)
+
+    Returns
+    -------
+    local : numpy.ndarray, (3,) or (n, 3)
+        Directions in the local frame
+    pdf : float or numpy.ndarray, (n,)
+        Solid angle density, cos(theta) / pi
+    """
+    r = np.sqrt(u1)
+    phi = 2 * pi * np.asarray(u2)
+    cos_theta = np.sqrt(np.maximum(1 - np.asarray(u1), 0))
+    local = np.stack((r * np.cos(phi), r * np.sin(phi), cos_theta), axis=-1)
+    return local, cos_theta / pi
+
+
+def sample_uniform(u1, u2):
+    """Uniform hemisphere sampling, cos(theta) = u1, same interface as sample_cosine()"""
+    cos_theta = np.asarray(u1, dtype=np.float64)
+    sin_theta = np.sqrt(np.maximum(1 - cos_theta * cos_theta, 0))
+    phi = 2 * pi * np.asarray(u2)
+    local = np.stack((sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta), axis=-1)
+    return local, np.full(np.shape(cos_theta), 1 / (2 * pi))
+
+
+def sample_diffuse(normal, u1, u2, sampler=sample_cosine):
+    """Diffuse bounce directions around unit normals
+
+    Parameters
+    ----------
+    normal : numpy.ndarray, (3,) or (n, 3)
+    u1, u2 : float or numpy.ndarray, (n,)
+        Uniform in [0, 1)
+    sampler : callable
+        sample_cosine() or sample_uniform(), or any function of (u1, u2)
+        returning local directions and their pdf
+
+    Returns
+    -------
+    direction : numpy.ndarray, (3,) or (n, 3)
+        World-space unit directions
+    weight : float or numpy.ndarray, (n,)
+        BRDF * cos(theta) / pdf per unit of diffuse_color; a constant 1/2
+        for cosine sampling
+    """
+    local, pdf = sampler(u1, u2)
+    direction = to_world(local, normal)
+    weight = DIFFUSE_BRDF * local[..., 2] / pdf
+    return direction, weight
+
+
+def cosine_pdf(normal, direction):
+    """solid angle density of sample_cosine() directions"""
+    return np.maximum(np.einsum("...i,...i->...", normal, direction), 0) / pi
+
+
+def sample_blinn_phong(normal, view, hardness, u1, u2):
+    """Directions importance sampled from the Blinn-Phong specular lobe
+
+    Half vectors are drawn with a density proportional to
+    cos(theta_h) ** hardness around the normal and the view direction is
+    mirrored about them. Directions below the surface can come out; their
+    shading is 0.
+
+    Parameters
+    ----------
+    normal : numpy.ndarray, (n, 3)
+    view : numpy.ndarray, (n, 3)
+        Unit directions from the hit towards the ray origin
+    hardness : numpy.ndarray, (n,)
+        Blinn-Phong exponent
+    u1, u2 : numpy.ndarray, (n,)
+        Uniform in [0, 1)
+
+    Returns
+    -------
+    direction : numpy.ndarray, (n, 3)
+    """
+    cos_h = np.asarray(u1) ** (1 / (hardness + 1))
+    sin_h = np.sqrt(np.maximum(1 - cos_h * cos_h, 0))
+    phi = 2 * pi * np.asarray(u2)
+    half = to_world(
+        np.stack((sin_h * np.cos(phi), sin_h * np.sin(phi), cos_h), axis=-1), normal
+    )
+    v_dot_h = np.einsum("ij,ij->i", view, half)
+    return 2 * v_dot_h[:, None] * half - view
+
+
+def blinn_phong_pdf(normal, view, hardness, direction):
+    """solid angle density of sample_blinn_phong() directions"""
+    half = view + direction
+    half /= np.linalg.norm(half, axis=-1, keepdims=True)
+    cos_h = np.maximum(np.einsum("ij,ij->i", normal, half), 0)
+    l_dot_h = np.abs(np.einsum("ij,ij->i", direction, half))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pdf = (hardness + 1) / (2 * pi) * cos_h ** hardness / (4 * l_dot_h)
+    return np.where(l_dot_h > 0, pdf, 0.0)
+
+
+def blinn_phong(normal, view, direction, diffuse, specular, hardness):
+    """Blinn-Phong shading towards unit directions, 0 below the surface
+
+    The factor the incoming light is multiplied by in RT_trace_ray:
+    diffuse * cos(theta) + specular * cos(theta_h) ** hardness.
+
+    Returns
+    -------
+    f : numpy.ndarray, (n, 3)
+    """
+    n_dot_l = np.einsum("ij,ij->i", normal, direction)
+    half = view + direction
+    half /= np.linalg.norm(half, axis=-1, keepdims=True)
+    spec = np.maximum(np.einsum("ij,ij->i", normal, half), 0) ** hardness
+    f = diffuse * n_dot_l[:, None] + specular * spec[:, None]
+    return np.where((n_dot_l > 0)[:, None], f, 0.0)
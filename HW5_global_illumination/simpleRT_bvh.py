@@ -0,0 +1,457 @@
+#  simpleRT_bvh.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Bounding volume hierarchy over the triangles of a SceneSnapshot, built
+#  with the binned surface area heuristic (SAH) and stored as flat NumPy
+#  node arrays. Supports closest-hit queries for a single ray (the
+#  equivalent of Scene.ray_cast()) and for whole batches of rays.
+
+import numpy as np
+
+
+# cost of visiting a node relative to intersecting one triangle
+TRAVERSAL_COST = 1.0
+INTERSECTION_COST = 1.0
+# rays hitting closer than this are ignored, like Blender's ray_cast
+T_MIN = 1e-7
+
+
+class BVH:
+    """Binned-SAH bounding volume hierarchy
+
+    Parameters
+    ----------
+    triangles : numpy.ndarray, (T, 3, 3)
+        World-space triangle vertices, e.g. SceneSnapshot.triangles
+    bins : int
+        Number of SAH bins per axis
+    max_leaf_size : int
+        Leaves never hold more triangles than this
+
+    Attributes
+    ----------
+    node_min, node_max : numpy.ndarray, (N, 3)
+        Bounds of every node, node 0 is the root
+    node_offset : numpy.ndarray, (N,)
+        Inner node: index of its first child (the second child is offset + 1)
+        Leaf: index of its first triangle in `tri_order`
+    node_count : numpy.ndarray, (N,)
+        Number of triangles of a leaf, 0 for inner nodes
+    node_axis : numpy.ndarray, (N,)
+        Split axis of inner nodes, the first child holds the lower half
+    tri_order : numpy.ndarray, (T,)
+        Snapshot triangle index of every BVH triangle slot
+    """
+
+    def __init__(self, triangles, bins=12, max_leaf_size=4):
+        triangles = np.asarray(triangles, dtype=np.float64)
+        self.bins = bins
+        self.max_leaf_size = max_leaf_size
+        self._build(triangles)
+
+        # triangles in leaf order, in the form used by Moller-Trumbore
+        tris = triangles[self.tri_order]
+        self.v0 = np.ascontiguousarray(tris[:, 0])
+        self.e1 = np.ascontiguousarray(tris[:, 1] - tris[:, 0])
+        self.e2 = np.ascontiguousarray(tris[:, 2] - tris[:, 0])
+
+        # plain Python copies of the node arrays for single ray traversal,
+        # where per-node NumPy calls would cost more than the test itself
+        self._min = self.node_min.tolist()
+        self._max = self.node_max.tolist()
+        self._offset = self.node_offset.tolist()
+        self._count = self.node_count.tolist()
+
+    def __len__(self):
+        return len(self.node_count)
+
+    def _build(self, triangles):
+        n_tris = len(triangles)
+        tri_min = triangles.min(axis=1)
+        tri_max = triangles.max(axis=1)
+        centroids = triangles.mean(axis=1)
+
+        node_min, node_max, node_offset, node_count, node_axis = [], [], [], [], []
+        tri_order = []
+        max_depth = 0
+
+        def new_node():
+            node_min.append(np.zeros(3))
+            node_max.append(np.zeros(3))
+            node_offset.append(0)
+            node_count.append(0)
+            node_axis.append(0)
+            return len(node_count) - 1
+
+        root = new_node()
+        stack = [(root, np.arange(n_tris), 0)] if n_tris else []
+        while stack:
+            node, index, depth = stack.pop()
+            max_depth = max(max_depth, depth)
+            lo = tri_min[index].min(axis=0)
+            hi = tri_max[index].max(axis=0)
+            node_min[node], node_max[node] = lo, hi
+
+            split = self._find_split(tri_min, tri_max, centroids, index, lo, hi)
+            if split is None:
+                node_offset[node] = len(tri_order)
+                node_count[node] = len(index)
+                tri_order.extend(index.tolist())
+                continue
+
+            axis, left_index, right_index = split
+            left = new_node()
+            new_node()
+            node_offset[node] = left
+            node_axis[node] = axis
+            stack.append((left + 1, right_index, depth + 1))
+            stack.append((left, left_index, depth + 1))
+
+        self.node_min = np.array(node_min, dtype=np.float64).reshape(-1, 3)
+        self.node_max = np.array(node_max, dtype=np.float64).reshape(-1, 3)
+        self.node_offset = np.array(node_offset, dtype=np.int64)
+        self.node_count = np.array(node_count, dtype=np.int64)
+        self.node_axis = np.array(node_axis, dtype=np.int64)
+        self.tri_order = np.array(tri_order, dtype=np.int64)
+        self.depth = max_depth
+
+    def _find_split(self, tri_min, tri_max, centroids, index, lo, hi):
+        """Pick the cheapest binned SAH split of a node, all 3 axes at once
+
+        Returns (axis, left_index, right_index), or None when the node
+        should become a leaf
+        """
+        count = len(index)
+        if count <= 1:
+            return None
+        bins = self.bins
+
+        c = centroids[index]
+        c_lo = c.min(axis=0)
+        extent = c.max(axis=0) - c_lo
+        if not (extent > 0).any():
+            # all centroids coincide, nothing to split on
+            if count <= self.max_leaf_size:
+                return None
+            half = count // 2
+            return 0, index[:half], index[half:]
+
+        scale = np.where(extent > 0, bins / np.where(extent > 0, extent, 1), 0)
+        bin_id = np.minimum(((c - c_lo) * scale).astype(np.int64), bins - 1)
+
+        # (axis, bin) counts and bounds in one flat scatter per quantity
+        flat = (bin_id + np.arange(3) * bins).ravel()
+        bin_count = np.bincount(flat, minlength=3 * bins).reshape(3, bins)
+        bin_lo = np.full((3 * bins, 3), np.inf)
+        bin_hi = np.full((3 * bins, 3), -np.inf)
+        np.minimum.at(bin_lo, flat, np.repeat(tri_min[index], 3, axis=0))
+        np.maximum.at(bin_hi, flat, np.repeat(tri_max[index], 3, axis=0))
+        bin_lo = bin_lo.reshape(3, bins, 3)
+        bin_hi = bin_hi.reshape(3, bins, 3)
+
+        # sweep from both sides: area and count left / right of every plane
+        left_area = _area(
+            np.minimum.accumulate(bin_lo, axis=1),
+            np.maximum.accumulate(bin_hi, axis=1),
+        )[:, :-1]
+        right_area = _area(
+            np.minimum.accumulate(bin_lo[:, ::-1], axis=1)[:, ::-1],
+            np.maximum.accumulate(bin_hi[:, ::-1], axis=1)[:, ::-1],
+        )[:, 1:]
+        left_count = np.cumsum(bin_count, axis=1)[:, :-1]
+        right_count = count - left_count
+
+        cost = left_area * left_count + right_area * right_count
+        cost[(left_count == 0) | (right_count == 0)] = np.inf
+        cost[extent <= 0] = np.inf
+        axis, b = np.unravel_index(np.argmin(cost), cost.shape)
+
+        node_area = max(_area(lo, hi), 1e-30)
+        split_cost = TRAVERSAL_COST + INTERSECTION_COST * cost[axis, b] / node_area
+        if split_cost >= INTERSECTION_COST * count and count <= self.max_leaf_size:
+            return None
+
+        go_left = bin_id[:, axis] <= b
+        return int(axis), index[go_left], index[~go_left]
+
+    def closest_hit(self, origin, direction, t_max=np.inf):
+        """Closest intersection of a single ray
+
+        Parameters
+        ----------
+        origin : float array of 3 items
+        direction : float array of 3 items
+        t_max : float
+            Hits farther than t_max along the ray are ignored
+
+        Returns
+        -------
+        tri : int
+            Snapshot triangle index of the closest hit, -1 for a miss
+        t : float
+            Ray parameter of the hit, in units of the direction length
+        """
+        ox, oy, oz = (float(v) for v in origin)
+        dx, dy, dz = (float(v) for v in direction)
+        inv = [1.0 / v if v != 0.0 else np.inf for v in (dx, dy, dz)]
+        orig = (ox, oy, oz)
+        o = np.array(orig)
+        d = np.array((dx, dy, dz))
+
+        best_t, best_slot = t_max, -1
+        stack = [0] if len(self.tri_order) else []
+        while stack:
+            node = stack.pop()
+            count = self._count[node]
+            if count:
+                start = self._offset[node]
+                t = _intersect_leaf(
+                    o, d,
+                    self.v0[start:start + count],
+                    self.e1[start:start + count],
+                    self.e2[start:start + count],
+                )
+                k = int(np.argmin(t))
+                if t[k] < best_t:
+                    best_t, best_slot = float(t[k]), start + k
+                continue
+
+            left = self._offset[node]
+            t_left = self._slab(left, orig, inv, best_t)
+            t_right = self._slab(left + 1, orig, inv, best_t)
+            # visit the nearer child first, push it last
+            if t_left <= t_right:
+                if t_right < best_t:
+                    stack.append(left + 1)
+                if t_left < best_t:
+                    stack.append(left)
+            else:
+                if t_left < best_t:
+                    stack.append(left)
+                if t_right < best_t:
+                    stack.append(left + 1)
+
+        if best_slot < 0:
+            return -1, np.inf
+        return int(self.tri_order[best_slot]), best_t
+
+    def occluded(self, origin, direction, t_max=np.inf):
+        """Whether a single ray hits anything before t_max
+
+        Any-hit query for shadow rays: the traversal stops at the first
+        triangle found in (T_MIN, t_max), in no particular order.
+
+        Parameters
+        ----------
+        origin : float array of 3 items
+        direction : float array of 3 items
+        t_max : float
+
+        Returns
+        -------
+        occluded : bool
+        """
+        ox, oy, oz = (float(v) for v in origin)
+        dx, dy, dz = (float(v) for v in direction)
+        inv = [1.0 / v if v != 0.0 else np.inf for v in (dx, dy, dz)]
+        orig = (ox, oy, oz)
+        o = np.array(orig)
+        d = np.array((dx, dy, dz))
+
+        stack = [0] if len(self.tri_order) else []
+        while stack:
+            node = stack.pop()
+            if self._slab(node, orig, inv, t_max) == np.inf:
+                continue
+            count = self._count[node]
+            if count:
+                start = self._offset[node]
+                t = _intersect_leaf(
+                    o, d,
+                    self.v0[start:start + count],
+                    self.e1[start:start + count],
+                    self.e2[start:start + count],
+                )
+                if (t < t_max).any():
+                    return True
+                continue
+            left = self._offset[node]
+            stack.append(left + 1)
+            stack.append(left)
+        return False
+
+    def _slab(self, node, orig, inv, t_max):
+        """entry distance of a ray into a node box, inf when missed"""
+        lo, hi = self._min[node], self._max[node]
+        t0, t1 = 0.0, t_max
+        for a in range(3):
+            ta = (lo[a] - orig[a]) * inv[a]
+            tb = (hi[a] - orig[a]) * inv[a]
+            if ta > tb:
+                ta, tb = tb, ta
+            # nan (origin on the slab of a flat axis) fails both tests
+            if ta > t0:
+                t0 = ta
+            if tb < t1:
+                t1 = tb
+            if t0 > t1:
+                return np.inf
+        return t0
+
+    def intersect(self, origins, directions, t_max=np.inf):
+        """Closest intersections of a batch of rays
+
+        Every ray keeps its own traversal stack; each iteration pops one
+        node for all the rays still traversing and tests them in one NumPy
+        call, so the number of iterations is the number of nodes visited
+        by a single ray, not by the whole batch.
+
+        Parameters
+        ----------
+        origins : numpy.ndarray, (R, 3)
+        directions : numpy.ndarray, (R, 3)
+        t_max : float or numpy.ndarray, (R,)
+            Hits farther than t_max along each ray are ignored
+
+        Returns
+        -------
+        tri : numpy.ndarray, (R,)
+            Snapshot triangle index of the closest hit, -1 for a miss
+        t : numpy.ndarray, (R,)
+            Ray parameter of each hit, inf for a miss
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        best_t, best_slot = self._traverse(origins, directions, t_max, any_hit=False)
+
+        hit = best_slot >= 0
+        tri = np.full(len(origins), -1, dtype=np.int64)
+        tri[hit] = self.tri_order[best_slot[hit]]
+        best_t[~hit] = np.inf
+        return tri, best_t
+
+    def intersect_any(self, origins, directions, t_max=np.inf):
+        """Any-hit version of intersect() for batches of shadow rays
+
+        A ray leaves the traversal at the first triangle it hits in
+        (T_MIN, t_max), so occluded rays stop early and the closest hit
+        is never searched for.
+
+        Returns
+        -------
+        occluded : numpy.ndarray of bool, (R,)
+        """
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        _, best_slot = self._traverse(origins, directions, t_max, any_hit=True)
+        return best_slot >= 0
+
+    def _traverse(self, origins, directions, t_max, any_hit):
+        """batched traversal shared by intersect() and intersect_any()"""
+        n_rays = len(origins)
+        best_t = np.empty(n_rays)
+        best_t[:] = t_max
+        best_slot = np.full(n_rays, -1, dtype=np.int64)
+        if n_rays == 0 or len(self.tri_order) == 0:
+            return best_t, best_slot
+
+        with np.errstate(divide="ignore"):
+            inv = 1.0 / directions
+
+        stack = np.zeros((n_rays, self.depth + 2), dtype=np.int64)
+        sp = np.ones(n_rays, dtype=np.int64)
+        rays = np.arange(n_rays)
+        while len(rays):
+            sp[rays] -= 1
+            node = stack[rays, sp[rays]]
+            t_near = _slab_pairs(
+                self.node_min[node], self.node_max[node],
+                origins[rays], inv[rays], best_t[rays],
+            )
+            entered = t_near < best_t[rays]
+            rays, node = rays[entered], node[entered]
+
+            count = self.node_count[node]
+            leaf = count > 0
+            if leaf.any():
+                self._intersect_leaves(
+                    rays[leaf], node[leaf], origins, directions, best_t, best_slot
+                )
+
+            if any_hit:
+                # a ray with a hit is done, empty its stack
+                sp[rays[leaf & (best_slot[rays] >= 0)]] = 0
+
+            # push the far child first so the near one is popped next
+            inner = ~leaf
+            rays, node = rays[inner], node[inner]
+            left = self.node_offset[node]
+            axis = self.node_axis[node]
+            near_left = directions[rays, axis] >= 0
+            stack[rays, sp[rays]] = np.where(near_left, left + 1, left)
+            stack[rays, sp[rays] + 1] = np.where(near_left, left, left + 1)
+            sp[rays] += 2
+
+            rays = np.nonzero(sp > 0)[0]
+        return best_t, best_slot
+
+    def _intersect_leaves(self, rays, node, origins, directions, best_t, best_slot):
+        """test (ray, leaf) pairs against the leaf triangles, update the best hits"""
+        start = self.node_offset[node]
+        count = self.node_count[node]
+        o, d = origins[rays], directions[rays]
+        for k in range(int(count.max())):
+            valid = k < count
+            slot = np.where(valid, start + k, 0)
+            t = _intersect_pairs(o, d, self.v0[slot], self.e1[slot], self.e2[slot])
+            closer = valid & (t < best_t[rays])
+            best_t[rays[closer]] = t[closer]
+            best_slot[rays[closer]] = slot[closer]
+
+
+def _area(lo, hi):
+    """surface area of boxes, 0 for empty (inf, -inf) boxes"""
+    e = np.maximum(hi - lo, 0)
+    return 2 * (e[..., 0] * e[..., 1] + e[..., 1] * e[..., 2] + e[..., 2] * e[..., 0])
+
+
+def _slab_pairs(lo, hi, origins, inv, t_max):
+    """entry distance of every ray into its own box, inf when missed"""
+    with np.errstate(invalid="ignore"):
+        ta = (lo - origins) * inv
+        tb = (hi - origins) * inv
+    # fmin / fmax skip the nan of a ray lying exactly in a flat slab
+    t0 = np.fmax(np.fmin(ta, tb).max(axis=1), 0.0)
+    t1 = np.fmin(np.fmax(ta, tb).min(axis=1), t_max)
+    return np.where(t0 <= t1, t0, np.inf)
+
+
+def _intersect_leaf(o, d, v0, e1, e2):
+    """Moller-Trumbore test of one ray against K triangles, inf for misses"""
+    p = np.cross(d, e2)
+    det = np.einsum("ij,ij->i", e1, p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_det = 1.0 / det
+        s = o - v0
+        u = np.einsum("ij,ij->i", s, p) * inv_det
+        q = np.cross(s, e1)
+        v = (q @ d) * inv_det
+        t = np.einsum("ij,ij->i", e2, q) * inv_det
+    ok = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > T_MIN)
+    return np.where(ok, t, np.inf)
+
+
+def _intersect_pairs(origins, directions, v0, e1, e2):
+    """Moller-Trumbore test of R rays against one triangle each, inf for misses"""
+    p = np.cross(directions, e2)
+    det = np.einsum("ij,ij->i", e1, p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_det = 1.0 / det
+        s = origins - v0
+        u = np.einsum("ij,ij->i", s, p) * inv_det
+        q = np.cross(s, e1)
+        v = np.einsum("ij,ij->i", q, directions) * inv_det
+        t = np.einsum("ij,ij->i", e2, q) * inv_det
+    ok = (np.abs(det) > 1e-12) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > T_MIN)
+    return np.where(ok, t, np.inf)
@@ -0,0 +1,123 @@
+#  simpleRT_camera.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Vectorized primary ray generation: builds the origins and directions
+#  of every camera ray of a frame (or of one sample pass) as NumPy arrays
+#  with a single rotation-matrix multiply, instead of one mathutils.Vector
+#  per pixel.
+
+import numpy as np
+
+
+class Camera:
+    """Pinhole camera used by simpleRT
+
+    Parameters
+    ----------
+    location : float array of 3 items
+        World-space position of the camera
+    rotation : float array of 3 * 3 items
+        Camera-to-world rotation matrix, i.e. rotation_euler.to_matrix()
+    focal_length : float
+        Focal length divided by the sensor width (lens / sensor_width)
+    """
+
+    def __init__(self, location, rotation, focal_length):
+        self.location = np.asarray(location, dtype=np.float64).reshape(3)
+        self.rotation = np.asarray(rotation, dtype=np.float64).reshape(3, 3)
+        self.focal_length = float(focal_length)
+
+    @classmethod
+    def from_object(cls, cam):
+        """build the camera from a Blender camera object"""
+        return cls(
+            cam.location,
+            cam.rotation_euler.to_matrix(),
+            cam.data.lens / cam.data.sensor_width,
+        )
+
+    def rays(self, width, height, jitter=None, region=None):
+        """primary rays of every pixel, see camera_rays()"""
+        return camera_rays(
+            self.location, self.rotation, self.focal_length, width, height,
+            jitter, region,
+        )
+
+
+def screen_coords(width, height, region=None):
+    """Screen-space coordinates of the pixel corners used by simpleRT
+
+    Parameters
+    ----------
+    width : int
+    height : int
+    region : None or (x, y, w, h)
+        Only return the pixels of this rectangle of the frame
+
+    Returns
+    -------
+    screen_x : numpy.ndarray, (h * w,)
+    screen_y : numpy.ndarray, (h * w,)
+        Flattened in row-major order, i.e. pixel (x, y) is at y * w + x
+    """
+    x0, y0, w, h = region if region is not None else (0, 0, width, height)
+    aspect_ratio = height / width
+    xs = (np.arange(x0, x0 + w) - width / 2) / width
+    ys = ((np.arange(y0, y0 + h) - height / 2) / height) * aspect_ratio
+    screen_x = np.tile(xs, h)
+    screen_y = np.repeat(ys, w)
+    return screen_x, screen_y
+
+
+def camera_rays(location, rotation, focal_length, width, height, jitter=None,
+                region=None):
+    """Generate the primary rays of a whole frame
+
+    Parameters
+    ----------
+    location : float array of 3 items
+        Origin shared by all camera rays
+    rotation : float array of 3 * 3 items
+        Camera-to-world rotation matrix
+    focal_length : float
+        lens / sensor_width of the camera
+    width : int
+        Width of the rendered image
+    height : int
+        Height of the rendered image
+    jitter : None, float array of 2 items, or float array of (n_pixels, 2)
+        Subpixel offset in pixel units, in [-0.5, 0.5). A single (dx, dy)
+        pair is shared by every pixel of the pass (e.g. the Van der Corput
+        offset of sample s), an array gives one offset per pixel.
+    region : None or (x, y, w, h)
+        Only generate the rays of this rectangle of the frame (a tile)
+
+    Returns
+    -------
+    origins : numpy.ndarray, (n_pixels, 3)
+        Ray origins, row-major pixel order
+    directions : numpy.ndarray, (n_pixels, 3)
+        Normalized world-space ray directions, row-major pixel order
+    """
+    screen_x, screen_y = screen_coords(width, height, region)
+    if jitter is not None:
+        jitter = np.asarray(jitter, dtype=np.float64)
+        # pixel units -> screen units, same scale as corput() * dx / dy
+        aspect_ratio = height / width
+        screen_x = screen_x + jitter[..., 0] / width
+        screen_y = screen_y + jitter[..., 1] * aspect_ratio / height
+
+    local = np.empty((len(screen_x), 3))
+    local[:, 0] = screen_x
+    local[:, 1] = screen_y
+    local[:, 2] = -focal_length
+
+    # one matrix multiply for the whole frame: (R @ v^T)^T == v @ R^T
+    directions = local @ np.asarray(rotation, dtype=np.float64).T
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+
+    origins = np.broadcast_to(
+        np.asarray(location, dtype=np.float64), directions.shape
+    )
+    return origins, directions
@@ -0,0 +1,152 @@
+#  simpleRT_checkpoint.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Checkpoints of a render in progress. The accumulation buffer is the
+#  whole state of a render: every pixel draws the sample whose index is
+#  its sample count (see pixel_samples() in simpleRT_adaptive.py), so a
+#  render picks up from a buffer by taking the samples each pixel is still
+#  missing, and a finished render is extended by asking for more samples.
+#
+#  A checkpoint is an .npz file holding the buffer, the state of NumPy's
+#  global generator (the RANDOM sampler of the recursive integrators) and
+#  a key hashing the scene and every setting the image depends on; a
+#  checkpoint with another key is ignored. It is written to a temporary
+#  file next to its destination and renamed over it, so an interrupted
+#  write never leaves a truncated checkpoint behind.
+
+import hashlib
+import os
+
+import numpy as np
+
+
+# format of the files, bumped when the buffer layout changes
+CHECKPOINT_VERSION = 1
+
+# render settings the image depends on. The sample count, adaptive
+# sampling, tiles, workers, BVH and denoiser only decide how many samples
+# are taken and in which order, so a checkpoint carries over when they change
+SETTINGS = (
+    "recursion_depth", "use_roulette", "roulette_min_depth", "use_mis", "mis_heuristic",
+    "use_light_tree", "light_samples", "use_irradiance_cache", "irradiance_accuracy",
+    "irradiance_rays", "irradiance_prepass", "use_photons", "photon_count",
+    "photon_passes", "integrator", "seed", "sampler",
+)
+
+
+def render_key(snapshot, settings, width, height):
+    """Hash of what a render of the snapshot converges to
+
+    Parameters
+    ----------
+    snapshot : SceneSnapshot
+    settings : scene.simpleRT
+    width, height : int
+        Frame size in pixels
+
+    Returns
+    -------
+    key : str
+    """
+    h = hashlib.sha1()
+    h.update(repr((CHECKPOINT_VERSION, width, height)).encode())
+    h.update(repr([(name, getattr(settings, name)) for name in SETTINGS]).encode())
+    m = snapshot.materials
+    lights = snapshot.light_table
+    camera = snapshot.camera
+    arrays = (
+        snapshot.triangles, snapshot.tri_object, snapshot.ambient_color,
+        m.diffuse_color, m.specular_color, m.specular_hardness, m.use_fresnel,
+        m.mirror_reflectivity, m.ior, m.transmission,
+        lights.intensity, lights.matrix, lights.size, lights.type,
+        camera.location, camera.rotation, np.float64(camera.focal_length),
+    )
+    for array in arrays:
+        h.update(np.ascontiguousarray(array).tobytes())
+    return h.hexdigest()
+
+
+def save_checkpoint(path, accum, key, rng_state=None):
+    """Atomically write an accumulation buffer to path
+
+    Parameters
+    ----------
+    path : str
+    accum : numpy.ndarray, (height, width, ACCUM_CHANNELS)
+    key : str
+        render_key() of the render
+    rng_state : tuple or None
+        numpy.random.get_state() at the time the buffer was taken
+    """
+    state = {}
+    if rng_state is not None:
+        name, keys, pos, has_gauss, cached_gaussian = rng_state
+        state = dict(
+            rng_name=name, rng_keys=keys,
+            rng_values=np.array((pos, has_gauss)), rng_gauss=cached_gaussian,
+        )
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp = os.path.join(directory, ".%s.%d.tmp" % (os.path.basename(path), os.getpid()))
+    try:
+        with open(temp, "wb") as f:
+            np.savez(f, version=CHECKPOINT_VERSION, key=key, accum=accum, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def read_checkpoint(path):
+    """Key, accumulation buffer and generator state of a checkpoint file
+
+    Raises OSError, ValueError or KeyError when the file cannot be read.
+    """
+    with np.load(path) as data:
+        if int(data["version"]) != CHECKPOINT_VERSION:
+            raise ValueError("checkpoint format %d, expected %d" % (
+                int(data["version"]), CHECKPOINT_VERSION
+            ))
+        key = str(data["key"])
+        accum = data["accum"]
+        rng_state = None
+        if "rng_name" in data:
+            pos, has_gauss = data["rng_values"]
+            rng_state = (
+                str(data["rng_name"]), data["rng_keys"], int(pos), int(has_gauss),
+                float(data["rng_gauss"]),
+            )
+    return key, accum, rng_state
+
+
+def load_checkpoint(path, key, shape):
+    """Accumulation buffer of a checkpoint of the same render
+
+    Parameters
+    ----------
+    path : str
+    key : str
+        render_key() of the render
+    shape : tuple
+        Shape of its accumulation buffer
+
+    Returns
+    -------
+    accum : numpy.ndarray or None
+        None when there is no checkpoint, or one of another render
+    rng_state : tuple or None
+        The generator state stored with it, for numpy.random.set_state()
+    """
+    if not os.path.isfile(path):
+        return None, None
+    try:
+        stored_key, accum, rng_state = read_checkpoint(path)
+    except (OSError, ValueError, KeyError):
+        # unreadable or from another version of the format, start over
+        return None, None
+    if stored_key != key or accum.shape != tuple(shape):
+        return None, None
+    return accum, rng_state
@@ -0,0 +1,130 @@
+#  simpleRT_denoise.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Edge-avoiding a-trous wavelet denoiser, after Dammertz et al., "Edge-
+#  Avoiding A-Trous Wavelet Transform for fast Global Illumination
+#  Filtering" (HPG 2010), with the variance-guided luminance weight of
+#  Schied et al., "Spatiotemporal Variance-Guided Filtering" (HPG 2017).
+#  Every iteration blurs the image with a 5x5 B3-spline kernel whose taps
+#  are spread 2^i pixels apart, and each tap is weighted down where the
+#  first-hit normal, distance or luminance differ from the center pixel,
+#  so the blur stays inside surfaces. The color is divided by the albedo
+#  before filtering and multiplied back after, which keeps the edges of
+#  the diffuse colors sharp.
+
+import numpy as np
+
+from simpleRT_adaptive import (
+    AOV_ALBEDO, AOV_DEPTH, AOV_NORMAL, LUMINANCE, mean_variance, resolve, resolve_aovs,
+)
+
+
+# B3-spline kernel of every iteration, 5 taps per axis
+KERNEL = np.array((1 / 16, 1 / 4, 3 / 8, 1 / 4, 1 / 16))
+
+# albedo below which a channel is not demodulated
+MIN_ALBEDO = 1e-3
+
+
+def denoise(color, albedo, normal, depth, variance, iterations=3, sigma_luminance=2.0,
+            sigma_normal=128.0, sigma_depth=1.0):
+    """Filter a noisy image with its first-hit AOVs
+
+    Parameters
+    ----------
+    color : numpy.ndarray, (h, w, 3)
+        Noisy image
+    albedo : numpy.ndarray, (h, w, 3)
+        Diffuse color at the first hit, 0 where the camera rays missed
+    normal : numpy.ndarray, (h, w, 3)
+        Shading normal at the first hit
+    depth : numpy.ndarray, (h, w)
+        Distance from the camera to the first hit
+    variance : numpy.ndarray, (h, w)
+        Variance of the mean luminance of every pixel
+    iterations : int
+        The filter reaches 2^(iterations + 1) pixels away
+    sigma_luminance : float
+        Luminance differences in standard deviations that still blend
+    sigma_normal : float
+        Exponent of the cosine between normals, higher stops at smaller bends
+    sigma_depth : float
+        Relative distance difference per pixel of offset that still blends
+
+    Returns
+    -------
+    color : numpy.ndarray, (h, w, 3)
+    """
+    # filter the light reaching the surface, not the surface color
+    demodulate = albedo > MIN_ALBEDO
+    factor = np.where(demodulate, albedo, 1)
+    signal = color / factor
+    albedo_lum = factor @ LUMINANCE
+    variance = variance / np.maximum(albedo_lum, MIN_ALBEDO) ** 2
+
+    length = np.linalg.norm(normal, axis=2, keepdims=True)
+    normal = normal / np.where(length > 0, length, 1)
+    hit = length[:, :, 0] > 0
+
+    for i in range(iterations):
+        step = 1 << i
+        signal, variance = _atrous_step(
+            signal, variance, normal, depth, hit, step,
+            sigma_luminance, sigma_normal, sigma_depth,
+        )
+    # misses are left alone, they have nothing to be filtered with
+    return np.where(hit[:, :, None], signal * factor, color)
+
+
+def _atrous_step(signal, variance, normal, depth, hit, step, sigma_luminance,
+                 sigma_normal, sigma_depth):
+    """one a-trous iteration with taps `step` pixels apart"""
+    h, w = depth.shape
+    radius = 2 * step
+    pad = ((radius, radius), (radius, radius), (0, 0))
+    padded_signal = np.pad(signal, pad, mode="edge")
+    padded_variance = np.pad(variance, pad[:2], mode="edge")
+    padded_normal = np.pad(normal, pad, mode="edge")
+    padded_depth = np.pad(depth, pad[:2], mode="edge")
+
+    luminance = signal @ LUMINANCE
+    # luminance differences are measured against the noise of the pixel
+    lum_scale = sigma_luminance * np.sqrt(np.maximum(variance, 0)) + 1e-10
+    depth_scale = sigma_depth * np.maximum(depth, 1e-10)
+
+    total = np.zeros((h, w))
+    filtered = np.zeros_like(signal)
+    filtered_variance = np.zeros_like(variance)
+    for j, ky in enumerate(KERNEL):
+        for k, kx in enumerate(KERNEL):
+            dy, dx = (j - 2) * step, (k - 2) * step
+            window = (slice(radius + dy, radius + dy + h), slice(radius + dx, radius + dx + w))
+            tap_signal = padded_signal[window]
+            tap_variance = padded_variance[window]
+            if dy == 0 and dx == 0:
+                weight = np.full((h, w), ky * kx)
+            else:
+                cos_normal = np.einsum("ijk,ijk->ij", normal, padded_normal[window])
+                w_normal = np.maximum(cos_normal, 0) ** sigma_normal
+                offset = np.hypot(dy, dx)
+                w_depth = np.abs(depth - padded_depth[window]) / (depth_scale * offset)
+                w_lum = np.abs(luminance - tap_signal @ LUMINANCE) / lum_scale
+                weight = ky * kx * w_normal * np.exp(-w_depth - w_lum)
+                weight = np.where(hit, weight, 0)
+            total += weight
+            filtered += weight[:, :, None] * tap_signal
+            filtered_variance += weight ** 2 * tap_variance
+    return filtered / total[:, :, None], filtered_variance / total ** 2
+
+
+def denoise_accum(accum, iterations=3):
+    """Denoised RGBA image of an accumulation buffer, see simpleRT_adaptive.py"""
+    rgba = resolve(accum)
+    aovs = resolve_aovs(accum)
+    _, variance = mean_variance(accum)
+    rgba[:, :, 0:3] = denoise(
+        rgba[:, :, 0:3], aovs[:, :, AOV_ALBEDO], aovs[:, :, AOV_NORMAL],
+        aovs[:, :, AOV_DEPTH], variance, iterations,
+    )
+    return rgba
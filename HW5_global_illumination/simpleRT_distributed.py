@@ -0,0 +1,393 @@
+#  simpleRT_distributed.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Distributed rendering over a shared directory. A render is split into
+#  tasks, either ranges of sample indices over the whole frame or groups
+#  of tiles with all their samples, that any number of render nodes take
+#  and render with the wavefront tracer. Every task ends as a partial
+#  accumulation buffer (see simpleRT_adaptive.py); all its channels are
+#  sums, so merging partials is adding them, and since every pixel walks
+#  its own sequence of sample indices, a frame split by samples is the
+#  same image as the frame rendered on one machine.
+#
+#  The coordinator (the engine, or any script) writes a job folder:
+#
+#      <directory>/<job id>/job.pkl          tracer, frame and sampler
+#      <directory>/<job id>/tasks/0003.json  tasks nobody took yet
+#      <directory>/<job id>/claimed/...      tasks being rendered
+#      <directory>/<job id>/partials/0003.npz
+#
+#  A node claims a task by renaming its file into claimed/, which only one
+#  node can do, touches the claim after every tile and writes its partial
+#  in the checkpoint format (see simpleRT_checkpoint.py). A node that dies
+#  leaves its task in claimed/; the coordinator moves a claim not touched
+#  for CLAIM_TIMEOUT seconds back to tasks/, which hands it out again.
+#  Nodes need NumPy and the simpleRT modules, not Blender:
+#
+#      python simpleRT_distributed.py worker <directory>
+#      python simpleRT_distributed.py merge <output.npz> <job folder or partials>
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import pickle
+import socket
+import time
+import uuid
+
+import numpy as np
+
+from simpleRT_adaptive import ACCUM_CHANNELS, COUNT
+from simpleRT_checkpoint import read_checkpoint, save_checkpoint
+from simpleRT_parallel import render_tile
+
+
+SPLITS = ("SAMPLES", "TILES")
+JOB_FILE = "job.pkl"
+# seconds between two looks at the shared directory
+POLL_INTERVAL = 0.5
+# seconds after which a claim nobody touched is handed out again
+CLAIM_TIMEOUT = 300.0
+
+
+def split_tasks(tiles, first, samples, parts, split="SAMPLES"):
+    """Tasks of a render
+
+    Parameters
+    ----------
+    tiles : list of (x, y, w, h)
+    first : int
+        Index of the first sample to render
+    samples : int
+        Samples to render per pixel, from first on
+    parts : int
+        Number of tasks, fewer when there are not enough samples or tiles
+    split : str
+        "SAMPLES": every task renders all the tiles for a range of sample
+        indices; "TILES": every task renders every sample of some tiles
+
+    Returns
+    -------
+    tasks : list of dict
+        tiles, first and samples of every task
+    """
+    if split not in SPLITS:
+        raise ValueError("unknown split %r" % (split,))
+    tiles = [tuple(int(v) for v in tile) for tile in tiles]
+    if split == "SAMPLES":
+        bounds = np.linspace(first, first + samples, min(parts, samples) + 1).astype(int)
+        return [
+            dict(tiles=tiles, first=int(a), samples=int(b - a))
+            for a, b in zip(bounds[:-1], bounds[1:])
+        ]
+    groups = np.array_split(np.arange(len(tiles)), min(parts, len(tiles)))
+    return [
+        dict(tiles=[tiles[i] for i in group], first=first, samples=samples)
+        for group in groups
+    ]
+
+
+def submit(directory, tracer, width, height, depth, sampler, seed, key, tasks):
+    """Write a job folder and its tasks, returns the job folder
+
+    Parameters
+    ----------
+    directory : str
+        Shared directory the nodes watch
+    tracer : WavefrontTracer
+        With the BVH of its snapshot built, pickled for the nodes
+    width, height, depth : int
+    sampler : Sampler
+    seed : int
+    key : str
+        render_key() of the render, stored in every partial
+    tasks : list of dict
+        See split_tasks()
+    """
+    job_dir = os.path.join(directory, uuid.uuid4().hex)
+    for folder in ("tasks", "claimed", "partials"):
+        os.makedirs(os.path.join(job_dir, folder))
+    job = dict(
+        tracer=tracer, width=width, height=height, depth=depth, sampler=sampler,
+        seed=seed, key=key,
+    )
+    # the job is in place before any task can be seen
+    _write_atomic(os.path.join(job_dir, JOB_FILE), pickle.dumps(job))
+    for index, task in enumerate(tasks):
+        name = os.path.join(job_dir, "tasks", "%04d.json" % index)
+        _write_atomic(name, json.dumps(dict(task, index=index)).encode())
+    return job_dir
+
+
+def _write_atomic(path, data):
+    temp = os.path.join(os.path.dirname(path), ".%s.tmp" % os.path.basename(path))
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def claim(directory):
+    """Take a task of any job in directory
+
+    Returns
+    -------
+    (job_dir, claimed, task) or None
+        Job folder, path of the claim and the task, None when no task is left
+    """
+    worker = "%s.%d" % (socket.gethostname(), os.getpid())
+    for path in sorted(glob.glob(os.path.join(directory, "*", "tasks", "*.json"))):
+        job_dir = os.path.dirname(os.path.dirname(path))
+        name = os.path.basename(path)[:-len(".json")]
+        claimed = os.path.join(job_dir, "claimed", "%s.%s.json" % (name, worker))
+        try:
+            os.rename(path, claimed)
+            # a rename keeps the time of the task file, the claim starts now
+            os.utime(claimed)
+            with open(claimed) as f:
+                return job_dir, claimed, json.load(f)
+        except OSError:
+            # another node was faster, or the job was withdrawn
+            continue
+    return None
+
+
+def _touch(path):
+    try:
+        os.utime(path)
+    except OSError:
+        # handed out again or withdrawn, the partial is still welcome
+        pass
+
+
+def render_task(job, task, progress=None):
+    """Partial accumulation buffer of one task
+
+    Parameters
+    ----------
+    job : dict
+        Loaded from the job file
+    task : dict
+        See split_tasks()
+    progress : callable or None
+        Called after every tile
+
+    Returns
+    -------
+    accum : numpy.ndarray, (height, width, ACCUM_CHANNELS)
+        0 outside the tiles of the task
+    """
+    frame = np.zeros((job["height"], job["width"], ACCUM_CHANNELS))
+    for tile in task["tiles"]:
+        render_tile(
+            job["tracer"], frame, tuple(tile), job["depth"], task["samples"],
+            job["sampler"], job["seed"], first=task["first"],
+        )
+        if progress is not None:
+            progress()
+    return frame
+
+
+def work_once(directory, jobs=None):
+    """Claim and render one task, False when there was none
+
+    jobs caches the loaded jobs by folder.
+    """
+    claimed = claim(directory)
+    if claimed is None:
+        return False
+    job_dir, claimed, task = claimed
+    if jobs is None:
+        jobs = {}
+    path = os.path.join(job_dir, "partials", "%04d.npz" % task["index"])
+    try:
+        if job_dir not in jobs:
+            with open(os.path.join(job_dir, JOB_FILE), "rb") as f:
+                jobs[job_dir] = pickle.load(f)
+        job = jobs[job_dir]
+        partial = render_task(job, task, lambda: _touch(claimed))
+        save_checkpoint(path, partial, job["key"])
+    except FileNotFoundError:
+        # the render was finished or cancelled and its folder removed
+        jobs.pop(job_dir, None)
+    return True
+
+
+def run_worker(directory, idle_timeout=None, poll=POLL_INTERVAL):
+    """Render the tasks of directory until none is left for idle_timeout seconds
+
+    idle_timeout None waits for new jobs forever (a render node), 0 stops
+    as soon as no task is left. Returns the number of tasks rendered.
+    """
+    jobs = {}
+    done = 0
+    idle_since = time.time()
+    while True:
+        if work_once(directory, jobs):
+            done += 1
+            idle_since = time.time()
+            continue
+        if idle_timeout is not None and time.time() - idle_since >= idle_timeout:
+            return done
+        time.sleep(poll)
+
+
+def start_workers(directory, count):
+    """count local processes standing in for render nodes, until no task is left"""
+    processes = [
+        multiprocessing.Process(
+            target=run_worker, args=(directory,), kwargs=dict(idle_timeout=0), daemon=True
+        )
+        for _ in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def collect(job_dir, tasks, key, work=False, poll=POLL_INTERVAL, timeout=None,
+            stale=CLAIM_TIMEOUT):
+    """Partials of a job as they arrive
+
+    A generator of (task index, partial accumulation buffer), until every
+    task is in. Claims not touched for stale seconds are handed out again,
+    as their node probably died. The tasks nobody took yet are withdrawn
+    when it is closed early, so the nodes stop.
+
+    Parameters
+    ----------
+    job_dir : str
+        From submit()
+    tasks : int
+        Number of tasks of the job
+    key : str
+        Partials of another key are not used
+    work : bool
+        Render tasks in this process too while waiting
+    timeout : float or None
+        Raise TimeoutError when no partial came in and no claim was touched
+        for this many seconds; None waits forever
+
+    Raises
+    ------
+    TimeoutError
+        No node made progress for timeout seconds
+    """
+    seen = set()
+    jobs = {}
+    directory = os.path.dirname(job_dir)
+    progress = time.time()
+    try:
+        while len(seen) < tasks:
+            found = False
+            for path in sorted(glob.glob(os.path.join(job_dir, "partials", "*.npz"))):
+                index = int(os.path.basename(path)[:-len(".npz")])
+                if index in seen:
+                    continue
+                partial_key, partial, _ = read_checkpoint(path)
+                if partial_key != key:
+                    raise ValueError("partial %s belongs to another render" % path)
+                seen.add(index)
+                found = True
+                yield index, partial
+            if found:
+                progress = time.time()
+                continue
+            progress = max(progress, _requeue_stale(job_dir, seen, stale))
+            if timeout is not None and time.time() - progress > timeout:
+                raise TimeoutError(
+                    "no render node made progress for %g seconds, %d of %d tasks are in"
+                    % (timeout, len(seen), tasks)
+                )
+            if not (work and work_once(directory, jobs)):
+                time.sleep(poll)
+    finally:
+        for path in glob.glob(os.path.join(job_dir, "tasks", "*.json")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _requeue_stale(job_dir, seen, stale):
+    """Hand out again the claims of job_dir not touched for stale seconds
+
+    Returns the time the newest claim was touched, 0 without claims.
+    """
+    now = time.time()
+    newest = 0.0
+    for path in glob.glob(os.path.join(job_dir, "claimed", "*.json")):
+        name = os.path.basename(path).split(".")[0]
+        try:
+            touched = os.path.getmtime(path)
+            if (
+                now - touched > stale and int(name) not in seen
+                and not os.path.exists(os.path.join(job_dir, "partials", name + ".npz"))
+            ):
+                os.rename(path, os.path.join(job_dir, "tasks", name + ".json"))
+                continue
+        except OSError:
+            # the node finished or another coordinator moved it
+            continue
+        newest = max(newest, touched)
+    return newest
+
+
+def merge(paths):
+    """Sum the partials of one render
+
+    Parameters
+    ----------
+    paths : list of str
+        Partial or checkpoint files, or job folders for all their partials
+
+    Returns
+    -------
+    key : str
+    accum : numpy.ndarray, (height, width, ACCUM_CHANNELS)
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "partials", "*.npz"))))
+        else:
+            files.append(path)
+    if not files:
+        raise ValueError("no partials to merge")
+    key, accum, _ = read_checkpoint(files[0])
+    accum = accum.copy()
+    for path in files[1:]:
+        partial_key, partial, _ = read_checkpoint(path)
+        if partial_key != key or partial.shape != accum.shape:
+            raise ValueError("%s belongs to another render than %s" % (path, files[0]))
+        accum += partial
+    return key, accum
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="render the tasks of a shared directory")
+    worker.add_argument("directory")
+    worker.add_argument(
+        "--idle", type=float, default=None,
+        help="stop after this many seconds without a task (default: never)",
+    )
+    merger = commands.add_parser("merge", help="sum partials into one checkpoint")
+    merger.add_argument("output")
+    merger.add_argument("partials", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        done = run_worker(args.directory, args.idle)
+        print("%d tasks rendered" % done)
+    else:
+        key, accum = merge(args.partials)
+        save_checkpoint(args.output, accum, key)
+        print("%d samples merged into %s" % (int(accum[:, :, COUNT].sum()), args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#  simpleRT_headless.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Minimal stand-ins for the few bpy types simpleRT reads (scene, objects,
+#  meshes, lights, camera and the simpleRT custom properties), so that a
+#  SceneSnapshot can be built and the NumPy engines can run outside Blender.
+#  Also builds a procedural Cornell box with them.
+
+from math import cos, sin, pi
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class Euler:
+    """stand-in for mathutils.Euler (XYZ order)"""
+
+    def __init__(self, angles=(0.0, 0.0, 0.0)):
+        self.x, self.y, self.z = angles
+
+    def to_matrix(self):
+        cx, sx = cos(self.x), sin(self.x)
+        cy, sy = cos(self.y), sin(self.y)
+        cz, sz = cos(self.z), sin(self.z)
+        rx = np.array(((1, 0, 0), (0, cx, -sx), (0, sx, cx)))
+        ry = np.array(((cy, 0, sy), (0, 1, 0), (-sy, 0, cy)))
+        rz = np.array(((cz, -sz, 0), (sz, cz, 0), (0, 0, 1)))
+        return rz @ ry @ rx
+
+
+class _Collection:
+    """stand-in for a bpy_prop_collection supporting foreach_get()"""
+
+    def __init__(self, **attributes):
+        self._attributes = {k: np.asarray(v) for k, v in attributes.items()}
+        self._length = len(next(iter(self._attributes.values())))
+
+    def __len__(self):
+        return self._length
+
+    def foreach_get(self, attr, seq):
+        seq[:] = self._attributes[attr].ravel()
+
+
+class Mesh:
+    """stand-in for bpy.types.Mesh
+
+    Parameters
+    ----------
+    vertices : float array of (V, 3)
+        Local-space vertex positions
+    faces : list of int sequences
+        Vertex indices of each polygon, counter-clockwise seen from outside
+    """
+
+    def __init__(self, vertices, faces):
+        self.vertices = _Collection(co=np.asarray(vertices, dtype=np.float64))
+        self.faces = [tuple(f) for f in faces]
+        self.loop_triangles = None
+
+    def calc_loop_triangles(self):
+        # fan triangulation, enough for the convex polygons we generate
+        tris, owner = [], []
+        for i, face in enumerate(self.faces):
+            for k in range(1, len(face) - 1):
+                tris.append((face[0], face[k], face[k + 1]))
+                owner.append(i)
+        self.loop_triangles = _Collection(
+            vertices=np.array(tris, dtype=np.int32).reshape(-1, 3),
+            polygon_index=np.array(owner, dtype=np.int32),
+        )
+
+
+def material(**settings):
+    """stand-in for ObjectSettings (simpleRT_material), with the same defaults"""
+    values = dict(
+        diffuse_color=(0.78, 0.78, 0.78),
+        specular_color=(0.2, 0.2, 0.2),
+        specular_hardness=1000.0,
+        use_fresnel=False,
+        mirror_reflectivity=0.0,
+        ior=1.450,
+        transmission=0.0,
+    )
+    values.update(settings)
+    return SimpleNamespace(**values)
+
+
+def render_settings(**settings):
+    """stand-in for RenderSettings (scene.simpleRT), with the same defaults"""
+    values = dict(samples=4, recursion_depth=2, ambient_color=(0.05, 0.05, 0.05))
+    values.update(settings)
+    return SimpleNamespace(**values)
+
+
+class Object:
+    """stand-in for bpy.types.Object"""
+
+    def __init__(self, name, type, data, location=(0, 0, 0), rotation=(0, 0, 0),
+                 scale=1.0, simpleRT_material=None):
+        self.name = name
+        self.type = type
+        self.data = data
+        self.location = np.asarray(location, dtype=np.float64)
+        self.rotation_euler = Euler(rotation)
+        self.scale = scale
+        self.simpleRT_material = simpleRT_material or material()
+        self.hide_render = False
+
+    @property
+    def matrix_world(self):
+        matrix = np.eye(4)
+        matrix[:3, :3] = self.rotation_euler.to_matrix() * self.scale
+        matrix[:3, 3] = self.location
+        return matrix
+
+    def evaluated_get(self, depsgraph):
+        return self
+
+    def to_mesh(self):
+        return self.data
+
+    def to_mesh_clear(self):
+        pass
+
+    def __repr__(self):
+        return f"<headless {self.type} {self.name!r}>"
+
+
+class Scene:
+    """stand-in for bpy.types.Scene"""
+
+    def __init__(self, objects, camera, resolution=(480, 480), **settings):
+        self.objects = list(objects)
+        self.camera = camera
+        self.render = SimpleNamespace(
+            resolution_x=resolution[0],
+            resolution_y=resolution[1],
+            resolution_percentage=100,
+        )
+        self.simpleRT = render_settings(**settings)
+
+
+class Depsgraph:
+    """stand-in for bpy.types.Depsgraph"""
+
+    def __init__(self, scene):
+        self.scene = scene
+
+
+def mesh_object(name, vertices, faces, **kwargs):
+    return Object(name, "MESH", Mesh(vertices, faces), **kwargs)
+
+
+def light_object(name, type="POINT", color=(1, 1, 1), energy=10.0, size=0.25, **kwargs):
+    data = SimpleNamespace(
+        type=type, color=np.asarray(color, dtype=np.float64), energy=energy, size=size
+    )
+    return Object(name, "LIGHT", data, **kwargs)
+
+
+def camera_object(name="Camera", lens=50.0, sensor_width=36.0, **kwargs):
+    data = SimpleNamespace(lens=lens, sensor_width=sensor_width)
+    return Object(name, "CAMERA", data, **kwargs)
+
+
+def quad(name, corner, u, v, **kwargs):
+    """single quad spanned by corner, corner + u, corner + u + v, corner + v"""
+    corner, u, v = (np.asarray(a, dtype=np.float64) for a in (corner, u, v))
+    verts = [corner, corner + u, corner + u + v, corner + v]
+    return mesh_object(name, verts, [(0, 1, 2, 3)], **kwargs)
+
+
+def box(name, size=(1, 1, 1), **kwargs):
+    """axis-aligned box centered at the object origin, normals facing out"""
+    sx, sy, sz = np.asarray(size, dtype=np.float64) / 2
+    verts = [
+        (-sx, -sy, -sz), (sx, -sy, -sz), (sx, sy, -sz), (-sx, sy, -sz),
+        (-sx, -sy, sz), (sx, -sy, sz), (sx, sy, sz), (-sx, sy, sz),
+    ]
+    faces = [
+        (0, 3, 2, 1), (4, 5, 6, 7), (0, 1, 5, 4),
+        (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7),
+    ]
+    return mesh_object(name, verts, faces, **kwargs)
+
+
+def uv_sphere(name, radius=1.0, segments=16, rings=8, **kwargs):
+    """UV sphere centered at the object origin, normals facing out"""
+    verts = [(0, 0, -radius)]
+    for r in range(1, rings):
+        theta = pi * r / rings
+        for s in range(segments):
+            phi = 2 * pi * s / segments
+            verts.append((
+                radius * sin(theta) * cos(phi),
+                radius * sin(theta) * sin(phi),
+                -radius * cos(theta),
+            ))
+    verts.append((0, 0, radius))
+    top = len(verts) - 1
+
+    def ring(r, s):
+        return 1 + (r - 1) * segments + s % segments
+
+    faces = [(0, ring(1, s + 1), ring(1, s)) for s in range(segments)]
+    for r in range(1, rings - 1):
+        for s in range(segments):
+            faces.append((ring(r, s), ring(r, s + 1), ring(r + 1, s + 1), ring(r + 1, s)))
+    faces += [(ring(rings - 1, s), ring(rings - 1, s + 1), top) for s in range(segments)]
+    return mesh_object(name, verts, faces, **kwargs)
+
+
+def cornell_box(resolution=(480, 480), glass=True, **settings):
+    """Cornell box similar to the HW5 scene
+
+    A 2 x 2 x 2 room (x, y in [-1, 1], z in [0, 2]) with a red left wall,
+    a green right wall, a square area light under the ceiling, a diffuse
+    box and either a glass sphere or a second box. The camera looks down +y.
+    """
+    white = material(diffuse_color=(0.78, 0.78, 0.78), specular_color=(0, 0, 0))
+    red = material(diffuse_color=(0.7, 0.1, 0.1), specular_color=(0, 0, 0))
+    green = material(diffuse_color=(0.1, 0.6, 0.1), specular_color=(0, 0, 0))
+
+    objects = [
+        quad("Floor", (-1, -1, 0), (2, 0, 0), (0, 2, 0), simpleRT_material=white),
+        quad("Ceiling", (-1, -1, 2), (0, 2, 0), (2, 0, 0), simpleRT_material=white),
+        quad("Back", (-1, 1, 0), (2, 0, 0), (0, 0, 2), simpleRT_material=white),
+        quad("Left", (-1, -1, 0), (0, 2, 0), (0, 0, 2), simpleRT_material=red),
+        quad("Right", (1, -1, 0), (0, 0, 2), (0, 2, 0), simpleRT_material=green),
+        box(
+            "Box",
+            size=(0.6, 0.6, 1.2),
+            location=(-0.4, 0.3, 0.6),
+            rotation=(0, 0, 0.3),
+            simpleRT_material=material(diffuse_color=(0.78, 0.78, 0.78)),
+        ),
+    ]
+    if glass:
+        objects.append(uv_sphere(
+            "Glass",
+            radius=0.35,
+            segments=24,
+            rings=12,
+            location=(0.4, -0.2, 0.35),
+            simpleRT_material=material(
+                diffuse_color=(0, 0, 0),
+                specular_color=(1, 1, 1),
+                use_fresnel=True,
+                ior=1.5,
+                transmission=1.0,
+            ),
+        ))
+    else:
+        objects.append(box(
+            "Box.001",
+            size=(0.6, 0.6, 0.6),
+            location=(0.4, -0.2, 0.3),
+            rotation=(0, 0, -0.3),
+            simpleRT_material=white,
+        ))
+    objects.append(light_object(
+        "Light", type="AREA", energy=40.0, size=0.5, location=(0, 0, 1.98)
+    ))
+
+    camera = camera_object(location=(0, -3.9, 1), rotation=(pi / 2, 0, 0))
+    objects.append(camera)
+    return Scene(objects, camera, resolution=resolution, **settings)
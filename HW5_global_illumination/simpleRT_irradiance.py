@@ -0,0 +1,396 @@
+#  simpleRT_irradiance.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Irradiance cache for the diffuse GI, after Ward, Rubinstein and Clear,
+#  "A Ray Tracing Solution for Diffuse Interreflection" (SIGGRAPH 1988)
+#  and Ward and Heckbert, "Irradiance Gradients" (EGWR 1992). The
+#  irradiance of a diffuse hit is sampled with a stratified hemisphere of
+#  rays only at sparse record points; other hits interpolate the records
+#  around them, extrapolated with their rotation and translation
+#  gradients. A record is valid as far as the harmonic mean distance of
+#  the surfaces it sees allows, so records are dense in corners and sparse
+#  on open walls. Deeper bounces contribute less to the image, so as in
+#  RADIANCE their accuracy is relaxed, doubling every level below the
+#  first hits.
+#
+#  Records are kept per remaining depth, a record at depth d being the
+#  irradiance of rays traced with depth d - 1, so the hemisphere rays of a
+#  record use (and fill) the cache of the next depth. They are stored in a
+#  loose octree: a record sits in the smallest node whose loose bounds
+#  (twice the node) hold its whole region of validity, so a lookup only
+#  visits the nodes whose loose bounds hold the point.
+
+from math import pi
+
+import numpy as np
+
+
+# small offset to prevent self-occlusion for the hemisphere rays
+EPS = 1e-3
+# octree levels below the root
+MAX_LEVELS = 16
+# relaxed accuracy of the deeper bounces, at most this: past it the normal
+# term would accept records facing away
+MAX_ACCURACY = 0.5
+# records are not used for points this far in front of them, in radii
+FRONT_TOLERANCE = 0.05
+# Rec. 709 luma weights
+LUMINANCE = np.array((0.2126, 0.7152, 0.0722))
+
+
+class IrradianceCache:
+    """Sparse world-space irradiance records in a loose octree
+
+    Parameters
+    ----------
+    bounds_min, bounds_max : float array of 3 items
+        Bounds of the scene, the octree root holds them
+    accuracy : float
+        Ward's a of the first hits: a record is used where its error
+        estimate is below a, smaller means more records and less
+        interpolation error
+    rays : int
+        Hemisphere rays per record, M x N strata with N about pi M
+    min_radius, max_radius : float or None
+        Clamp of the record radii, 1% and 25% of the scene size by default
+    seed : int
+        Seed of the hemisphere samples
+    max_depth : int
+        Remaining depth of the first hits, the recursion depth of the render
+
+    Attributes
+    ----------
+    frozen : bool
+        Only look up, never add records; the callers sample the hits the
+        cache has no record for. Set once a pre-pass filled the cache, so
+        worker copies all use the same records
+    rng : numpy.random.Generator
+        Source of the random numbers of the records and their rays
+    strata : (int, int)
+        M strata in theta, N in phi
+    """
+
+    def __init__(self, bounds_min, bounds_max, accuracy=0.25, rays=64, min_radius=None,
+                 max_radius=None, seed=0, max_depth=1):
+        bounds_min = np.asarray(bounds_min, dtype=np.float64)
+        bounds_max = np.asarray(bounds_max, dtype=np.float64)
+        size = max(float(np.max(bounds_max - bounds_min)), 1e-6)
+        self.accuracy = accuracy
+        self.max_depth = max_depth
+        self.min_radius = 0.01 * size if min_radius is None else min_radius
+        self.max_radius = 0.25 * size if max_radius is None else max_radius
+        m = max(int(round(np.sqrt(rays / pi))), 1)
+        self.strata = (m, max(int(round(rays / m)), 1))
+        self.rng = np.random.default_rng(seed)
+        self.frozen = False
+
+        # records
+        self.position = np.zeros((0, 3))
+        self.normal = np.zeros((0, 3))
+        self.irradiance = np.zeros((0, 3))
+        self.radius = np.zeros(0)
+        self.rotation_gradient = np.zeros((0, 3, 3))
+        self.translation_gradient = np.zeros((0, 3, 3))
+        self.depth = np.zeros(0, dtype=np.int64)
+        self.node = np.zeros(0, dtype=np.int64)
+
+        # octree, the root a cube around the bounds
+        self.node_center = [(bounds_min + bounds_max) / 2]
+        self.node_half = [size / 2 * (1 + 1e-6)]
+        self.node_children = [[-1] * 8]
+        self._index = None
+
+    def __len__(self):
+        return len(self.radius)
+
+    def accuracy_at(self, depth):
+        """Ward's a of the records of a remaining depth"""
+        relaxed = self.accuracy * 2.0 ** max(self.max_depth - depth, 0)
+        return min(relaxed, max(self.accuracy, MAX_ACCURACY))
+
+    def irradiance_at(self, point, normal, depth, trace):
+        """Irradiance at one diffuse hit, computing a record if none is valid
+
+        Parameters
+        ----------
+        point, normal : numpy.ndarray, (3,)
+            Hit location and unit normal facing the incoming ray
+        depth : int
+            Remaining depth of the hit, its bounce rays get depth - 1
+        trace : callable
+            trace(origins, directions, depth) -> (radiance (n, 3), distance
+            (n,)), distance inf for rays that hit nothing
+
+        Returns
+        -------
+        irradiance : numpy.ndarray, (3,) or None
+            None when the cache is frozen and has no record for the hit
+        """
+        point = np.asarray(point, dtype=np.float64).reshape(1, 3)
+        normal = np.asarray(normal, dtype=np.float64).reshape(1, 3)
+        irradiance, valid = self.lookup(point, normal, depth)
+        if valid[0]:
+            return irradiance[0]
+        if self.frozen:
+            return None
+        self.add_records(point, normal, depth, trace)
+        return self.irradiance[-1].copy()
+
+    def fill(self, points, normals, depth, trace):
+        """Add records until every given hit has a valid one, in order"""
+        _, valid = self.lookup(points, normals, depth)
+        for i in np.nonzero(~valid)[0]:
+            # the records added since may cover it by now
+            if not self.lookup(points[i:i + 1], normals[i:i + 1], depth)[1][0]:
+                self.add_records(points[i:i + 1], normals[i:i + 1], depth, trace)
+
+    def lookup(self, points, normals, depth):
+        """Interpolated irradiance of a batch of hits
+
+        Parameters
+        ----------
+        points, normals : numpy.ndarray, (n, 3)
+        depth : int
+            Only the records of this remaining depth are used
+
+        Returns
+        -------
+        irradiance : numpy.ndarray, (n, 3)
+            0 where no record is valid
+        valid : numpy.ndarray of bool, (n,)
+        """
+        n = len(points)
+        total = np.zeros((n, 3))
+        weight_sum = np.zeros(n)
+        if len(self) == 0 or n == 0:
+            return total, np.zeros(n, dtype=bool)
+        order, start, center, half, children = self._octree_arrays()
+
+        # every (point, node) pair whose node loose bounds hold the point
+        query = np.arange(n)
+        node = np.zeros(n, dtype=np.int64)
+        while len(query):
+            counts = start[node + 1] - start[node]
+            if counts.sum():
+                pair = np.repeat(query, counts)
+                first = np.repeat(start[node], counts)
+                rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+                self._accumulate(
+                    points, normals, depth, pair, order[first + rank], total, weight_sum
+                )
+            query = np.repeat(query, 8)
+            node = children[np.repeat(node, 8), np.tile(np.arange(8), len(node))]
+            keep = node >= 0
+            query, node = query[keep], node[keep]
+            inside = np.all(
+                np.abs(points[query] - center[node]) <= 2 * half[node, None], axis=1
+            )
+            query, node = query[inside], node[inside]
+
+        valid = weight_sum > 0
+        irradiance = total / np.where(valid, weight_sum, 1)[:, None]
+        return np.maximum(irradiance, 0), valid
+
+    def _accumulate(self, points, normals, depth, query, record, total, weight_sum):
+        """add the weighted extrapolations of records to the hits in query"""
+        offset = points[query] - self.position[record]
+        dist = np.linalg.norm(offset, axis=1)
+        normal, record_normal = normals[query], self.normal[record]
+        cos_normal = np.einsum("ij,ij->i", normal, record_normal)
+        # Ward's error estimate, the inverse of the record weight
+        error = dist / self.radius[record] + np.sqrt(np.maximum(1 - cos_normal, 0))
+        # a point in front of the record sees things it does not
+        in_front = np.einsum("ij,ij->i", offset, (normal + record_normal) / 2)
+        use = (
+            (error < self.accuracy_at(depth))
+            & (in_front >= -FRONT_TOLERANCE * self.radius[record])
+            & (self.depth[record] == depth)
+        )
+        if not use.any():
+            return
+        query, record, offset = query[use], record[use], offset[use]
+        weight = 1 / np.maximum(error[use], 1e-6)
+        rotation = np.cross(self.normal[record], normals[query])
+        irradiance = (
+            self.irradiance[record]
+            + np.einsum("ij,icj->ic", rotation, self.rotation_gradient[record])
+            + np.einsum("ij,icj->ic", offset, self.translation_gradient[record])
+        )
+        np.add.at(total, query, weight[:, None] * irradiance)
+        np.add.at(weight_sum, query, weight)
+
+    def add_records(self, points, normals, depth, trace):
+        """Sample the irradiance and its gradients at a batch of hits and store them
+
+        See irradiance_at() for the arguments; the hemisphere rays of all
+        the records are traced in a single call.
+        """
+        k = len(points)
+        m, n = self.strata
+        tangent, bitangent = _tangent_frame(normals)
+
+        # stratified cosine-weighted directions, theta by rows, phi by columns
+        u = (np.arange(m)[None, :, None] + self.rng.random((k, m, n))) / m
+        phi = 2 * pi * (np.arange(n)[None, None, :] + self.rng.random((k, m, n))) / n
+        sin_theta = np.sqrt(u)
+        cos_theta = np.sqrt(1 - u)
+        directions = (
+            (np.cos(phi) * sin_theta)[..., None] * tangent[:, None, None]
+            + (np.sin(phi) * sin_theta)[..., None] * bitangent[:, None, None]
+            + cos_theta[..., None] * normals[:, None, None]
+        )
+        origins = np.broadcast_to((points + normals * EPS)[:, None, None], directions.shape)
+        radiance, distance = trace(
+            origins.reshape(-1, 3), directions.reshape(-1, 3), depth - 1
+        )
+        radiance = radiance.reshape(k, m, n, 3)
+        distance = distance.reshape(k, m, n)
+
+        irradiance = pi / (m * n) * radiance.sum(axis=(1, 2))
+
+        # rotation gradient: tilting the normal towards v_k
+        v = (
+            -np.sin(phi)[..., None] * tangent[:, None, None]
+            + np.cos(phi)[..., None] * bitangent[:, None, None]
+        )
+        tan_theta = sin_theta / np.maximum(cos_theta, 1e-6)
+        rotation_gradient = pi / (m * n) * np.einsum(
+            "kjl,kjlc,kjlx->kcx", tan_theta, radiance, v
+        )
+
+        # translation gradient: how the boundaries between the strata move,
+        # the closer of the two surfaces on either side setting the pace
+        j = np.arange(m)
+        theta_lo = np.arcsin(np.sqrt(j / m))
+        theta_hi = np.arcsin(np.sqrt((j + 1) / m))
+        # boundaries in theta, between rows j - 1 and j, along u_k
+        near = np.minimum(distance[:, 1:], distance[:, :-1])
+        coef = (2 * pi / n) * np.sin(theta_lo[1:]) * np.cos(theta_lo[1:]) ** 2
+        coef = coef[None, :, None] / near
+        phi_center = 2 * pi * (np.arange(n) + 0.5) / n
+        u_k = (
+            np.cos(phi_center)[None, :, None] * tangent[:, None]
+            + np.sin(phi_center)[None, :, None] * bitangent[:, None]
+        )
+        translation_gradient = np.einsum(
+            "kjl,kjlc,klx->kcx", coef, radiance[:, 1:] - radiance[:, :-1], u_k
+        )
+        # boundaries in phi, between columns l - 1 and l, along v_l-
+        near = np.minimum(distance, np.roll(distance, 1, axis=2))
+        coef = (np.sin(theta_hi) - np.sin(theta_lo))[None, :, None] / near
+        phi_lo = 2 * pi * np.arange(n) / n
+        v_lo = (
+            -np.sin(phi_lo)[None, :, None] * tangent[:, None]
+            + np.cos(phi_lo)[None, :, None] * bitangent[:, None]
+        )
+        translation_gradient += np.einsum(
+            "kjl,kjlc,klx->kcx", coef, radiance - np.roll(radiance, 1, axis=2), v_lo
+        )
+
+        # harmonic mean distance, limited where the irradiance changes fast
+        inverse = np.where(np.isfinite(distance) & (distance > 0), 1 / distance, 0)
+        slope = np.einsum("c,kcx->kx", LUMINANCE, translation_gradient)
+        slope = np.linalg.norm(slope, axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            radius = m * n / inverse.sum(axis=(1, 2))
+            limit = np.where(slope > 0, (irradiance @ LUMINANCE) / slope, np.inf)
+        radius = np.clip(np.minimum(radius, limit), self.min_radius, self.max_radius)
+
+        self.position = np.concatenate((self.position, points))
+        self.normal = np.concatenate((self.normal, normals))
+        self.irradiance = np.concatenate((self.irradiance, irradiance))
+        self.radius = np.concatenate((self.radius, radius))
+        self.rotation_gradient = np.concatenate((self.rotation_gradient, rotation_gradient))
+        self.translation_gradient = np.concatenate(
+            (self.translation_gradient, translation_gradient)
+        )
+        self.depth = np.concatenate((self.depth, np.full(k, depth)))
+        extent = self.accuracy_at(depth) * radius
+        nodes = [self._insert(p, e) for p, e in zip(points, extent)]
+        self.node = np.concatenate((self.node, np.array(nodes, dtype=np.int64)))
+        self._index = None
+
+    def _insert(self, point, extent):
+        """smallest node whose loose bounds hold a sphere of radius extent at point"""
+        node = 0
+        for _ in range(MAX_LEVELS):
+            half = self.node_half[node] / 2
+            if extent > half:
+                break
+            center = self.node_center[node]
+            above = point > center
+            octant = int(above[0]) | int(above[1]) << 1 | int(above[2]) << 2
+            child = self.node_children[node][octant]
+            if child < 0:
+                child = len(self.node_half)
+                self.node_center.append(center + np.where(above, half, -half))
+                self.node_half.append(half)
+                self.node_children.append([-1] * 8)
+                self.node_children[node][octant] = child
+            node = child
+        return node
+
+    def _octree_arrays(self):
+        """records sorted by node with the start of every node, and the nodes as arrays"""
+        if self._index is None:
+            order = np.argsort(self.node, kind="stable")
+            start = np.searchsorted(self.node[order], np.arange(len(self.node_half) + 1))
+            self._index = (
+                order,
+                start,
+                np.array(self.node_center),
+                np.array(self.node_half),
+                np.array(self.node_children, dtype=np.int64),
+            )
+        return self._index
+
+
+def _tangent_frame(normals):
+    """two unit vectors completing every normal into an orthonormal frame"""
+    helper = np.where(
+        (np.abs(normals[:, 0]) > 0.9)[:, None], (0.0, 1.0, 0.0), (1.0, 0.0, 0.0)
+    )
+    tangent = np.cross(normals, helper)
+    tangent /= np.linalg.norm(tangent, axis=1, keepdims=True)
+    return tangent, np.cross(normals, tangent)
+
+
+def prepass(cache, snapshot, width, height, depth, trace, levels=4):
+    """Fill the cache at the first hits of the pixels, then freeze it
+
+    The pixel grid is visited coarse to fine (every 2^levels pixels, then
+    every 2^(levels - 1)...), so most of the finer lookups find the
+    records of the coarser ones.
+
+    Parameters
+    ----------
+    cache : IrradianceCache
+    snapshot : SceneSnapshot
+    width, height : int
+    depth : int
+        Maximum recursion depth of the render
+    trace : callable
+        See IrradianceCache.irradiance_at()
+    levels : int
+    """
+    if depth > 0:
+        origins, directions = snapshot.camera.rays(width, height)
+        tri, t = snapshot.intersect(origins, directions)
+        pixel = np.arange(width * height)
+        row, col = np.divmod(pixel, width)
+        # only the hits with a diffuse color read the cache
+        diffuse = np.zeros(len(tri), dtype=bool)
+        hit = tri >= 0
+        mat = snapshot.tri_object[tri[hit]]
+        diffuse[hit] = snapshot.materials.diffuse_color[mat].max(axis=1) > 0
+        for level in range(levels, -1, -1):
+            step = 1 << level
+            rays = pixel[(row % step == 0) & (col % step == 0) & diffuse]
+            points = origins[rays] + t[rays, None] * directions[rays]
+            normals = snapshot.normals[tri[rays]]
+            facing = np.einsum("ij,ij->i", normals, directions[rays]) > 0
+            normals = np.where(facing[:, None], -normals, normals)
+            cache.fill(points, normals, depth, trace)
+    cache.frozen = True
+    return cache
@@ -0,0 +1,120 @@
+#  simpleRT_lights.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Light table built once per render: everything shading needs to know
+#  about the lights (intensity, position, emission normal, area-to-world
+#  transform, size and type) as NumPy arrays indexed by light id, so the
+#  shading loops never read bpy light properties.
+
+from math import pi
+
+import numpy as np
+
+
+class LightTable:
+    """Per-render constants of every light
+
+    Parameters
+    ----------
+    lights : list
+        Light objects (bpy.types.Object of type "LIGHT")
+
+    Attributes
+    ----------
+    type : numpy.ndarray of str, (L,)
+        Blender light type ("POINT", "AREA", ...)
+    is_area : numpy.ndarray of bool, (L,)
+    intensity : numpy.ndarray, (L, 3)
+        color * energy / 4 / pi, the radiant intensity of the light
+    position : numpy.ndarray, (L, 3)
+        World-space location
+    normal : numpy.ndarray, (L, 3)
+        World-space emission direction of area lights (local -z)
+    size : numpy.ndarray, (L,)
+        Size of area lights, 0 for the other types
+    area : numpy.ndarray, (L,)
+        World-space area of the disk of area lights, 0 for the other types
+    matrix : numpy.ndarray, (L, 4, 4)
+        matrix_world, maps points of the area light plane to world space
+    plane_inverse : numpy.ndarray, (L, 2, 3)
+        Pseudo-inverse of the in-plane axes of `matrix`
+    """
+
+    def __init__(self, lights):
+        lights = list(lights)
+        self.type = np.array([l.data.type for l in lights], dtype=str)
+        self.is_area = self.type == "AREA"
+        self.intensity = np.array(
+            [np.asarray(l.data.color) * l.data.energy / 4 / pi for l in lights],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        self.matrix = np.array(
+            [np.asarray(l.matrix_world) for l in lights], dtype=np.float64
+        ).reshape(-1, 4, 4)
+        self.position = np.ascontiguousarray(self.matrix[:, :3, 3])
+        self.size = np.array(
+            [l.data.size if l.data.type == "AREA" else 0.0 for l in lights],
+            dtype=np.float64,
+        )
+
+        normal = self.matrix[:, :3, :3] @ np.array((0.0, 0.0, -1.0))
+        length = np.linalg.norm(normal, axis=1, keepdims=True)
+        self.normal = normal / np.where(length > 0, length, 1)
+        # the matrix may scale the disk
+        axes = np.cross(self.matrix[:, :3, 0], self.matrix[:, :3, 1])
+        self.area = pi * (self.size / 2) ** 2 * np.linalg.norm(axes, axis=1)
+        # maps world-space offsets in the plane of a light to its local x, y
+        self.plane_inverse = np.linalg.pinv(self.matrix[:, :3, :2]).reshape(-1, 2, 3)
+
+    def __len__(self):
+        return len(self.type)
+
+    def disk_points(self, i, theta, r):
+        """World-space points on the disk of area light i
+
+        Parameters
+        ----------
+        i : int or numpy.ndarray, (n,)
+            Light index, or one per point; other lights give their position
+        theta : float or numpy.ndarray, (n,)
+            Angle in [0, 2 pi)
+        r : float or numpy.ndarray, (n,)
+            Uniform in [0, 1], the square root makes the points uniform on the disk
+
+        Returns
+        -------
+        points : numpy.ndarray, (3,) or (n, 3)
+        """
+        radius = np.sqrt(r) * (self.size[i] / 2)
+        local = np.stack((radius * np.cos(theta), radius * np.sin(theta)), axis=-1)
+        return np.einsum("...jk,...k->...j", self.matrix[i, :3, :2], local) + self.position[i]
+
+    def intersect_disk(self, i, origins, directions):
+        """Where rays hit the emitting side of area light i
+
+        Parameters
+        ----------
+        i : int or numpy.ndarray, (n,)
+            Light index, or one per ray
+        origins : numpy.ndarray, (n, 3)
+        directions : numpy.ndarray, (n, 3)
+            Unit directions
+
+        Returns
+        -------
+        t : numpy.ndarray, (n,)
+            Distance to the disk, inf for a miss or its back side
+        cos_light : numpy.ndarray, (n,)
+            Cosine between the light normal and the direction back to the ray origin
+        """
+        normal = self.normal[i]
+        cos_light = -(directions * normal).sum(axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = ((self.position[i] - origins) * normal).sum(axis=-1) / -cos_light
+            # disk test in the plane of the light, in its local coordinates
+            offset = origins + t[:, None] * directions - self.position[i]
+            local = np.einsum("...kj,...j->...k", self.plane_inverse[i], offset)
+            inside = (local ** 2).sum(axis=1) <= (self.size[i] / 2) ** 2
+        hit = (cos_light > 0) & (t > 0) & inside
+        return np.where(hit, t, np.inf), cos_light
@@ -0,0 +1,303 @@
+#  simpleRT_lighttree.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Light hierarchy over the LightTable, after Conty Estevez and Kulla,
+#  "Importance Sampling of Many Lights with Adaptive Tree Splitting"
+#  (HPG 2018). Every node bounds its lights with a box, their total power
+#  and a cone of emission directions. A hit picks a light by walking down
+#  from the root, choosing a child at random in proportion to an estimate
+#  of its contribution (power, distance, orientation to the light and to
+#  the surface), so the cost of direct lighting depends on the number of
+#  light samples instead of the number of lights.
+#
+#  The estimate is conservative: it is 0 only for nodes that cannot light
+#  the hit at all, so sampling with it and dividing by the pdf is unbiased.
+
+from math import pi
+
+import numpy as np
+
+from simpleRT_sampler import LIGHT, PICK
+
+
+class LightTree:
+    """Binary tree over the lights, one light per leaf
+
+    Parameters
+    ----------
+    lights : LightTable
+
+    Attributes
+    ----------
+    node_min, node_max : numpy.ndarray, (N, 3)
+        Bounds of the lights of every node, node 0 is the root
+    node_power : numpy.ndarray, (N,)
+        Total emitted power of the node (brightest channel)
+    node_axis : numpy.ndarray, (N, 3)
+        Axis of the cone of emission normals
+    node_theta_o : numpy.ndarray, (N,)
+        Half angle of the cone of normals, pi for point lights
+    node_theta_e : numpy.ndarray, (N,)
+        Angle around the normals light is emitted into, pi / 2 for area lights
+    node_offset : numpy.ndarray, (N,)
+        Inner node: index of its first child (the second child is offset + 1)
+    node_light : numpy.ndarray, (N,)
+        Leaf: light index, -1 for inner nodes
+    node_parent : numpy.ndarray, (N,)
+        Parent of every node, -1 for the root
+    leaf : numpy.ndarray, (L,)
+        Leaf node of every light
+    """
+
+    def __init__(self, lights):
+        self.lights = lights
+        n = len(lights)
+        is_area = np.asarray(lights.is_area, dtype=bool)
+
+        # bounds of every light: its disk or its position
+        radius = np.linalg.norm(lights.matrix[:, :3, :2], axis=1).max(axis=1, initial=0)
+        radius = np.where(is_area, radius * lights.size / 2, 0)[:, None]
+        light_min = lights.position - radius
+        light_max = lights.position + radius
+        # a point light emits 4 pi I, a one-sided cosine emitter pi I
+        brightest = lights.intensity.max(axis=1, initial=0)
+        light_power = np.where(is_area, pi, 4 * pi) * brightest
+        light_axis = np.where(is_area[:, None], lights.normal, (0.0, 0.0, 1.0))
+        light_theta_o = np.where(is_area, 0.0, pi)
+        light_theta_e = np.full(n, pi / 2)
+
+        node_min, node_max, node_power, node_axis = [], [], [], []
+        node_theta_o, node_theta_e, node_offset, node_light, node_parent = [], [], [], [], []
+
+        def new_node(parent):
+            node_min.append(np.zeros(3))
+            node_max.append(np.zeros(3))
+            node_power.append(0.0)
+            node_axis.append(np.zeros(3))
+            node_theta_o.append(0.0)
+            node_theta_e.append(0.0)
+            node_offset.append(0)
+            node_light.append(-1)
+            node_parent.append(parent)
+            return len(node_light) - 1
+
+        # top-down build; children are filled before their parent is merged,
+        # so inner nodes are summarized on the way back up
+        order = []
+        root = new_node(-1)
+        stack = [(root, np.arange(n))] if n else []
+        while stack:
+            node, index = stack.pop()
+            order.append(node)
+            if len(index) == 1:
+                i = index[0]
+                node_min[node], node_max[node] = light_min[i], light_max[i]
+                node_power[node] = light_power[i]
+                node_axis[node] = light_axis[i]
+                node_theta_o[node] = light_theta_o[i]
+                node_theta_e[node] = light_theta_e[i]
+                node_light[node] = i
+                continue
+            # median split of the light centers along their longest extent
+            centers = lights.position[index]
+            axis = np.argmax(centers.max(axis=0) - centers.min(axis=0))
+            index = index[np.argsort(centers[:, axis], kind="stable")]
+            half = len(index) // 2
+            left = new_node(node)
+            new_node(node)
+            node_offset[node] = left
+            stack.append((left + 1, index[half:]))
+            stack.append((left, index[:half]))
+
+        for node in reversed(order):
+            if node_light[node] >= 0:
+                continue
+            a, b = node_offset[node], node_offset[node] + 1
+            node_min[node] = np.minimum(node_min[a], node_min[b])
+            node_max[node] = np.maximum(node_max[a], node_max[b])
+            node_power[node] = node_power[a] + node_power[b]
+            node_axis[node], node_theta_o[node] = _merge_cones(
+                node_axis[a], node_theta_o[a], node_axis[b], node_theta_o[b]
+            )
+            node_theta_e[node] = max(node_theta_e[a], node_theta_e[b])
+
+        self.node_min = np.array(node_min, dtype=np.float64).reshape(-1, 3)
+        self.node_max = np.array(node_max, dtype=np.float64).reshape(-1, 3)
+        self.node_power = np.array(node_power, dtype=np.float64)
+        self.node_axis = np.array(node_axis, dtype=np.float64).reshape(-1, 3)
+        self.node_theta_o = np.array(node_theta_o, dtype=np.float64)
+        self.node_theta_e = np.array(node_theta_e, dtype=np.float64)
+        self.node_offset = np.array(node_offset, dtype=np.int64)
+        self.node_light = np.array(node_light, dtype=np.int64)
+        self.node_parent = np.array(node_parent, dtype=np.int64)
+        self.leaf = np.zeros(n, dtype=np.int64)
+        leaves = np.nonzero(self.node_light >= 0)[0]
+        self.leaf[self.node_light[leaves]] = leaves
+
+    def __len__(self):
+        return len(self.node_light)
+
+    def importance(self, nodes, points, normals):
+        """Estimated contribution of nodes to the hits at points
+
+        Parameters
+        ----------
+        nodes : numpy.ndarray, (n,)
+            One node per point
+        points : numpy.ndarray, (n, 3)
+        normals : numpy.ndarray, (n, 3)
+            Unit normals, facing the incoming ray
+
+        Returns
+        -------
+        importance : numpy.ndarray, (n,)
+            0 only where no light of the node can reach the hit
+        """
+        lo, hi = self.node_min[nodes], self.node_max[nodes]
+        center = (lo + hi) / 2
+        radius = np.linalg.norm(hi - lo, axis=1) / 2
+        to_node = center - points
+        dist = np.linalg.norm(to_node, axis=1)
+        outside = dist > radius
+        to_node = to_node / np.where(dist > 0, dist, 1)[:, None]
+        # half angle of the bounding sphere seen from the hit, every
+        # direction when the hit is inside it
+        sin_u = np.minimum(radius / np.where(outside, dist, 1), 1)
+        theta_u = np.where(outside, np.arcsin(sin_u), pi)
+
+        # angle between the emission cone and the direction to the hit
+        cos_theta = -np.einsum("ij,ij->i", to_node, self.node_axis[nodes])
+        theta = np.arccos(np.clip(cos_theta, -1, 1))
+        theta_min = np.maximum(theta - self.node_theta_o[nodes] - theta_u, 0)
+        emit = np.where(theta_min < self.node_theta_e[nodes], np.cos(theta_min), 0)
+
+        # angle between the surface normal and the node
+        cos_i = np.einsum("ij,ij->i", to_node, normals)
+        theta_i = np.maximum(np.arccos(np.clip(cos_i, -1, 1)) - theta_u, 0)
+        receive = np.where(theta_i < pi / 2, np.cos(theta_i), 0)
+
+        # inside its bounds a node is as close as its radius
+        dist2 = np.maximum(dist * dist, radius * radius)
+        with np.errstate(divide="ignore"):
+            importance = self.node_power[nodes] * emit * receive / dist2
+        return np.where(np.isfinite(importance), importance, self.node_power[nodes])
+
+    def _left_probability(self, nodes, points, normals):
+        """chance of going to the first child of inner nodes"""
+        left = self.node_offset[nodes]
+        i_left = self.importance(left, points, normals)
+        i_right = self.importance(left + 1, points, normals)
+        total = i_left + i_right
+        # neither child can light the hit, fall back to their power
+        p_left = self.node_power[left] / np.maximum(
+            self.node_power[left] + self.node_power[left + 1], 1e-300
+        )
+        return np.where(total > 0, i_left / np.where(total > 0, total, 1), p_left)
+
+    def sample(self, points, normals, u):
+        """Pick one light per hit in proportion to its estimated contribution
+
+        Parameters
+        ----------
+        points : numpy.ndarray, (n, 3)
+        normals : numpy.ndarray, (n, 3)
+        u : numpy.ndarray, (n,)
+            Uniform in [0, 1), rescaled at every level
+
+        Returns
+        -------
+        light : numpy.ndarray, (n,)
+            Index into the LightTable
+        pdf : numpy.ndarray, (n,)
+            Probability of having picked that light
+        """
+        n = len(points)
+        nodes = np.zeros(n, dtype=np.int64)
+        pdf = np.ones(n)
+        u = np.array(u, dtype=np.float64)
+        inner = np.nonzero(self.node_light[nodes] < 0)[0]
+        while len(inner):
+            p_left = self._left_probability(nodes[inner], points[inner], normals[inner])
+            go_left = u[inner] < p_left
+            p = np.where(go_left, p_left, 1 - p_left)
+            # reuse the random number for the next level
+            u[inner] = np.where(go_left, u[inner], u[inner] - p_left) / np.where(p > 0, p, 1)
+            u[inner] = np.minimum(u[inner], np.nextafter(1, 0))
+            pdf[inner] *= p
+            nodes[inner] = self.node_offset[nodes[inner]] + np.where(go_left, 0, 1)
+            inner = inner[self.node_light[nodes[inner]] < 0]
+        return self.node_light[nodes], pdf
+
+    def pdf(self, light, points, normals):
+        """Probability that sample() picks the given lights for the hits"""
+        nodes = self.leaf[np.asarray(light)]
+        pdf = np.ones(len(points))
+        rows = np.nonzero(self.node_parent[nodes] >= 0)[0]
+        while len(rows):
+            parent = self.node_parent[nodes[rows]]
+            p_left = self._left_probability(parent, points[rows], normals[rows])
+            is_left = nodes[rows] == self.node_offset[parent]
+            pdf[rows] *= np.where(is_left, p_left, 1 - p_left)
+            nodes[rows] = parent
+            rows = rows[self.node_parent[nodes[rows]] >= 0]
+        return pdf
+
+
+def _merge_cones(axis_a, theta_a, axis_b, theta_b):
+    """smallest cone (axis, half angle) holding two cones of directions"""
+    if theta_b > theta_a:
+        axis_a, theta_a, axis_b, theta_b = axis_b, theta_b, axis_a, theta_a
+    theta_d = np.arccos(np.clip(np.dot(axis_a, axis_b), -1, 1))
+    if min(theta_d + theta_b, pi) <= theta_a:
+        return axis_a, theta_a
+    theta_o = (theta_a + theta_d + theta_b) / 2
+    if theta_o >= pi:
+        return axis_a, pi
+    # rotate axis_a towards axis_b by theta_o - theta_a
+    rotate = theta_o - theta_a
+    ortho = axis_b - np.dot(axis_a, axis_b) * axis_a
+    length = np.linalg.norm(ortho)
+    if length < 1e-12:
+        return axis_a, pi
+    axis = np.cos(rotate) * axis_a + np.sin(rotate) * ortho / length
+    return axis, theta_o
+
+
+def light_groups(lights, tree, samples, points, normals, rng):
+    """Lights to shade a batch of hits with
+
+    Every light for every hit without a tree, else `samples` lights per
+    hit picked from the tree, weighted by 1 / (samples * pdf).
+
+    Parameters
+    ----------
+    lights : LightTable
+    tree : LightTree or None
+    samples : int
+        Lights picked per hit from the tree
+    points : numpy.ndarray, (n, 3)
+    normals : numpy.ndarray, (n, 3)
+    rng : SampleStream or RandomStream
+        Picks come from the PICK dimensions; the stream is left at the
+        start of the LIGHT ones for the lights' own samples
+
+    Returns
+    -------
+    groups : list of (light, rows, weight)
+        numpy.ndarray, (m,) each: the light shading each of the hits in
+        rows (every hit at most once per group) and the weight of its
+        contribution
+    """
+    n = len(points)
+    every = np.arange(n)
+    if tree is None or len(lights) == 0:
+        rng.start(LIGHT)
+        return [(np.full(n, i), every, np.ones(n)) for i in range(len(lights))]
+    groups = []
+    rng.start(PICK)
+    for _ in range(samples):
+        light, pdf = tree.sample(points, normals, rng.random(n))
+        groups.append((light, every, 1 / (samples * pdf)))
+    rng.start(LIGHT)
+    return groups
@@ -0,0 +1,77 @@
+#  simpleRT_materials.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Material table built once per render: the ObjectSettings
+#  (simpleRT_material) of every mesh object as structure-of-arrays buffers
+#  indexed by object id, so shading a hit is an array lookup instead of
+#  RNA property reads, and a batch of hits gathers its materials with one
+#  fancy index.
+
+import numpy as np
+
+
+class MaterialTable:
+    """Per-render copy of the simpleRT_material of every object
+
+    Parameters
+    ----------
+    objects : list
+        Mesh objects; their position in the list is their object id
+
+    Attributes
+    ----------
+    index : dict
+        Object name -> object id, for hits reported as objects
+    diffuse_color : numpy.ndarray, (M, 3)
+    specular_color : numpy.ndarray, (M, 3)
+    specular_hardness : numpy.ndarray, (M,)
+    use_fresnel : numpy.ndarray of bool, (M,)
+    mirror_reflectivity : numpy.ndarray, (M,)
+    ior : numpy.ndarray, (M,)
+    transmission : numpy.ndarray, (M,)
+    """
+
+    def __init__(self, objects):
+        objects = list(objects)
+        self.index = {obj.name: i for i, obj in enumerate(objects)}
+        mats = [obj.simpleRT_material for obj in objects]
+        self.diffuse_color = np.array(
+            [m.diffuse_color[:3] for m in mats], dtype=np.float64
+        ).reshape(-1, 3)
+        self.specular_color = np.array(
+            [m.specular_color[:3] for m in mats], dtype=np.float64
+        ).reshape(-1, 3)
+        self.specular_hardness = np.array(
+            [m.specular_hardness for m in mats], dtype=np.float64
+        )
+        self.use_fresnel = np.array([m.use_fresnel for m in mats], dtype=bool)
+        self.mirror_reflectivity = np.array(
+            [m.mirror_reflectivity for m in mats], dtype=np.float64
+        )
+        self.ior = np.array([m.ior for m in mats], dtype=np.float64)
+        self.transmission = np.array([m.transmission for m in mats], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.index)
+
+    def reflectivity(self, mat, d_dot_n):
+        """Mirror reflectivity of a batch of hits
+
+        Parameters
+        ----------
+        mat : numpy.ndarray, (n,)
+            Material of every hit
+        d_dot_n : numpy.ndarray, (n,)
+            Cosine between the ray direction and the normal facing it (<= 0)
+
+        Returns
+        -------
+        reflectivity : numpy.ndarray, (n,)
+            Schlick's Fresnel term where use_fresnel is set, else
+            mirror_reflectivity
+        """
+        ior = self.ior[mat]
+        r0 = ((1 - ior) / (1 + ior)) ** 2
+        fresnel = r0 + (1 - r0) * (1 + d_dot_n) ** 5
+        return np.where(self.use_fresnel[mat], fresnel, self.mirror_reflectivity[mat])
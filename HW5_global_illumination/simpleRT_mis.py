@@ -0,0 +1,175 @@
+#  simpleRT_mis.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Direct lighting with multiple importance sampling. For every area
+#  light, a hit takes one sample on the light (next event estimation) and
+#  one direction from the Blinn-Phong BSDF that is intersected with the
+#  light disk; both are weighted with the balance or power heuristic over
+#  their solid angle pdfs. Light sampling handles small lights and diffuse
+#  surfaces well, BSDF sampling handles sharp highlights of large lights.
+#
+#  An area light of intensity I and area A acts as a one-sided emitter of
+#  radiance I / A, which makes the light sampling estimate exactly the one
+#  of RT_trace_ray. Point lights are only reachable by light sampling.
+
+import numpy as np
+
+from simpleRT_bsdf import (
+    blinn_phong, blinn_phong_pdf, cosine_pdf, sample_blinn_phong, sample_diffuse,
+)
+from simpleRT_lighttree import light_groups
+
+
+# small offset to prevent self-occlusion for shadow rays
+EPS = 1e-3
+
+
+def balance_heuristic(pdf, other_pdf):
+    """MIS weight of a sample drawn with pdf when the other technique has other_pdf"""
+    total = pdf + other_pdf
+    return np.where(total > 0, pdf / np.where(total > 0, total, 1), 0.0)
+
+
+def power_heuristic(pdf, other_pdf):
+    """MIS weight with the power heuristic (exponent 2)"""
+    return balance_heuristic(pdf * pdf, other_pdf * other_pdf)
+
+
+HEURISTICS = {"BALANCE": balance_heuristic, "POWER": power_heuristic}
+
+
+def direct_light(lights, occluded, loc, norm, ray_dir, diffuse, specular, hardness,
+                 rng, heuristic="POWER", tree=None, light_samples=1):
+    """MIS estimate of the direct light at a batch of hits
+
+    Parameters
+    ----------
+    lights : LightTable
+    occluded : callable
+        occluded(origins, directions, t_max) -> bool array, the shadow query
+    loc : numpy.ndarray, (n, 3)
+        Hit locations
+    norm : numpy.ndarray, (n, 3)
+        Unit normals, facing the incoming ray
+    ray_dir : numpy.ndarray, (n, 3)
+        Unit directions of the incoming rays
+    diffuse, specular : numpy.ndarray, (n, 3)
+    hardness : numpy.ndarray, (n,)
+        Material of every hit
+    rng : SampleStream or RandomStream
+        Source of the random numbers, see simpleRT_sampler.py
+    heuristic : str
+        Key of HEURISTICS
+    tree : LightTree or None
+        Shade light_samples lights per hit picked from the tree instead of
+        every light; both techniques of a picked light are divided by the
+        probability of picking it, which leaves their MIS weights unchanged
+    light_samples : int
+
+    Returns
+    -------
+    color : numpy.ndarray, (n, 3)
+    lit : numpy.ndarray of bool, (n,)
+        Whether the light sample of any light was unoccluded, RT_trace_ray
+        adds the ambient color to the other hits
+    """
+    n = len(loc)
+    color = np.zeros((n, 3))
+    lit = np.zeros(n, dtype=bool)
+
+    # BSDF sampling picks the diffuse or the specular lobe by their weight
+    diffuse_weight = diffuse.max(axis=1)
+    lobe_weight = diffuse_weight + specular.max(axis=1)
+    p_diffuse = np.where(
+        lobe_weight > 0, diffuse_weight / np.where(lobe_weight > 0, lobe_weight, 1), 1.0
+    )
+
+    weight = HEURISTICS[heuristic]
+    groups = light_groups(lights, tree, light_samples, loc, norm, rng)
+    for light, rows, scale in groups:
+        area = lights.is_area[light]
+        # point lights can only be sampled
+        point_rows = rows[~area]
+        if len(point_rows):
+            light_color, visible = _point_light(
+                lights, light[~area], occluded, loc[point_rows], norm[point_rows],
+                ray_dir[point_rows], diffuse[point_rows], specular[point_rows],
+                hardness[point_rows],
+            )
+            color[point_rows] += light_color * scale[~area, None]
+            lit[point_rows] |= visible
+        area_rows = rows[area]
+        if len(area_rows):
+            light_color, visible = _area_light(
+                lights, light[area], occluded, loc[area_rows], norm[area_rows],
+                ray_dir[area_rows], diffuse[area_rows], specular[area_rows],
+                hardness[area_rows], p_diffuse[area_rows], rng, weight,
+            )
+            color[area_rows] += light_color * scale[area, None]
+            lit[area_rows] |= visible
+    return color, lit
+
+
+def _point_light(lights, light, occluded, loc, norm, ray_dir, diffuse, specular, hardness):
+    """light sampling of one point light per hit, and whether it is visible"""
+    light_vec = lights.position[light] - loc
+    dist = np.linalg.norm(light_vec, axis=1)
+    light_dir = light_vec / dist[:, None]
+    visible = ~occluded(loc + norm * EPS, light_dir, dist)
+    f = blinn_phong(norm, -ray_dir, light_dir, diffuse, specular, hardness)
+    i_light = lights.intensity[light] / (dist ** 2)[:, None]
+    return np.where(visible[:, None], f * i_light, 0), visible
+
+
+def _area_light(lights, light, occluded, loc, norm, ray_dir, diffuse, specular, hardness,
+                p_diffuse, rng, weight):
+    """MIS estimate of one area light per hit, and whether its light sample is visible"""
+    n = len(loc)
+    view = -ray_dir
+    shadow_orig = loc + norm * EPS
+    area = lights.area[light]
+    radiance = lights.intensity[light] / area[:, None]
+    # a disk point, a BSDF direction and the lobe choice
+    u = rng.random((5, n))
+
+    def bsdf_pdf(rows, direction):
+        # pdf of the lobe mixture, for the hits in rows
+        p = p_diffuse[rows]
+        specular_pdf = blinn_phong_pdf(norm[rows], view[rows], hardness[rows], direction)
+        return p * cosine_pdf(norm[rows], direction) + (1 - p) * specular_pdf
+
+    # light sampling: a point uniform on the disk
+    light_loc = lights.disk_points(light, 2 * np.pi * u[0], u[1])
+    light_vec = light_loc - loc
+    dist = np.linalg.norm(light_vec, axis=1)
+    light_dir = light_vec / dist[:, None]
+    cos_light = -np.einsum("ij,ij->i", light_dir, lights.normal[light])
+    visible = ~occluded(shadow_orig, light_dir, dist)
+    front = visible & (cos_light > 0)
+    # solid angle pdf of the light sample
+    pdf_light = dist ** 2 / (area * np.where(front, cos_light, 1))
+    f = blinn_phong(norm, view, light_dir, diffuse, specular, hardness)
+    w = weight(pdf_light, bsdf_pdf(np.arange(n), light_dir))
+    color = np.where(front[:, None], radiance * f * (w / pdf_light)[:, None], 0)
+
+    # BSDF sampling: the rays that reach the light disk
+    diffuse_dir, _ = sample_diffuse(norm, u[2], u[3])
+    specular_dir = sample_blinn_phong(norm, view, hardness, u[2], u[3])
+    bsdf_dir = np.where((u[4] < p_diffuse)[:, None], diffuse_dir, specular_dir)
+    t, cos_light = lights.intersect_disk(light, shadow_orig, bsdf_dir)
+    rows = np.nonzero(np.isfinite(t))[0]
+    if len(rows) == 0:
+        return color, visible
+    bsdf_dir, t, cos_light = bsdf_dir[rows], t[rows], cos_light[rows]
+    pdf_bsdf = bsdf_pdf(rows, bsdf_dir)
+    hit_light = (pdf_bsdf > 0) & ~occluded(shadow_orig[rows], bsdf_dir, t)
+    pdf_light = t ** 2 / (area[rows] * cos_light)
+    f = blinn_phong(
+        norm[rows], view[rows], bsdf_dir, diffuse[rows], specular[rows], hardness[rows]
+    )
+    w = weight(pdf_bsdf, pdf_light)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        contribution = radiance[rows] * f * (w / pdf_bsdf)[:, None]
+    color[rows] += np.where(hit_light[:, None], contribution, 0)
+    return color, visible
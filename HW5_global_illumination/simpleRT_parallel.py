@@ -0,0 +1,169 @@
+#  simpleRT_parallel.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Multi-process tile renderer: the frame is split into tiles that a pool
+#  of worker processes renders with the wavefront tracer. Every worker gets
+#  its own read-only copy of the tracer (scene snapshot, BVH, materials)
+#  once, and accumulates its tiles straight into a shared-memory frame the
+#  engine reads for display.
+#
+#  The workers import this module by name, so the HW5 folder must be on
+#  sys.path (as for an installed add-on), not only loaded as Blender texts.
+
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from simpleRT_adaptive import (
+    ACCUM_CHANNELS, AOV_CHANNELS, COUNT, add_samples, pixel_samples, sample_rounds,
+)
+from simpleRT_stats import CAMERA, RayStats
+from simpleRT_tiles import TILE_SIZE, make_tiles
+
+
+# set in every worker by _init_worker()
+_worker = {}
+
+
+def _init_worker(tracer, shm_name, shape, depth, samples, sampler, seed, adaptive):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker.update(
+        tracer=tracer,
+        shm=shm,
+        frame=np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+        depth=depth,
+        samples=samples,
+        sampler=sampler,
+        seed=seed,
+        adaptive=adaptive,
+    )
+
+
+def render_tile(tracer, frame, tile, depth, samples, sampler, seed, adaptive=None, first=0):
+    """Render all the samples of one tile into the accumulation frame
+
+    The random numbers of a tile only depend on the seed, the tile
+    position and the index of its next sample, so the result does not
+    depend on which process renders which tile, nor in which order.
+
+    Parameters
+    ----------
+    tracer : WavefrontTracer
+    frame : numpy.ndarray, (height, width, ACCUM_CHANNELS)
+        Accumulation buffer of the frame, see simpleRT_adaptive.py
+    tile : (x, y, w, h)
+    depth : int
+    samples : int
+    sampler : Sampler
+        Per-pixel samples, see simpleRT_sampler.py
+    seed : int
+        Seed of the RANDOM sampler
+    adaptive : None or (min_samples, threshold)
+        Sample the tile adaptively, see AdaptiveSampler
+    first : int
+        Sample index the frame starts at, see pixel_samples()
+    """
+    x, y, w, h = tile
+    height, width = frame.shape[:2]
+    accum = frame[y:y + h, x:x + w]
+    # a resumed tile must not draw the random numbers of its first samples
+    # again, nor the ranges of a distributed render each other's
+    offset = int(accum[:, :, COUNT].sum()) + first * w * h
+    tracer.rng = np.random.default_rng((seed, x, y) + ((offset,) if offset else ()))
+    for pixels in sample_rounds(accum, samples, adaptive):
+        paths, offsets = pixel_samples(
+            accum, pixels, tile, width, sampler, tracer.rng, first
+        )
+        origins, directions = tracer.snapshot.camera.rays(width, height, offsets, tile)
+        aovs = np.zeros((len(pixels), AOV_CHANNELS))
+        stats = tracer.snapshot.stats
+        if stats is None:
+            color = tracer.trace(origins[pixels], directions[pixels], depth, paths, aovs)
+        else:
+            start = time.perf_counter()
+            color = tracer.trace(origins[pixels], directions[pixels], depth, paths, aovs)
+            stats.trace_seconds += time.perf_counter() - start
+            stats.count(CAMERA, len(pixels))
+        add_samples(accum, pixels, color, aovs)
+
+
+def _render_task(task):
+    w = _worker
+    # the rays of this tile only, the engine adds them to its own counters
+    snapshot = w["tracer"].snapshot
+    if snapshot.stats is not None:
+        snapshot.stats = RayStats()
+    render_tile(
+        w["tracer"], w["frame"], task,
+        w["depth"], w["samples"], w["sampler"], w["seed"], w["adaptive"],
+    )
+    return task, snapshot.stats
+
+
+def render_tiles(tracer, width, height, depth, samples, sampler, workers,
+                 tile_size=TILE_SIZE, seed=0, tiles=None, adaptive=None, accum=None):
+    """Render a frame tile by tile in a pool of worker processes
+
+    A generator: after each finished tile it yields (done, total, tile,
+    frame), where frame is the (height, width, ACCUM_CHANNELS) shared
+    accumulation buffer. Workers keep writing into it, so copy what is
+    needed before the next step. The shared memory is released when the
+    generator is exhausted or closed.
+
+    Parameters
+    ----------
+    tracer : WavefrontTracer
+        Copied once into every worker; build the BVH before calling. The
+        ray counters of the workers are merged into its snapshot's stats
+    width : int
+    height : int
+    depth : int
+    samples : int
+    sampler : Sampler
+        Per-pixel samples, see simpleRT_sampler.py
+    workers : int
+        Number of processes; 0 renders in the calling process
+    tile_size : int
+    seed : int
+        The image only depends on the seed, not on the number of workers
+    tiles : None or list of (x, y, w, h)
+        Tiles to render in that order, make_tiles() by default
+    adaptive : None or (min_samples, threshold)
+        Sample every tile adaptively, see AdaptiveSampler
+    accum : None or numpy.ndarray, (height, width, ACCUM_CHANNELS)
+        Samples taken before (a resumed render), the frame starts from them
+    """
+    if tiles is None:
+        tiles = make_tiles(width, height, tile_size)
+    shape = (height, width, ACCUM_CHANNELS)
+
+    if workers <= 0:
+        frame = np.zeros(shape) if accum is None else accum.copy()
+        for done, tile in enumerate(tiles, 1):
+            render_tile(tracer, frame, tile, depth, samples, sampler, seed, adaptive)
+            yield done, len(tiles), tile, frame
+        return
+
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        frame = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        frame[:] = 0 if accum is None else accum
+        with multiprocessing.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(
+                tracer, shm.name, shape, depth, samples, sampler, seed, adaptive
+            ),
+        ) as pool:
+            for done, (tile, stats) in enumerate(pool.imap_unordered(_render_task, tiles), 1):
+                if stats is not None:
+                    tracer.snapshot.stats.merge(stats)
+                yield done, len(tiles), tile, frame
+    finally:
+        # the view must go before the buffer can be closed
+        frame = None
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,322 @@
+#  simpleRT_photons.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Caustic photon map, after Jensen, "Global Illumination using Photon
+#  Maps" (EGWR 1996). Shadow rays stop at glass and mirrors and no eye
+#  path ever reaches a light, so light focused on a diffuse surface by
+#  specular bounces (light - specular+ - diffuse paths) is missing from
+#  every other estimator. Photons are shot from the lights, followed
+#  through mirror reflection and transmission, and stored where they land
+#  on a diffuse surface after at least one specular bounce; the caustic at
+#  a hit is the density of the photons around it.
+#
+#  Photons are only aimed at the bounding sphere of the specular geometry,
+#  since no other photon can become a caustic. The map is progressive in
+#  the way of Knaus and Zwicker, "Progressive Photon Mapping: A
+#  Probabilistic Approach" (TOG 2011): every pass shoots its own photons
+#  and gathers them in a radius shrinking from pass to pass, and the
+#  estimate is the average of the passes, so the blur of the caustic goes
+#  away as passes are added while the noise stays bounded.
+
+from math import pi
+
+import numpy as np
+
+from simpleRT_bsdf import to_world
+
+
+# small offset to prevent self-occlusion for the bounced photons
+EPS = 1e-3
+# specular bounces a photon is followed through
+MAX_BOUNCES = 8
+# gather radius of the first pass when none is given, in scene sizes
+RADIUS_FRACTION = 0.005
+# Knaus and Zwicker's alpha: the fraction of the radius area kept per pass
+ALPHA = 2 / 3
+# photons farther from the tangent plane of a hit are not gathered, in radii
+PLANE_TOLERANCE = 0.25
+# hits gathered together; bounded so the pair arrays stay small
+CHUNK_SIZE = 1 << 12
+# offsets of a grid cell and its 26 neighbors
+NEIGHBORS = np.array(list(np.ndindex(3, 3, 3))) - 1
+
+
+class PhotonMap:
+    """Stored photons in a uniform hash grid
+
+    Parameters
+    ----------
+    position : numpy.ndarray, (P, 3)
+        Where the photons landed
+    direction : numpy.ndarray, (P, 3)
+        Unit direction they arrived along
+    power : numpy.ndarray, (P, 3)
+        Irradiance every photon adds within its radius: its flux over the
+        disk area of its pass and the number of passes
+    radius : numpy.ndarray, (P,)
+        Gather radius of the pass of every photon
+
+    Attributes
+    ----------
+    cell_size : float
+        Edge of the grid cells, the largest radius, so a gather only looks
+        at the 27 cells around the hit
+    """
+
+    def __init__(self, position, direction, power, radius):
+        self.cell_size = float(radius.max()) if len(radius) else 1.0
+        self.origin = position.min(axis=0) if len(position) else np.zeros(3)
+        cell = self._cells(position)
+        # one row of cells of padding on every side, for the neighbors
+        self.shape = cell.max(axis=0, initial=0) + 3
+        key = self._keys(cell + 1)
+        order = np.argsort(key, kind="stable")
+        self.key = key[order]
+        self.position = position[order]
+        self.direction = direction[order]
+        self.power = power[order]
+        self.radius = radius[order]
+
+    def __len__(self):
+        return len(self.key)
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def _keys(self, cell):
+        return (cell[:, 0] * self.shape[1] + cell[:, 1]) * self.shape[2] + cell[:, 2]
+
+    def irradiance(self, points, normals):
+        """Caustic irradiance at a batch of hits
+
+        Parameters
+        ----------
+        points : numpy.ndarray, (n, 3)
+        normals : numpy.ndarray, (n, 3)
+            Unit normals, facing the incoming ray
+
+        Returns
+        -------
+        irradiance : numpy.ndarray, (n, 3)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        normals = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+        irradiance = np.zeros((len(points), 3))
+        if len(self) == 0:
+            return irradiance
+        for start in range(0, len(points), CHUNK_SIZE):
+            rows = slice(start, start + CHUNK_SIZE)
+            irradiance[rows] = self._gather(points[rows], normals[rows])
+        return irradiance
+
+    def _gather(self, points, normals):
+        """sum the power of the photons around every hit"""
+        total = np.zeros((len(points), 3))
+        # the 27 cells around every hit, out of the grid ones dropped
+        neighbor = (self._cells(points) + 1)[:, None] + NEIGHBORS
+        query = np.broadcast_to(np.arange(len(points))[:, None], neighbor.shape[:2])
+        inside = np.all((neighbor >= 0) & (neighbor < self.shape), axis=2)
+        query, key = query[inside], self._keys(neighbor[inside])
+        first = np.searchsorted(self.key, key, side="left")
+        counts = np.searchsorted(self.key, key, side="right") - first
+        if counts.sum() == 0:
+            return total
+        pair = np.repeat(query, counts)
+        rank = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        photon = np.repeat(first, counts) + rank
+
+        to_photon = self.position[photon] - points[pair]
+        radius = self.radius[photon]
+        normal = normals[pair]
+        # inside the disk of the pass, on the lit side of the surface and
+        # close to its tangent plane
+        use = (
+            (np.einsum("ij,ij->i", to_photon, to_photon) < radius ** 2)
+            & (np.einsum("ij,ij->i", self.direction[photon], normal) < 0)
+            & (np.abs(np.einsum("ij,ij->i", to_photon, normal)) < PLANE_TOLERANCE * radius)
+        )
+        np.add.at(total, pair[use], self.power[photon[use]])
+        return total
+
+
+def specular_bounds(snapshot):
+    """Bounding sphere (center, radius) of the mirror and glass triangles, or None"""
+    m = snapshot.materials
+    specular = (m.mirror_reflectivity > 0) | (m.transmission > 0) | m.use_fresnel
+    if len(snapshot.triangles) == 0 or not specular.any():
+        return None
+    vertices = snapshot.triangles[specular[snapshot.tri_object]].reshape(-1, 3)
+    if len(vertices) == 0:
+        return None
+    lo, hi = vertices.min(axis=0), vertices.max(axis=0)
+    center = (lo + hi) / 2
+    return center, float(np.linalg.norm(vertices - center, axis=1).max())
+
+
+def _cone(origins, center, radius):
+    """axis and cosine of the half angle of the cones from origins around a sphere
+
+    The whole sphere of directions (cosine -1) from points inside it.
+    """
+    to_center = center - origins
+    dist = np.linalg.norm(to_center, axis=1)
+    outside = dist > radius
+    axis = to_center / np.where(dist > 0, dist, 1)[:, None]
+    ratio = radius / np.where(outside, dist, 1)
+    cos_max = np.where(outside, np.sqrt(np.maximum(1 - ratio ** 2, 0)), -1.0)
+    return axis, cos_max
+
+
+def emit_photons(lights, count, target, rng):
+    """Photons leaving the lights towards a sphere
+
+    Lights are picked in proportion to their brightest channel times the
+    solid angle of the target seen from them; the direction of a photon
+    is uniform in the cone around the target seen from its origin.
+
+    Parameters
+    ----------
+    lights : LightTable
+    count : int
+    target : (numpy.ndarray (3,), float)
+        Center and radius of the sphere
+    rng : numpy.random.Generator
+
+    Returns
+    -------
+    origins, directions, flux : numpy.ndarray, (count, 3)
+        Flux of every photon, the light it carries
+    """
+    center, radius = target
+    _, cos_max = _cone(lights.position, center, radius)
+    solid_angle = 2 * pi * (1 - cos_max)
+    weight = lights.intensity.max(axis=1, initial=0) * solid_angle
+    if len(lights) == 0 or weight.sum() <= 0:
+        return np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 3))
+    pick = weight / weight.sum()
+    light = rng.choice(len(lights), size=count, p=pick)
+
+    u = rng.random((4, count))
+    origins = lights.disk_points(light, 2 * pi * u[0], u[1])
+    axis, cos_max = _cone(origins, center, radius)
+    cos_theta = 1 - u[2] * (1 - cos_max)
+    sin_theta = np.sqrt(np.maximum(1 - cos_theta ** 2, 0))
+    phi = 2 * pi * u[3]
+    local = np.stack((sin_theta * np.cos(phi), sin_theta * np.sin(phi), cos_theta), axis=1)
+    directions = to_world(local, axis)
+
+    # radiant intensity towards the photon, I cos(theta) for area lights,
+    # over the density of its light and direction
+    emit = np.einsum("ij,ij->i", directions, lights.normal[light])
+    emit = np.where(lights.is_area[light], np.maximum(emit, 0), 1)
+    solid_angle = 2 * pi * (1 - cos_max)
+    flux = lights.intensity[light] * (emit * solid_angle / (count * pick[light]))[:, None]
+    return origins, directions, flux
+
+
+def trace_photons(snapshot, count, rng, max_bounces=MAX_BOUNCES):
+    """Shoot count photons and keep the ones landing as caustics
+
+    At every hit a photon is stored if it was bounced specularly before and
+    the surface is diffuse, then goes on by mirror reflection or by
+    transmission with the probability of their weights, or is absorbed.
+    The weights are the ones RT_trace_ray gives the two rays, so the flux
+    of the surviving photons does not change.
+
+    Returns
+    -------
+    position, direction, flux : numpy.ndarray, (P, 3)
+        The stored photons, see PhotonMap
+    """
+    empty = np.zeros((0, 3))
+    target = specular_bounds(snapshot)
+    if target is None:
+        return empty, empty, empty
+    origins, directions, flux = emit_photons(snapshot.light_table, count, target, rng)
+    m = snapshot.materials
+    specular = np.zeros(len(origins), dtype=bool)
+    stored = [], [], []
+    for _ in range(max_bounces + 1):
+        if len(origins) == 0:
+            break
+        tri, t = snapshot.intersect(origins, directions)
+        ray = np.nonzero(tri >= 0)[0]
+        tri, directions, flux, specular = tri[ray], directions[ray], flux[ray], specular[ray]
+        loc = origins[ray] + t[ray, None] * directions
+        norm = snapshot.normals[tri]
+        d_dot_n = np.einsum("ij,ij->i", norm, directions)
+        inside = d_dot_n > 0
+        norm = np.where(inside[:, None], -norm, norm)
+        d_dot_n = -np.abs(d_dot_n)
+        mat = snapshot.tri_object[tri]
+
+        store = specular & (m.diffuse_color[mat].max(axis=1) > 0)
+        for array, value in zip(stored, (loc, directions, flux)):
+            array.append(value[store])
+
+        # Russian roulette between reflection, transmission and absorption
+        reflectivity = m.reflectivity(mat, d_dot_n)
+        transmission = (1 - reflectivity) * m.transmission[mat]
+        ior_ratio = np.where(inside, m.ior[mat], 1 / m.ior[mat])
+        under_sqrt = 1 - ior_ratio ** 2 * (1 - d_dot_n ** 2)
+        # total internal reflection ends the transmitted ray, as in RT_trace_ray
+        transmission = np.where(under_sqrt > 0, transmission, 0)
+        u = rng.random(len(mat))
+        reflect = u < reflectivity
+        refract = ~reflect & (u < reflectivity + transmission)
+
+        reflect_dir = directions - 2 * norm * d_dot_n[:, None]
+        refract_dir = (
+            ior_ratio[:, None] * (directions - d_dot_n[:, None] * norm)
+            - norm * np.sqrt(np.maximum(under_sqrt, 0))[:, None]
+        )
+        directions = np.where(reflect[:, None], reflect_dir, refract_dir)
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        origins = loc + np.where(reflect, EPS, -EPS)[:, None] * norm
+
+        alive = reflect | refract
+        origins, directions, flux = origins[alive], directions[alive], flux[alive]
+        specular = np.ones(int(alive.sum()), dtype=bool)
+    return tuple(np.concatenate(array) if array else empty for array in stored)
+
+
+def build_photon_map(snapshot, photons=50000, passes=4, radius=None, alpha=ALPHA, seed=0):
+    """Trace the photon passes of a render
+
+    Parameters
+    ----------
+    snapshot : SceneSnapshot
+    photons : int
+        Photons shot per pass
+    passes : int
+    radius : float or None
+        Gather radius of the first pass, RADIUS_FRACTION of the scene size
+        by default; pass i + 1 gathers in r_i * sqrt((i + alpha) / (i + 1))
+    alpha : float
+    seed : int
+
+    Returns
+    -------
+    PhotonMap
+    """
+    if radius is None:
+        if len(snapshot.triangles):
+            extent = snapshot.triangles.max(axis=(0, 1)) - snapshot.triangles.min(axis=(0, 1))
+        else:
+            extent = np.ones(3)
+        radius = RADIUS_FRACTION * float(np.max(extent))
+    rng = np.random.default_rng(seed)
+    position, direction, power, gather = [], [], [], []
+    radius2 = radius ** 2
+    for i in range(passes):
+        p, d, flux = trace_photons(snapshot, photons, rng)
+        position.append(p)
+        direction.append(d)
+        power.append(flux / (passes * pi * radius2))
+        gather.append(np.full(len(p), np.sqrt(radius2)))
+        radius2 *= (i + 1 + alpha) / (i + 2)
+    return PhotonMap(
+        np.concatenate(position), np.concatenate(direction), np.concatenate(power),
+        np.concatenate(gather),
+    )
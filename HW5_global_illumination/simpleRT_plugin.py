@@ -19,239 +19,553 @@ bl_info = {
 
 import bpy
 import numpy as np
-from mathutils import Vector, Matrix
-from math import sqrt, pi, cos, sin
-import math, random
-
-def ray_cast(scene, origin, direction):
-    return scene.ray_cast(scene.view_layers[0].depsgraph, origin, direction)
-
-
-def RT_trace_ray(scene, ray_orig, ray_dir, lights, depth=0):
-    # First, we cast a ray into the scene using Blender's built-in function
-    has_hit, hit_loc, hit_norm, _, hit_obj, _ = ray_cast(scene, ray_orig, ray_dir)
-    # set initial color (black) for the pixel
+from mathutils import Vector
+from math import sqrt
+import shutil
+import time
+
+from simpleRT_adaptive import (
+    ACCUM_CHANNELS, AOV_ALBEDO, AOV_CHANNELS, AOV_DEPTH, AOV_NORMAL, COUNT,
+    add_samples, pixel_samples, resolve, resolve_aovs, sample_rounds,
+)
+from simpleRT_bsdf import DIFFUSE_BRDF, sample_diffuse
+from simpleRT_checkpoint import load_checkpoint, render_key, save_checkpoint
+from simpleRT_denoise import denoise_accum
+from simpleRT_distributed import collect, split_tasks, start_workers, submit
+from simpleRT_irradiance import prepass
+from simpleRT_lighttree import light_groups
+from simpleRT_mis import direct_light
+from simpleRT_sampler import BSDF, ROULETTE, RandomStream, Sampler
+from simpleRT_scene import snapshot_scene
+from simpleRT_stats import CAMERA, DIFFUSE, REFLECTION, REFRACTION, RayStats, StageTimer
+from simpleRT_parallel import render_tiles
+from simpleRT_tiles import make_tiles
+from simpleRT_wavefront import WavefrontTracer
+
+def ray_cast(snapshot, origin, direction):
+    if snapshot.bvh is None:
+        return snapshot.ray_cast(origin, direction)
+    # the BVH answers with NumPy arrays, shading expects mathutils types
+    has_hit, hit_loc, hit_norm, index, hit_obj, matrix = snapshot.ray_cast(
+        origin, direction
+    )
+    return has_hit, Vector(hit_loc), Vector(hit_norm), index, hit_obj, matrix
+
+
+def survival_probability(throughput, depth, roulette_depth=None):
+    # Russian roulette: chance that a bounce ray of this throughput is traced,
+    # played only once the remaining depth drops to roulette_depth
+    if roulette_depth is None or depth > roulette_depth:
+        return 1.0
+    return min(float(np.max(throughput)), 1.0)
+
+
+def RT_direct_light(snapshot, lights, hit_loc, hit_norm, ray_dir, mat, mis=None, rng=None):
+    # direct lighting at a hit (Blinn-Phong, one shadow ray per light),
+    # or the ambient color when no light reaches it. With mis set to a
+    # heuristic name, area lights are also hit by BSDF samples, see
+    # simpleRT_mis.py. rng is the sample stream of the path
+    if rng is None:
+        rng = RandomStream(np.random)
+    if mis is not None:
+        return RT_direct_light_mis(
+            snapshot, lights, hit_loc, hit_norm, ray_dir, mat, mis, rng
+        )
     color = np.zeros(3)
-    # if the ray hits nothing in the scene, return black
-    if not has_hit:
-        return color
     # small offset to prevent self-occlusion for secondary rays
     eps = 1e-3
-    # fix normal direction
-    ray_inside_object = False
-    if hit_norm.dot(ray_dir) > 0:
-        hit_norm = -hit_norm
-        ray_inside_object = True
-
     # get the ambient color of the scene
-    ambient_color = scene.simpleRT.ambient_color
-    # get the material of the object we hit
-    mat = hit_obj.simpleRT_material
-    # extract properties from the material
-    diffuse_color = Vector(mat.diffuse_color).xyz
-    specular_color = Vector(mat.specular_color).xyz
-    specular_hardness = mat.specular_hardness
+    ambient_color = snapshot.ambient_color
+    # extract properties from the material table
+    materials = snapshot.materials
+    diffuse_color = materials.diffuse_color[mat]
+    specular_color = materials.specular_color[mat]
+    specular_hardness = materials.specular_hardness[mat]
 
     # set flag for light hit. Will later be used to apply ambient light
     no_light_hit = True
 
-    # iterate through all the lights in the scene
-    for light in lights:
-        # get light color
-        light_color = np.array(light.data.color * light.data.energy / 4 / pi)
-        light_loc = light.location
+    # iterate through all the lights in the scene, read from the light table,
+    # or through the ones picked from the light tree, divided by their pdf
+    groups = light_groups(
+        lights, snapshot.light_tree, snapshot.light_samples,
+        np.array([hit_loc]), np.array([hit_norm]), rng,
+    )
+    for light, _, scale in groups:
+        i = int(light[0])
+        # get light color (color * energy / 4 / pi)
+        light_color = lights.intensity[i] * scale[0]
+        light_loc = Vector(lights.position[i])
 
         """one point sampling for area light"""
-        if light.data.type == "AREA":
-            # Sample a random point on the area light in its local space
-            theta = np.random.uniform(0, 2 * np.pi)
-            r = np.random.uniform(0, 1)
-            x = sqrt(r) * cos(theta)
-            y = sqrt(r) * sin(theta)
-            z = 0
-            sample_local = Vector((x, y, z)) * (light.data.size / 2)
-
-            # Transform the sampled point into world space
-            light_loc = light.matrix_world @ sample_local
-
-            # Compute the light's emission normal in world space
-            light_normal = Vector((0, 0, -1))
-            light_normal.rotate(light.rotation_euler)
-            
-            # Now compute the cosine factor using the sampled light location.
-            cos_theta = (hit_loc - light_loc).normalized().dot(light_normal)
+        if lights.is_area[i]:
+            # Sample a random point on the area light, in world space
+            theta = 2 * np.pi * rng.random()
+            r = rng.random()
+            light_loc = Vector(lights.disk_points(i, theta, r))
+
+            # Now compute the cosine factor with the light's emission normal
+            cos_theta = (hit_loc - light_loc).normalized().dot(Vector(lights.normal[i]))
             if cos_theta < 0:
-
                 light_color = np.zeros(3)
             else:
-                # print("cos_theta", cos_theta)
-                light_color *= cos_theta
+                light_color = light_color * cos_theta
         """end of area light sampling"""
-        
+
         # calculate vectors for shadow ray
         light_vec = light_loc - hit_loc
         light_dir = light_vec.normalized()
         new_orig = hit_loc + hit_norm * eps
-        # cast shadow ray
-        has_light_hit, light_hit_loc, _, _, _, _ = ray_cast(scene, new_orig, light_dir)
-        if has_light_hit and (light_hit_loc - new_orig).length < light_vec.length:
+        # cast shadow ray, any hit closer than the light blocks it
+        if snapshot.occluded(new_orig, light_dir, light_vec.length):
             continue
         # Blinn-Phong diffuse
         I_light = light_color / light_vec.length_squared
-        color += np.array(diffuse_color) * I_light * hit_norm.dot(light_dir)
+        color += diffuse_color * I_light * hit_norm.dot(light_dir)
         # Blinn-Phong specular
         half_vector = (light_dir - ray_dir).normalized()
         specular_reflection = hit_norm.dot(half_vector) ** specular_hardness
-        color += np.array(specular_color) * I_light * specular_reflection
+        color += specular_color * I_light * specular_reflection
         # flag for ambient
         no_light_hit = False
 
-    if depth > 0:
-        # need to find the x axis and the y axis so that the z axis is the normal
-        # init guess 
-        x_axis = Vector((0, 0, 1)) # the first guess 
-        if abs(hit_norm.dot(x_axis)) > 0.9:
-            x_axis = Vector((0, 1, 0)) # if these two are too close, switch
-
-        # compute the real x axis
-        x_axis = x_axis - hit_norm * hit_norm.dot(x_axis)
-        x_axis.normalize()
-        # compute the real y axis
-        y_axis = hit_norm.cross(x_axis)
-        y_axis.normalize()
-
-        r1 = random.random()  # uniform in [0,1]
-        r2 = random.random()  # uniform in [0,1]
-        
-        # Let r1 = cos(theta), so theta = arccos(r1)
-        # theta = math.acos(r1)
-        # Let phi = 2π * r2
-        phi = 2.0 * math.pi * r2
-
-        sin_theta = math.sqrt(1 - r1 * r1)
-
-        # x = sin_theta * math.cos(phi)
-        # y = sin_theta * math.sin(phi)
-        # z = r1  # z corresponds to cos(theta)
-
-        local_dir = Vector((sin_theta * math.cos(phi), sin_theta * math.sin(phi), r1))
-        transform = Matrix((x_axis, y_axis, hit_norm)).transposed()
-        world_dir = transform @ local_dir
-        world_dir.normalize()
-
-        color += RT_trace_ray(
-            scene, hit_loc + hit_norm * eps, world_dir, lights, depth - 1
-        ) * diffuse_color * r1
-
     # ambient
     if no_light_hit:
-        color += np.array(diffuse_color) * ambient_color
+        color += diffuse_color * ambient_color
+    return color
+
 
+def RT_direct_light_mis(snapshot, lights, hit_loc, hit_norm, ray_dir, mat, mis, rng):
+    # multiple importance sampled direct light, a batch of one hit
+    materials = snapshot.materials
+
+    def occluded(origins, directions, t_max):
+        return np.array([
+            snapshot.occluded(Vector(o), Vector(d), float(t))
+            for o, d, t in zip(origins, directions, t_max)
+        ], dtype=bool)
+
+    diffuse_color = materials.diffuse_color[mat]
+    color, lit = direct_light(
+        lights, occluded, np.array([hit_loc]), np.array([hit_norm]), np.array([ray_dir]),
+        diffuse_color[None], materials.specular_color[mat][None],
+        materials.specular_hardness[mat:mat + 1], rng, mis,
+        snapshot.light_tree, snapshot.light_samples,
+    )
+    # ambient
+    if not lit[0]:
+        return color[0] + diffuse_color * snapshot.ambient_color
+    return color[0]
+
+
+def RT_diffuse_direction(hit_norm, u1, u2):
+    # cosine-weighted direction in the hemisphere around the normal and the
+    # weight of the diffuse bounce, per unit of diffuse color
+    world_dir, weight = sample_diffuse(np.asarray(hit_norm), u1, u2)
+    return Vector(world_dir), float(weight)
+
+
+def RT_reflectivity(materials, mat, ray_dir, hit_norm):
     # calculate reflectivity/fresnel
-    reflectivity = mat.mirror_reflectivity
-    if mat.use_fresnel:
-        n2 = mat.ior
+    reflectivity = materials.mirror_reflectivity[mat]
+    if materials.use_fresnel[mat]:
+        n2 = materials.ior[mat]
         r0 = ((1 - n2) / (1 + n2)) ** 2
         reflectivity = r0 + (1 - r0) * ((1 + ray_dir.dot(hit_norm)) ** 5)
+    return reflectivity
+
+
+def RT_refraction(ray_dir, hit_norm, ior, ray_inside_object):
+    # refracted direction, None for total internal reflection
+    if ray_inside_object:
+        ior_ratio = ior / 1
+    else:
+        ior_ratio = 1 / ior
+    under_sqrt = 1 - ior_ratio ** 2 * (1 - (ray_dir.dot(-hit_norm)) ** 2)
+    if under_sqrt <= 0:
+        return None
+    return ior_ratio * (
+        ray_dir - ray_dir.dot(hit_norm) * hit_norm
+    ) - hit_norm * sqrt(under_sqrt)
+
+
+def RT_first_hit_aov(aov, materials, mat, ray_orig, hit_loc, hit_norm):
+    # albedo, shading normal and distance of a camera ray hit, for the denoiser
+    aov[AOV_ALBEDO] = materials.diffuse_color[mat]
+    aov[AOV_NORMAL] = hit_norm
+    aov[AOV_DEPTH] = (hit_loc - ray_orig).length
+
+
+def RT_caustics(snapshot, hit_loc, hit_norm, mat):
+    # light focused on the hit by glass and mirrors, from the photon map
+    if snapshot.photon_map is None:
+        return np.zeros(3)
+    irradiance = snapshot.photon_map.irradiance(np.array([hit_loc]), np.array([hit_norm]))
+    return snapshot.materials.diffuse_color[mat] * irradiance[0]
+
+
+def RT_irradiance_trace(snapshot, lights, roulette_depth, mis, trace_ray):
+    # trace() of the irradiance cache: radiance and hit distance of the
+    # hemisphere rays of its records, one ray at a time
+    def trace(origins, directions, depth):
+        radiance = np.zeros((len(directions), 3))
+        distance = np.full(len(directions), np.inf)
+        rng = RandomStream(snapshot.irradiance_cache.rng)
+        if snapshot.stats is not None:
+            snapshot.stats.count(DIFFUSE, len(directions))
+        for i, (origin, direction) in enumerate(zip(origins, directions)):
+            aov = np.zeros(AOV_CHANNELS)
+            radiance[i] = trace_ray(
+                snapshot, Vector(origin), Vector(direction), lights, depth,
+                roulette_depth=roulette_depth, mis=mis, rng=rng, aov=aov,
+            )
+            if aov[AOV_DEPTH] > 0:
+                distance[i] = aov[AOV_DEPTH]
+        return radiance, distance
+    return trace
+
+
+def RT_trace_ray(snapshot, ray_orig, ray_dir, lights, depth=0, throughput=1.0,
+                 roulette_depth=None, mis=None, rng=None, aov=None):
+    # rng: sample stream of the path, see simpleRT_sampler.py
+    # aov: array of AOV_CHANNELS that gets the AOVs of the hit, if any
+    if rng is None:
+        rng = RandomStream(np.random)
+    # First, we cast a ray into the scene using Blender's built-in function
+    has_hit, hit_loc, hit_norm, _, hit_obj, _ = ray_cast(snapshot, ray_orig, ray_dir)
+    # if the ray hits nothing in the scene, return black
+    if not has_hit:
+        return np.zeros(3)
+    # small offset to prevent self-occlusion for secondary rays
+    eps = 1e-3
+    # fix normal direction
+    ray_inside_object = False
+    if hit_norm.dot(ray_dir) > 0:
+        hit_norm = -hit_norm
+        ray_inside_object = True
+
+    # get the material of the object we hit, from the material table
+    materials = snapshot.materials
+    mat = materials.index[hit_obj.name]
+    if aov is not None:
+        RT_first_hit_aov(aov, materials, mat, ray_orig, hit_loc, hit_norm)
+
+    # direct lighting, or ambient
+    color = RT_direct_light(snapshot, lights, hit_loc, hit_norm, ray_dir, mat, mis, rng)
+    # caustics
+    color += RT_caustics(snapshot, hit_loc, hit_norm, mat)
+
+    irradiance = None
+    diffuse_color = materials.diffuse_color[mat]
+    if depth > 0 and snapshot.irradiance_cache is not None and diffuse_color.max() > 0:
+        # diffuse GI interpolated from the irradiance cache
+        irradiance = snapshot.irradiance_cache.irradiance_at(
+            hit_loc, hit_norm, depth,
+            RT_irradiance_trace(snapshot, lights, roulette_depth, mis, RT_trace_ray),
+        )
+    if irradiance is not None:
+        color += diffuse_color * DIFFUSE_BRDF * irradiance
+        rng.start(ROULETTE)
+    elif depth > 0:
+        # diffuse GI
+        rng.start(BSDF)
+        u1, u2 = rng.random(), rng.random()
+        world_dir, diffuse_weight = RT_diffuse_direction(hit_norm, u1, u2)
+        # the surviving paths are divided by their survival probability,
+        # so Russian roulette does not change the expected color
+        weight = diffuse_color * diffuse_weight
+        q = survival_probability(throughput * weight, depth, roulette_depth)
+        rng.start(ROULETTE)
+        # a black surface has no diffuse bounce to trace
+        if rng.random() < q and weight.any():
+            if snapshot.stats is not None:
+                snapshot.stats.count(DIFFUSE)
+            color += RT_trace_ray(
+                snapshot, hit_loc + hit_norm * eps, world_dir, lights, depth - 1,
+                throughput * weight / q, roulette_depth, mis, rng.spawn(0),
+            ) * weight / q
+
+    reflectivity = RT_reflectivity(materials, mat, ray_dir, hit_norm)
 
     # recursive call for reflection and transmission
     if depth > 0:
         # reflection
         reflection_dir = (ray_dir - 2 * hit_norm * ray_dir.dot(hit_norm)).normalized()
-        reflect_color = RT_trace_ray(
-            scene, hit_loc + hit_norm * eps, reflection_dir, lights, depth - 1
-        )
-        color += reflectivity * reflect_color
+        q = survival_probability(throughput * reflectivity, depth, roulette_depth)
+        # the roulette number is drawn either way, the transmission keeps its own
+        if rng.random() < q and reflectivity > 0:
+            if snapshot.stats is not None:
+                snapshot.stats.count(REFLECTION)
+            reflect_color = RT_trace_ray(
+                snapshot, hit_loc + hit_norm * eps, reflection_dir, lights, depth - 1,
+                throughput * reflectivity / q, roulette_depth, mis, rng.spawn(1),
+            )
+            color += reflectivity * reflect_color / q
         # transmission
-        if mat.transmission > 0:
-            if ray_inside_object:
-                ior_ratio = mat.ior / 1
-            else:
-                ior_ratio = 1 / mat.ior
-            under_sqrt = 1 - ior_ratio ** 2 * (1 - (ray_dir.dot(-hit_norm)) ** 2)
-            if under_sqrt > 0:
-                transmission_dir = ior_ratio * (
-                    ray_dir - ray_dir.dot(hit_norm) * hit_norm
-                ) - hit_norm * sqrt(under_sqrt)
+        transmission = materials.transmission[mat]
+        if transmission > 0:
+            # a Python float, a NumPy scalar would turn the Vector math into arrays
+            ior = float(materials.ior[mat])
+            transmission_dir = RT_refraction(ray_dir, hit_norm, ior, ray_inside_object)
+            weight = (1 - reflectivity) * transmission
+            q = survival_probability(throughput * weight, depth, roulette_depth)
+            if transmission_dir is not None and rng.random() < q:
+                if snapshot.stats is not None:
+                    snapshot.stats.count(REFRACTION)
                 transmission_color = RT_trace_ray(
-                    scene,
+                    snapshot,
                     hit_loc - hit_norm * eps,
                     transmission_dir,
                     lights,
                     depth - 1,
+                    throughput * weight / q,
+                    roulette_depth,
+                    mis,
+                    rng.spawn(2),
                 )
-                color += (1 - reflectivity) * mat.transmission * transmission_color
+                color += weight * transmission_color / q
     return color
 
 
-# low-discrepancy sequence Van der Corput
-def corput(n, base=2):
-    q, denom = 0, 1
-    while n:
-        denom *= base
-        n, remainder = divmod(n, base)
-        q += remainder / denom
-    return q - 0.5
-
-
-def RT_render_scene(scene, width, height, depth, samples, buf):
-    # get all lights from the scene
-    scene_lights = [o for o in scene.objects if o.type == "LIGHT"]
-
-    # get the location and orientation of the active camera
-    cam_location = scene.camera.location
-    cam_orientation = scene.camera.rotation_euler
-
-    # get camera focal length
-    focal_length = scene.camera.data.lens / scene.camera.data.sensor_width
-    aspect_ratio = height / width
-
-    # Compute pixel dimensions for low-discrepancy sampling:
-    # dx is 1/width, and dy is computed as aspect_ratio/height.
-    dx = 1.0 / width
-    dy = aspect_ratio / height # aspect_ratio = width / height 
-
-    corput_x = [corput(i, 2) * dx for i in range(samples)]
-    corput_y = [corput(i, 3) * dy for i in range(samples)]
-
-    sbuf = np.zeros((height, width, 3))
-    # iterate on samples
-    for s in range(samples):
-        # iterate through all the pixels, cast a ray for each pixel
-        for y in range(height):
-            # get screen space coordinate for y
-            screen_y = ((y - (height / 2)) / height) * aspect_ratio # + corput_y[s]
-            for x in range(width):
-                # get screen space coordinate for x
-                screen_x = (x - (width / 2)) / width # + corput_x[s]
-
-                ray_dir = Vector(
-                    (screen_x + corput_x[s], screen_y + corput_y[s], -focal_length)
-                )
-
-                ray_dir.rotate(cam_orientation)
-                ray_dir = ray_dir.normalized()
-
-                # buf[y, x, 0:3] += RT_trace_ray( # [0 : 3] -> (r, g, b)
-                #     scene, cam_location, ray_dir, scene_lights, depth
-                # )
-
-                color = RT_trace_ray(
-                    scene, cam_location, ray_dir, scene_lights, depth
-                )
-
-                sbuf[y, x, :] += color 
+def RT_trace_path(snapshot, ray_orig, ray_dir, lights, depth=0, roulette_depth=None,
+                  mis=None, rng=None, aov=None):
+    # iterative path tracer: same estimator as RT_trace_ray, but every hit
+    # continues the path along a single lobe (diffuse, mirror or
+    # transmission) picked at random in proportion to its weight, and
+    # divided by that probability. One ray per bounce, cost linear in depth.
+    if rng is None:
+        rng = RandomStream(np.random)
+    # small offset to prevent self-occlusion for secondary rays
+    eps = 1e-3
+    materials = snapshot.materials
+    color = np.zeros(3)
+    throughput = np.ones(3)
+    for d in range(depth, -1, -1):
+        has_hit, hit_loc, hit_norm, _, hit_obj, _ = ray_cast(snapshot, ray_orig, ray_dir)
+        if not has_hit:
+            break
+        # fix normal direction
+        ray_inside_object = False
+        if hit_norm.dot(ray_dir) > 0:
+            hit_norm = -hit_norm
+            ray_inside_object = True
+        mat = materials.index[hit_obj.name]
+        if aov is not None and d == depth:
+            RT_first_hit_aov(aov, materials, mat, ray_orig, hit_loc, hit_norm)
+
+        color += throughput * (
+            RT_direct_light(snapshot, lights, hit_loc, hit_norm, ray_dir, mat, mis, rng)
+            + RT_caustics(snapshot, hit_loc, hit_norm, mat)
+        )
+        if d == 0:
+            break
+
+        # lobe weights, the diffuse bounce weighs diffuse_color / 2 on average
+        diffuse_color = materials.diffuse_color[mat]
+        reflectivity = RT_reflectivity(materials, mat, ray_dir, hit_norm)
+        transmission_dir = None
+        transmission = materials.transmission[mat]
+        if transmission > 0:
+            # a Python float, a NumPy scalar would turn the Vector math into arrays
+            ior = float(materials.ior[mat])
+            transmission_dir = RT_refraction(ray_dir, hit_norm, ior, ray_inside_object)
+        lobes = np.array((
+            float(np.max(diffuse_color)) / 2,
+            reflectivity,
+            (1 - reflectivity) * transmission if transmission_dir is not None else 0.0,
+        ))
+        total = lobes.sum()
+        if total <= 0:
+            break
+
+        # pick one lobe, after the pair of the diffuse direction
+        rng.start(BSDF)
+        u1, u2 = rng.random(), rng.random()
+        u = rng.random() * total
+        irradiance = None
+        if u < lobes[0] and lobes[0] > 0 and snapshot.irradiance_cache is not None:
+            irradiance = snapshot.irradiance_cache.irradiance_at(
+                hit_loc, hit_norm, d,
+                RT_irradiance_trace(snapshot, lights, roulette_depth, mis, RT_trace_path),
+            )
+        if irradiance is not None:
+            # the diffuse lobe ends on the irradiance cache
+            color += throughput * diffuse_color * DIFFUSE_BRDF * irradiance * total / lobes[0]
+            break
+        if u < lobes[0]:
+            ray_dir, diffuse_weight = RT_diffuse_direction(hit_norm, u1, u2)
+            ray_orig = hit_loc + hit_norm * eps
+            weight = diffuse_color * diffuse_weight
+            p = lobes[0] / total
+            kind = DIFFUSE
+        elif u < lobes[0] + lobes[1]:
+            ray_dir = (ray_dir - 2 * hit_norm * ray_dir.dot(hit_norm)).normalized()
+            ray_orig = hit_loc + hit_norm * eps
+            weight = reflectivity
+            p = lobes[1] / total
+            kind = REFLECTION
+        else:
+            ray_dir = transmission_dir.normalized()
+            ray_orig = hit_loc - hit_norm * eps
+            weight = (1 - reflectivity) * transmission
+            p = lobes[2] / total
+            kind = REFRACTION
+        throughput = throughput * weight / p
+
+        # Russian roulette on the path throughput
+        q = survival_probability(throughput, d, roulette_depth)
+        rng.start(ROULETTE)
+        if rng.random() >= q:
+            break
+        throughput = throughput / q
+        rng = rng.spawn()
+        if snapshot.stats is not None:
+            snapshot.stats.count(kind)
+    return color
 
-                # update the pixel color in the buffer
-                buf[y, x, 0:3] = sbuf[y, x, :] / (s + 1)
 
-                # populate the alpha component of the buffer
-                # to make the pixel not transparent
-                buf[y, x, 3] = 1 # [3] -> alpha
-            yield y + s * height
-    
-    # buf = sbuf[:, :, 0:3] / samples
-    return buf
+def RT_render_scene(snapshot, width, height, depth, samples, accum, tiles,
+                    adaptive=None, roulette_depth=None, trace_ray=RT_trace_ray, mis=None,
+                    sampler=None):
+    # lights and camera were collected once in the scene snapshot
+    scene_lights = snapshot.light_table
+    camera = snapshot.camera
+    cam_location = Vector(camera.location)
+    # per-pixel low-discrepancy samples, see simpleRT_sampler.py
+    if sampler is None:
+        sampler = Sampler()
+
+    # number of pixel samples done, for progress report
+    done = 0
+    # render the tiles (buckets) one after the other
+    for tile in tiles:
+        x0, y0, w, h = tile
+        tile_accum = accum[y0:y0 + h, x0:x0 + w]
+        # iterate on sampling rounds: every pixel once per round, or only
+        # the noisy ones when sampling adaptively
+        for pixels in sample_rounds(tile_accum, samples, adaptive):
+            # build the camera rays and the samples of this round at once
+            paths, offsets = pixel_samples(tile_accum, pixels, tile, width, sampler)
+            _, ray_dirs = camera.rays(width, height, offsets, region=tile)
+            # cast a ray for each pixel, a tile row worth of pixels at a time
+            for start in range(0, len(pixels), w):
+                row = pixels[start:start + w]
+                aovs = np.zeros((len(row), AOV_CHANNELS))
+                trace_start = time.perf_counter()
+                colors = np.array([
+                    trace_ray(
+                        snapshot, cam_location, Vector(ray_dirs[p]), scene_lights, depth,
+                        roulette_depth=roulette_depth, mis=mis,
+                        rng=paths.take([start + k]), aov=aovs[k],
+                    )
+                    for k, p in enumerate(row)
+                ])
+                if snapshot.stats is not None:
+                    snapshot.stats.trace_seconds += time.perf_counter() - trace_start
+                    snapshot.stats.count(CAMERA, len(row))
+                add_samples(tile_accum, row, colors, aovs)
+                done += len(row)
+                yield tile, False, done
+        yield tile, True, done
+
+    return accum
+
+
+def RT_render_scene_wavefront(snapshot, width, height, depth, samples, accum, tiles,
+                              workers=0, seed=0, adaptive=None, roulette_depth=None,
+                              mis=None, sampler=None):
+    # accum may hold the samples of a resumed render, they are kept
+    # each tile is traced breadth-first, by a pool of processes if workers > 0
+    tracer = WavefrontTracer(snapshot, roulette_depth=roulette_depth, mis=mis)
+    # the workers get a copy of the snapshot, build its BVH only once
+    if snapshot.bvh is None:
+        snapshot.build_bvh()
+
+    if sampler is None:
+        sampler = Sampler(seed=seed)
+    done = 0
+    for _, _, tile, frame in render_tiles(
+        tracer, width, height, depth, samples, sampler, workers,
+        seed=seed, tiles=tiles, adaptive=adaptive, accum=accum,
+    ):
+        x, y, w, h = tile
+        taken = frame[y:y + h, x:x + w, COUNT].sum() - accum[y:y + h, x:x + w, COUNT].sum()
+        accum[y:y + h, x:x + w] = frame[y:y + h, x:x + w]
+        done += int(taken)
+        yield tile, True, done
+
+    return accum
+
+
+def RT_render_scene_distributed(snapshot, width, height, depth, samples, accum, tiles,
+                                directory, parts=8, split="SAMPLES", workers=0, seed=0,
+                                roulette_depth=None, mis=None, sampler=None, key="",
+                                timeout=None):
+    # the frame is handed out as tasks in a shared directory, to render
+    # nodes running simpleRT_distributed.py and to `workers` local processes,
+    # see simpleRT_distributed.py; nodes trace with the wavefront tracer.
+    # Gives up when no node made progress for timeout seconds
+    tracer = WavefrontTracer(snapshot, roulette_depth=roulette_depth, mis=mis)
+    if snapshot.bvh is None:
+        snapshot.build_bvh()
+    if sampler is None:
+        sampler = Sampler(seed=seed)
+
+    # a resumed render goes on from the sample every pixel is at, the
+    # tasks all start at the same index
+    first = int(accum[0, 0, COUNT])
+    if np.any(accum[:, :, COUNT] != first):
+        raise ValueError("distributed renders resume from as many samples in every pixel")
+    tiles = [tuple(int(v) for v in tile) for tile in tiles]
+    tasks = split_tasks(tiles, first, max(samples - first, 0), parts, split)
+    if not tasks:
+        for tile in tiles:
+            yield tile, True, 0
+        return accum
+
+    job_dir = submit(
+        directory, tracer, width, height, depth, sampler, seed, key, tasks
+    )
+    processes = start_workers(directory, workers)
+    # a tile is final once all the tasks rendering it are in
+    remaining = {tile: 0 for tile in tiles}
+    for task in tasks:
+        for tile in task["tiles"]:
+            remaining[tuple(tile)] += 1
+    done = 0
+    # without local workers the engine renders tasks itself while waiting
+    partials = collect(job_dir, len(tasks), key, work=workers <= 0, timeout=timeout)
+    try:
+        for index, partial in partials:
+            accum += partial
+            done += int(partial[:, :, COUNT].sum())
+            for tile in tasks[index]["tiles"]:
+                tile = tuple(tile)
+                remaining[tile] -= 1
+                yield tile, remaining[tile] == 0, done
+    finally:
+        # withdraws the tasks left, then stops the local workers; the job
+        # folder goes with a finished or cancelled render alike, a node
+        # still rendering one of its tasks drops it
+        partials.close()
+        for process in processes:
+            process.terminate()
+            process.join()
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    return accum
+
+
+# report of the last finished or cancelled render, see render_scene()
+last_render = {}
+# seconds between two refreshes of the tiles in progress
+DISPLAY_INTERVAL = 0.5
+# first-hit AOVs written as render passes: name, AOV channels, channel ids, type
+AOV_PASSES = (
+    ("Denoising Albedo", AOV_ALBEDO, "RGB", "COLOR"),
+    ("Denoising Normal", AOV_NORMAL, "XYZ", "VECTOR"),
+    ("Denoising Depth", slice(AOV_DEPTH, AOV_DEPTH + 1), "Z", "VALUE"),
+)
 
 
 # modified from https://docs.blender.org/api/current/bpy.types.RenderEngine.html
@@ -280,53 +594,266 @@ class SimpleRTRenderEngine(bpy.types.RenderEngine):
         if self.is_preview:
             pass
         else:
+            # wall time of every stage, reported in last_render
+            self.timer = StageTimer()
+            # evaluate meshes, lights and camera once for the whole render
+            with self.timer.stage("snapshot"):
+                self.snapshot = snapshot_scene(depsgraph)
+            if scene.simpleRT.use_adaptive:
+                self.add_pass("Samples", 1, "X")
+            for name, channels, chan_id, _ in AOV_PASSES:
+                self.add_pass(name, len(chan_id), chan_id)
+            self.use_denoise = scene.simpleRT.use_denoise
+            if self.use_denoise:
+                self.add_pass("Noisy Image", 4, "RGBA")
+            if scene.simpleRT.use_bvh:
+                with self.timer.stage("bvh"):
+                    self.snapshot.build_bvh()
+            if scene.simpleRT.use_light_tree:
+                with self.timer.stage("light tree"):
+                    self.snapshot.build_light_tree(scene.simpleRT.light_samples)
+            if scene.simpleRT.use_irradiance_cache:
+                self.snapshot.build_irradiance_cache(
+                    accuracy=scene.simpleRT.irradiance_accuracy,
+                    rays=scene.simpleRT.irradiance_rays,
+                    seed=scene.simpleRT.seed,
+                    max_depth=scene.simpleRT.recursion_depth,
+                )
             self.render_scene(scene)
 
+    def update_render_passes(self, scene=None, renderlayer=None):
+        # declare the sample count pass to the compositor
+        self.register_pass(scene, renderlayer, "Combined", 4, "RGBA", "COLOR")
+        if scene.simpleRT.use_adaptive:
+            self.register_pass(scene, renderlayer, "Samples", 1, "X", "VALUE")
+        for name, _, chan_id, pass_type in AOV_PASSES:
+            self.register_pass(scene, renderlayer, name, len(chan_id), chan_id, pass_type)
+        if scene.simpleRT.use_denoise:
+            self.register_pass(scene, renderlayer, "Noisy Image", 4, "RGBA", "COLOR")
+
+    def upload_tile(self, result, accum, tile, adaptive=None, image=None):
+        # copy the tile into its render result straight from float32 arrays,
+        # rect.foreach_set() avoids building a Python float per channel;
+        # image replaces the mean color of accum in the Combined pass
+        x, y, w, h = tile
+        tile_accum = accum[y:y + h, x:x + w]
+        rgba = resolve(tile_accum)
+        combined = rgba if image is None else image[y:y + h, x:x + w]
+        layer = result.layers[0].passes["Combined"]
+        layer.rect.foreach_set(np.ravel(combined.astype(np.float32)))
+        if self.use_denoise:
+            layer = result.layers[0].passes["Noisy Image"]
+            layer.rect.foreach_set(np.ravel(rgba.astype(np.float32)))
+        aovs = resolve_aovs(tile_accum)
+        for name, channels, _, _ in AOV_PASSES:
+            layer = result.layers[0].passes[name]
+            layer.rect.foreach_set(np.ravel(aovs[:, :, channels].astype(np.float32)))
+        if adaptive is not None:
+            # where the samples went
+            layer = result.layers[0].passes["Samples"]
+            layer.rect.foreach_set(np.ravel(tile_accum[:, :, COUNT].astype(np.float32)))
+
     def render_scene(self, scene):
         height, width = self.size_y, self.size_x
-        buf = np.zeros((height, width, 4))
-
-        result = self.begin_result(0, 0, self.size_x, self.size_y)
-        layer = result.layers[0].passes["Combined"]
+        # per-pixel sum of samples, sample count and squared luminance sum
+        accum = np.zeros((height, width, ACCUM_CHANNELS))
 
+        settings = scene.simpleRT
         # get the maximum ray tracing recursion depth
-        depth = scene.simpleRT.recursion_depth
+        depth = settings.recursion_depth
+        # bounce rays past the first roulette_min_depth bounces may be ended
+        # by Russian roulette, i.e. once the remaining depth is roulette_depth
+        roulette_depth = None
+        if settings.use_roulette:
+            roulette_depth = depth - settings.roulette_min_depth
 
         samples = self.samples
-        total_height = samples * height
+        tiles = make_tiles(width, height, settings.tile_size, settings.tile_order)
+        adaptive = None
+        if settings.use_adaptive:
+            adaptive = (settings.adaptive_min_samples, settings.adaptive_threshold)
+        # MIS heuristic of the direct light, None samples the lights only
+        mis = settings.mis_heuristic if settings.use_mis else None
+        sampler = Sampler(settings.sampler, settings.seed)
+        total = samples * width * height
+
+        # pick up the samples of an earlier render of the same scene, to
+        # finish it or to add samples to it
+        checkpoint = None
+        if settings.use_checkpoint or settings.use_distributed:
+            # also tells the partials of a distributed render apart
+            key = render_key(self.snapshot, settings, width, height)
+        if settings.use_checkpoint:
+            checkpoint = bpy.path.abspath(settings.checkpoint_path)
+            resumed, rng_state = load_checkpoint(checkpoint, key, accum.shape)
+            if resumed is not None:
+                accum[:] = resumed
+                if rng_state is not None:
+                    np.random.set_state(rng_state)
+            counts = accum[:, :, COUNT]
+            if settings.use_distributed and np.any(counts != counts[0, 0]):
+                # the tasks all start at the same sample index, a buffer
+                # left uneven by adaptive sampling is started over
+                accum[:] = 0
+        resumed_samples = int(accum[:, :, COUNT].sum())
 
         # time the render
-        import time
         from datetime import timedelta
 
         start_time = time.time()
 
+        if settings.use_photons:
+            # caustic photons, traced before anything gathers them
+            self.update_stats("", "Photon map")
+            with self.timer.stage("photon map"):
+                self.snapshot.build_photon_map(
+                    photons=settings.photon_count, passes=settings.photon_passes,
+                    seed=settings.seed,
+                )
+
+        if settings.use_irradiance_cache and settings.irradiance_prepass:
+            # records at the first hits of the pixels, then read-only, so
+            # the workers all get a copy of the same cache
+            self.update_stats("", "Irradiance cache")
+            tracer = WavefrontTracer(self.snapshot, roulette_depth=roulette_depth, mis=mis)
+            with self.timer.stage("irradiance cache"):
+                prepass(
+                    self.snapshot.irradiance_cache, self.snapshot, width, height, depth,
+                    tracer.trace_irradiance,
+                )
+
+        # count the rays of the render, not those of the photons and the
+        # pre-pass; the render nodes of a distributed render keep theirs
+        stats = None
+        if settings.use_stats and not settings.use_distributed:
+            stats = self.snapshot.stats = RayStats()
+
         # start ray tracing
-        update_cycle = int(10000 / width)
-        for y in RT_render_scene(scene, width, height, depth, samples, buf):
+        if settings.use_distributed:
+            # the render nodes only run the wavefront tracer, uniformly sampled
+            passes = RT_render_scene_distributed(
+                self.snapshot, width, height, depth, samples, accum, tiles,
+                bpy.path.abspath(settings.farm_directory), settings.farm_tasks,
+                settings.farm_split, settings.workers, settings.seed, roulette_depth, mis,
+                sampler, key, settings.farm_timeout or None,
+            )
+            adaptive = None
+        elif settings.integrator == "WAVEFRONT":
+            passes = RT_render_scene_wavefront(
+                self.snapshot, width, height, depth, samples, accum, tiles,
+                settings.workers, settings.seed, adaptive, roulette_depth, mis, sampler,
+            )
+        else:
+            # one branching recursion per camera ray, or one path
+            trace_ray = RT_trace_path if settings.integrator == "PATH" else RT_trace_ray
+            passes = RT_render_scene(
+                self.snapshot, width, height, depth, samples, accum, tiles, adaptive,
+                roulette_depth, trace_ray, mis, sampler,
+            )
+
+        # every tile in progress has its own render result
+        results = {}
+        # tiles with new samples not shown yet
+        dirty = set()
+        last_refresh = start_time
+        last_checkpoint = start_time
+        finished_tiles = 0
+        cancelled = False
+        render_start = time.perf_counter()
+        for tile, finished, done in passes:
 
             elapsed = int(time.time() - start_time)
-            remain = int(elapsed / (y + 1) * (total_height - y - 1))
+            remain = int(elapsed / max(done, 1) * max(total - resumed_samples - done, 0))
+            finished_tiles += finished
             status = (
-                f"pass {y//height+1}/{samples} "
+                f"tile {finished_tiles}/{len(tiles)} "
                 + f"| Remaining {timedelta(seconds=remain)}"
             )
+            if stats is not None:
+                rate = stats.total() / max(time.perf_counter() - render_start, 1e-6)
+                status += f" | {rate:,.0f} rays/s"
             self.update_stats("", status)
             print(status, end="\r")
             # update Blender progress bar
-            self.update_progress(y / total_height)
+            self.update_progress(min((resumed_samples + done) / total, 1))
+
             # update render result
-            # update too frequently will significantly slow down the rendering
-            if y % update_cycle == 0 or y == total_height - 1:
-                self.update_result(result)
-                layer.rect = buf.reshape(-1, 4).tolist()
+            display_start = time.perf_counter()
+            x, y, w, h = tile
+            if tile not in results:
+                results[tile] = self.begin_result(x, y, w, h)
+            dirty.add(tile)
+            if finished:
+                # tell Blender all pixels of the tile have been set and are final
+                self.upload_tile(results[tile], accum, tile, adaptive)
+                self.end_result(results.pop(tile))
+                dirty.discard(tile)
+            elif time.time() - last_refresh >= DISPLAY_INTERVAL:
+                # refresh on a timer, only the tiles that changed since the last one
+                for dirty_tile in dirty:
+                    self.upload_tile(results[dirty_tile], accum, dirty_tile, adaptive)
+                    self.update_result(results[dirty_tile])
+                dirty.clear()
+                last_refresh = time.time()
+            if stats is not None:
+                stats.display_seconds += time.perf_counter() - display_start
+
+            # save the samples so far now and then
+            if checkpoint and time.time() - last_checkpoint >= settings.checkpoint_interval:
+                save_checkpoint(checkpoint, accum, key, np.random.get_state())
+                last_checkpoint = time.time()
 
             # catch "ESC" event to cancel the render
             if self.test_break():
+                cancelled = True
                 break
-
-        # tell Blender all pixels have been set and are final
-        self.end_result(result)
+        # stop the workers (if any) right away when cancelled
+        passes.close()
+        # tracing, display and the checkpoints saved meanwhile
+        self.timer.add("render", time.perf_counter() - render_start)
+
+        # close the tiles left unfinished by a cancel
+        for result in results.values():
+            self.end_result(result)
+        # a cancelled render resumes from here, a finished one can be extended
+        if checkpoint:
+            with self.timer.stage("checkpoint"):
+                save_checkpoint(checkpoint, accum, key, np.random.get_state())
+
+        # final stage: the whole frame again, with the denoised beauty pass
+        if self.use_denoise and not cancelled:
+            self.update_stats("", "Denoising")
+            with self.timer.stage("denoise"):
+                image = denoise_accum(accum, settings.denoise_iterations)
+                frame = (0, 0, width, height)
+                result = self.begin_result(*frame)
+                self.upload_tile(result, accum, frame, adaptive, image)
+                self.end_result(result)
+
+        # what was rendered and how fast, for scripts driving the engine
+        render_time = self.timer.seconds["render"]
+        camera_rays = int(accum[:, :, COUNT].sum()) - resumed_samples
+        last_render.clear()
+        last_render.update(
+            width=width,
+            height=height,
+            samples=samples,
+            integrator="DISTRIBUTED" if settings.use_distributed else settings.integrator,
+            cancelled=cancelled,
+            camera_rays=camera_rays,
+            camera_rays_per_second=camera_rays / render_time if render_time > 0 else 0.0,
+            stages=self.timer.as_dict(),
+        )
+        if stats is not None:
+            # the counters stay on the snapshot only for this render
+            self.snapshot.stats = None
+            last_render["ray_stats"] = summary = stats.summary(render_time)
+            self.update_stats("", (
+                f"{summary['total_rays']:,} rays | {summary['rays_per_second']:,.0f} rays/s"
+                + f" | intersect {summary['intersect_seconds']:.1f} s"
+                + f" | shading {summary['shading_seconds']:.1f} s"
+                + f" | display {summary['display_seconds']:.1f} s"
+            ))
 
 
 def register():
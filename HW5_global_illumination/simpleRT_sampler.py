@@ -0,0 +1,310 @@
+#  simpleRT_sampler.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Per-pixel low-discrepancy samples. Every random number of a path is a
+#  dimension of a sample point: the subpixel offset, then per bounce the
+#  light pick, light, BSDF and Russian roulette numbers, each addressed by
+#  its stage, the bounce and its rank in the stage, so it is the same
+#  dimension for every sample of a pixel whatever the other stages draw.
+#  The camera has no lens (no depth of field), so there are no lens
+#  dimensions.
+#
+#  SOBOL uses the first two Sobol dimensions for every pair of dimensions,
+#  with hash-based Owen scrambling and a shuffled sample index per pixel
+#  and pair, after Burley, "Practical Hash-based Owen Scrambling" (JCGT
+#  2020). HALTON uses one small prime base per dimension for the first
+#  dimensions of the first bounces, Cranley-Patterson rotated by a
+#  per-pixel offset, and hashed random numbers past them. Both are
+#  decorrelated between pixels, so no structure is shared across the
+#  image. RANDOM draws from the tracer's generator, as before.
+#
+#  A SampleStream serves the samples of a batch of paths in bulk: after
+#  start(stage), every random(size) call returns the next dimensions of
+#  all its paths, like numpy.random.Generator.random(). Draws meant to
+#  be stratified together come in pairs at even ranks.
+
+import numpy as np
+
+
+SAMPLERS = ("SOBOL", "HALTON", "RANDOM")
+
+# stages of a path, each with its own dimensions per bounce
+CAMERA = 0
+PICK = 1
+LIGHT = 2
+BSDF = 3
+ROULETTE = 4
+
+# Halton dimensions of every stage of the first bounces, by stage; the
+# bases grow fast and a base much larger than the sample count covers
+# only part of [0, 1) in a pixel, so the other dimensions are hashed
+HALTON_DIMS = (2, 1, 2, 2, 1)
+HALTON_MAX_BOUNCE = 1
+
+# the bit manipulations below work on uint64 arrays holding 32-bit values
+# and on Python ints alike, the latter being much faster for single paths
+_M32 = 0xFFFFFFFF
+
+
+def _primes(n):
+    primes = []
+    k = 2
+    while len(primes) < n:
+        if all(k % p for p in primes):
+            primes.append(k)
+        k += 1
+    return primes
+
+
+PRIMES = _primes(HALTON_DIMS[CAMERA] + sum(HALTON_DIMS[1:]) * (HALTON_MAX_BOUNCE + 1))
+
+
+def _uint(v):
+    return v if isinstance(v, int) else np.asarray(v).astype(np.uint64)
+
+
+def hash32(*values):
+    """32-bit hash of integers or integer arrays (broadcast), murmur3 finalizer per value"""
+    h = 0x9E3779B9
+    for v in values:
+        h = (h ^ (_uint(v) & _M32)) & _M32
+        h = (h * 0x85EBCA6B) & _M32
+        h ^= h >> 13
+        h = (h * 0xC2B2AE35) & _M32
+        h ^= h >> 16
+    return h
+
+
+def reverse_bits(x):
+    """reverse the 32 bits of integers"""
+    for shift, mask in (
+        (1, 0x55555555), (2, 0x33333333), (4, 0x0F0F0F0F), (8, 0x00FF00FF),
+        (16, 0x0000FFFF),
+    ):
+        x = ((x >> shift) & mask) | ((x & mask) << shift)
+    return x
+
+
+def _laine_karras(x, seed):
+    # permutation that only lets bits affect higher bits, Burley's constants
+    x = (x + seed) & _M32
+    for c in (0x6C50B47C, 0xB82F1E52, 0xC7AFE638, 0x8D22F6E6):
+        x ^= (x * c) & _M32
+    return x
+
+
+def owen_scramble(x, seed):
+    """nested uniform (Owen) scrambling of 32-bit fixed-point numbers"""
+    return reverse_bits(_laine_karras(reverse_bits(x), seed))
+
+
+# direction numbers of the second Sobol dimension, the first is the
+# bit reversal of the index
+_SOBOL_1 = [1 << 31]
+for _k in range(1, 32):
+    _SOBOL_1.append(_SOBOL_1[-1] ^ (_SOBOL_1[-1] >> 1))
+
+
+def sobol(index, dim):
+    """dimension 0 or 1 of the Sobol sequence as 32-bit fixed-point numbers"""
+    if dim == 0:
+        return reverse_bits(index)
+    remaining = bool if isinstance(index, int) else np.any
+    x = index & 0
+    k = 0
+    while remaining(index >> k):
+        x ^= ((index >> k) & 1) * _SOBOL_1[k]
+        k += 1
+    return x
+
+
+def radical_inverse(index, base):
+    """Halton component of the sample indices in one prime base"""
+    remaining = bool if isinstance(index, int) else np.any
+    result = index * 0.0
+    scale = 1.0 / base
+    while remaining(index):
+        index, digit = divmod(index, base)
+        result += digit * scale
+        scale /= base
+    return result
+
+
+class Sampler:
+    """Low-discrepancy sample source of a render
+
+    Parameters
+    ----------
+    method : str
+        One of SAMPLERS
+    seed : int
+        Changes every scrambling, a different image with the same sampler
+    """
+
+    def __init__(self, method="SOBOL", seed=0):
+        if method not in SAMPLERS:
+            raise ValueError("unknown sampler %r" % (method,))
+        self.method = method
+        self.seed = seed
+
+    def stream(self, pixels, indices, rng=None):
+        """SampleStream of one path per pixel
+
+        Parameters
+        ----------
+        pixels : numpy.ndarray, (n,)
+            Pixel of every path, any integer id unique in the frame
+        indices : numpy.ndarray, (n,)
+            Sample index of every path in its pixel
+        rng : numpy.random.Generator or numpy.random
+            Source of the RANDOM sampler
+        """
+        if self.method == "RANDOM":
+            return RandomStream(rng if rng is not None else np.random)
+        return SampleStream(self, pixels, indices)
+
+    def values(self, pixels, indices, branch, stage, bounce, dims):
+        """Sample dimensions dims of the given paths
+
+        Returns
+        -------
+        u : numpy.ndarray, (len(dims), n)
+            Uniform in [0, 1)
+        """
+        pixels = np.asarray(pixels, dtype=np.int64)
+        u = np.empty((len(dims), len(pixels)))
+        for row, dim in enumerate(dims):
+            u[row] = self.value(pixels, indices, branch, stage, bounce, dim)
+        return u
+
+    def value(self, pixels, indices, branch, stage, bounce, dim):
+        """One sample dimension, of a single path when given Python ints"""
+        if self.method == "SOBOL":
+            # one Owen-scrambled 2D Sobol point set per pair of dimensions,
+            # its index shuffled per pixel so the pairs are independent
+            pair_seed = hash32(self.seed, pixels, branch, stage, bounce, dim // 2)
+            index = owen_scramble(_uint(indices), pair_seed)
+            x = owen_scramble(sobol(index, dim % 2), hash32(pair_seed, dim % 2))
+            return x / 2.0 ** 32
+        return self._halton(pixels, indices, branch, stage, bounce, dim)
+
+    def _halton(self, pixels, indices, branch, stage, bounce, dim):
+        if dim >= HALTON_DIMS[stage] or (stage != CAMERA and bounce > HALTON_MAX_BOUNCE):
+            return hash32(self.seed, pixels, branch, stage, bounce, dim, indices) / 2.0 ** 32
+        # the subpixel offset takes the two first bases, then every bounce
+        # the dimensions of its stages in order
+        rank = dim
+        if stage != CAMERA:
+            rank += HALTON_DIMS[CAMERA] + sum(HALTON_DIMS[1:]) * bounce
+            rank += sum(HALTON_DIMS[1:stage])
+        rotation = hash32(self.seed, pixels, branch, stage, bounce, dim) / 2.0 ** 32
+        u = radical_inverse(indices, PRIMES[rank]) + rotation
+        # Cranley-Patterson rotation, wrapped into [0, 1)
+        return np.minimum(u - np.floor(u), np.nextafter(1, 0))
+
+
+class SampleStream:
+    """The sample dimensions of a batch of paths, served in order
+
+    Attributes
+    ----------
+    pixels, indices, branch : numpy.ndarray, (n,)
+        Pixel, sample index and branch id of every path; the branch id
+        tells apart the rays a hit spawns (diffuse, mirror, transmission)
+    """
+
+    def __init__(self, sampler, pixels, indices, branch=None):
+        self.sampler = sampler
+        self.pixels = np.asarray(pixels, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        if branch is None:
+            branch = np.zeros(len(self.pixels), dtype=np.uint64)
+        self.branch = branch
+        self.stage = CAMERA
+        self.bounce = 0
+        self.dim = 0
+        # a single path draws from Python ints, far cheaper than 1-arrays
+        self._single = None
+        if len(self.pixels) == 1:
+            self._single = (int(self.pixels[0]), int(self.indices[0]), int(branch[0]))
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def start(self, stage, bounce=None):
+        """Draw the following numbers from the dimensions of stage
+
+        bounce (0 for the hits of camera rays) defaults to the one of the
+        stream, which take() advances for spawned rays.
+        """
+        self.stage = stage
+        if bounce is not None:
+            self.bounce = bounce
+        self.dim = 0
+
+    def random(self, size=None):
+        """Next dimensions of every path
+
+        size None returns a float (single path), n one dimension and
+        (k, n) the k next dimensions.
+        """
+        k = 1 if size is None or np.ndim(size) == 0 else int(np.prod(size[:-1]))
+        dims = range(self.dim, self.dim + k)
+        self.dim += k
+        if self._single is not None:
+            u = [self.sampler.value(*self._single, self.stage, self.bounce, d) for d in dims]
+            u = np.array(u, dtype=np.float64).reshape(k, 1)
+        else:
+            u = self.sampler.values(
+                self.pixels, self.indices, self.branch, self.stage, self.bounce, dims
+            )
+        if size is None:
+            return float(u[0, 0])
+        return u.reshape(size)
+
+    def pixel_offsets(self, n):
+        """subpixel offsets of the n camera rays in pixel units, in [-0.5, 0.5)"""
+        self.start(CAMERA)
+        return self.random((2, n)).T - 0.5
+
+    def take(self, rows, lobe=None):
+        """Stream of the paths in rows, e.g. the rays that hit something
+
+        With lobe, the rows are new rays spawned by their paths: they get a
+        new branch id per lobe and the next bounce.
+        """
+        branch = self.branch[rows]
+        if lobe is not None:
+            branch = hash32(branch, np.asarray(lobe) + 1)
+        stream = SampleStream(self.sampler, self.pixels[rows], self.indices[rows], branch)
+        stream.stage, stream.bounce, stream.dim = self.stage, self.bounce, self.dim
+        if lobe is not None:
+            stream.bounce += 1
+        return stream
+
+    def spawn(self, lobe=0):
+        """stream of the rays every path spawns along lobe, at the next bounce"""
+        return self.take(slice(None), lobe)
+
+
+class RandomStream:
+    """SampleStream interface over a random generator, all calls pass through"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def start(self, stage, bounce=None):
+        pass
+
+    def random(self, size=None):
+        return self.rng.random(size)
+
+    def take(self, rows, lobe=None):
+        return self
+
+    def spawn(self, lobe=0):
+        return self
+
+    def pixel_offsets(self, n):
+        return self.rng.random((n, 2)) - 0.5
@@ -0,0 +1,298 @@
+#  simpleRT_scene.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Scene snapshot taken once at the start of a render: every visible mesh
+#  is evaluated a single time and stored as a world-space triangle soup in
+#  contiguous NumPy arrays, together with the lights and the camera, so the
+#  intersection and shading code does not have to go through bpy per ray.
+
+import time
+
+import numpy as np
+
+from simpleRT_bvh import BVH
+from simpleRT_camera import Camera
+from simpleRT_irradiance import IrradianceCache
+from simpleRT_lights import LightTable
+from simpleRT_lighttree import LightTree
+from simpleRT_materials import MaterialTable
+from simpleRT_photons import build_photon_map
+
+
+class SceneSnapshot:
+    """Triangle-soup copy of a Blender scene
+
+    Attributes
+    ----------
+    triangles : numpy.ndarray, (T, 3, 3)
+        World-space vertices of every triangle
+    normals : numpy.ndarray, (T, 3)
+        Unit world-space face normal of every triangle
+    tri_object : numpy.ndarray, (T,)
+        Index into `objects` of the object each triangle belongs to.
+        Materials are stored per object, so it is the material index too
+    tri_face : numpy.ndarray, (T,)
+        Face (polygon) index of each triangle in its own mesh,
+        i.e. the index returned by Scene.ray_cast()
+    objects : list
+        The mesh objects, indexed by `tri_object`
+    materials : MaterialTable
+        The simpleRT_material of every object, indexed by `tri_object`
+    lights : list
+        The light objects, indexed like `light_table`
+    light_table : LightTable
+        Shading constants of the lights as arrays
+    light_tree : LightTree or None
+        Hierarchy over `light_table`, see build_light_tree(). When None,
+        every hit is shaded by every light. Otherwise ambient is added to
+        the hits whose picked lights are all occluded
+    light_samples : int
+        Lights picked from `light_tree` per hit
+    irradiance_cache : IrradianceCache or None
+        Records of the diffuse GI, see build_irradiance_cache(). When
+        None, every diffuse hit traces its own bounce ray
+    photon_map : PhotonMap or None
+        Caustic photons, see build_photon_map(). When None, light
+        reaching diffuse surfaces through glass and mirrors is missing
+    camera : Camera
+        The active camera
+    ambient_color : numpy.ndarray, (3,)
+        scene.simpleRT.ambient_color
+    bvh : BVH or None
+        Acceleration structure over `triangles`, see build_bvh().
+        When None, ray_cast() goes through Blender's Scene.ray_cast()
+    stats : RayStats or None
+        Counts the queries below when set, see simpleRT_stats.py
+    """
+
+    def __init__(self, meshes, lights, camera, ambient_color, scene=None, depsgraph=None):
+        # meshes: list of (object, world-space vertices, triangle indices, face indices)
+        self.objects = [m[0] for m in meshes]
+        tris, faces, owner = [], [], []
+        for i, (_, verts, tri_index, face_index) in enumerate(meshes):
+            tris.append(verts[tri_index])
+            faces.append(face_index)
+            owner.append(np.full(len(tri_index), i, dtype=np.int32))
+
+        if tris:
+            self.triangles = np.ascontiguousarray(np.concatenate(tris), dtype=np.float64)
+            self.tri_face = np.ascontiguousarray(np.concatenate(faces), dtype=np.int32)
+            self.tri_object = np.ascontiguousarray(np.concatenate(owner))
+        else:
+            self.triangles = np.zeros((0, 3, 3))
+            self.tri_face = np.zeros(0, dtype=np.int32)
+            self.tri_object = np.zeros(0, dtype=np.int32)
+        self.normals = triangle_normals(self.triangles)
+        self.materials = MaterialTable(self.objects)
+
+        self.lights = list(lights)
+        self.light_table = LightTable(self.lights)
+        self.light_tree = None
+        self.light_samples = 1
+        self.irradiance_cache = None
+        self.photon_map = None
+
+        self.camera = camera
+        self.ambient_color = np.asarray(ambient_color, dtype=np.float64).reshape(3)
+
+        # kept for the Blender-backed ray_cast, None for headless scenes
+        self.scene = scene
+        self.depsgraph = depsgraph
+        self.bvh = None
+        self.stats = None
+
+    def __len__(self):
+        return len(self.triangles)
+
+    def __getstate__(self):
+        # bpy data cannot leave Blender's process: worker copies keep the
+        # arrays and refer to objects and lights by name only
+        state = self.__dict__.copy()
+        state["objects"] = [obj.name for obj in self.objects]
+        state["lights"] = [light.name for light in self.lights]
+        state["scene"] = None
+        state["depsgraph"] = None
+        return state
+
+    def build_bvh(self, **kwargs):
+        """build the BVH used by ray_cast(), see BVH for the arguments"""
+        self.bvh = BVH(self.triangles, **kwargs)
+        return self.bvh
+
+    def build_light_tree(self, samples=1):
+        """shade hits with `samples` lights picked from a LightTree"""
+        self.light_tree = LightTree(self.light_table)
+        self.light_samples = samples
+        return self.light_tree
+
+    def build_irradiance_cache(self, **kwargs):
+        """share the diffuse GI through an IrradianceCache, see it for the arguments"""
+        if len(self.triangles):
+            bounds = self.triangles.min(axis=(0, 1)), self.triangles.max(axis=(0, 1))
+        else:
+            bounds = np.zeros(3), np.ones(3)
+        self.irradiance_cache = IrradianceCache(*bounds, **kwargs)
+        return self.irradiance_cache
+
+    def build_photon_map(self, **kwargs):
+        """trace the caustic photons, see simpleRT_photons.py for the arguments"""
+        self.photon_map = build_photon_map(self, **kwargs)
+        return self.photon_map
+
+    def ray_cast(self, origin, direction):
+        """Closest hit of a ray, like Blender's Scene.ray_cast()
+
+        Goes through the BVH when one was built, otherwise through
+        Scene.ray_cast() with the depsgraph looked up once.
+
+        Returns the same (has_hit, hit_loc, hit_norm, index, hit_obj, matrix)
+        tuple as Scene.ray_cast(); locations and normals are NumPy arrays
+        when the BVH is used
+        """
+        if self.stats is not None:
+            start = time.perf_counter()
+            result = self._ray_cast(origin, direction)
+            self.stats.add_hits(result[0], not result[0], time.perf_counter() - start)
+            return result
+        return self._ray_cast(origin, direction)
+
+    def _ray_cast(self, origin, direction):
+        if self.bvh is None:
+            return self.scene.ray_cast(self.depsgraph, origin, direction)
+
+        tri, t = self.bvh.closest_hit(origin, direction)
+        if tri < 0:
+            return False, np.zeros(3), np.zeros(3), -1, None, np.eye(4)
+        hit_obj = self.objects[self.tri_object[tri]]
+        hit_loc = np.asarray(origin, dtype=np.float64) + t * np.asarray(direction, dtype=np.float64)
+        return (
+            True,
+            hit_loc,
+            self.normals[tri].copy(),
+            int(self.tri_face[tri]),
+            hit_obj,
+            hit_obj.matrix_world,
+        )
+
+    def occluded(self, origin, direction, t_max=np.inf):
+        """Whether anything lies along a ray before t_max (shadow rays)
+
+        An any-hit query: through the BVH it stops at the first triangle
+        found; through Scene.ray_cast() the search is bounded by t_max and
+        only the has_hit flag is used.
+        """
+        if self.stats is not None:
+            start = time.perf_counter()
+            blocked = self._occluded(origin, direction, t_max)
+            self.stats.add_shadow(1, blocked, time.perf_counter() - start)
+            return blocked
+        return self._occluded(origin, direction, t_max)
+
+    def _occluded(self, origin, direction, t_max):
+        if self.bvh is None:
+            return self.scene.ray_cast(
+                self.depsgraph, origin, direction, distance=t_max
+            )[0]
+        return self.bvh.occluded(origin, direction, t_max)
+
+    def intersect(self, origins, directions, t_max=np.inf):
+        """Closest hits of a batch of rays through the BVH
+
+        Returns
+        -------
+        tri : numpy.ndarray, (R,)
+            Triangle index of each hit, -1 for a miss
+        t : numpy.ndarray, (R,)
+            Ray parameter of each hit, inf for a miss
+        """
+        if self.bvh is None:
+            self.build_bvh()
+        if self.stats is not None:
+            start = time.perf_counter()
+            tri, t = self.bvh.intersect(origins, directions, t_max)
+            hits = np.count_nonzero(tri >= 0)
+            self.stats.add_hits(hits, len(tri) - hits, time.perf_counter() - start)
+            return tri, t
+        return self.bvh.intersect(origins, directions, t_max)
+
+    def intersect_any(self, origins, directions, t_max=np.inf):
+        """Occlusion of a batch of shadow rays through the BVH, see BVH.intersect_any()"""
+        if self.bvh is None:
+            self.build_bvh()
+        if self.stats is not None:
+            start = time.perf_counter()
+            blocked = self.bvh.intersect_any(origins, directions, t_max)
+            self.stats.add_shadow(
+                len(blocked), np.count_nonzero(blocked), time.perf_counter() - start
+            )
+            return blocked
+        return self.bvh.intersect_any(origins, directions, t_max)
+
+
+def triangle_normals(triangles):
+    """unit face normals of a (T, 3, 3) triangle array, counter-clockwise winding"""
+    n = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    length = np.linalg.norm(n, axis=1)
+    length[length == 0] = 1
+    return n / length[:, None]
+
+
+def mesh_arrays(obj, depsgraph):
+    """Evaluate one mesh object and return its triangles in world space
+
+    Returns
+    -------
+    verts : numpy.ndarray, (V, 3)
+        World-space vertex positions
+    tri_index : numpy.ndarray, (T, 3)
+        Vertex indices of every loop triangle
+    face_index : numpy.ndarray, (T,)
+        Polygon index of every loop triangle
+    """
+    eval_obj = obj.evaluated_get(depsgraph)
+    mesh = eval_obj.to_mesh()
+    mesh.calc_loop_triangles()
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", co)
+    tri_index = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", tri_index)
+    face_index = np.empty(len(mesh.loop_triangles), dtype=np.int32)
+    mesh.loop_triangles.foreach_get("polygon_index", face_index)
+
+    matrix = np.array(eval_obj.matrix_world, dtype=np.float64)
+    eval_obj.to_mesh_clear()
+
+    verts = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    return verts, tri_index.reshape(-1, 3), face_index
+
+
+def snapshot_scene(depsgraph):
+    """Take a SceneSnapshot of the scene being rendered
+
+    Parameters
+    ----------
+    depsgraph : bpy.types.Depsgraph
+        The depsgraph passed to RenderEngine.render()
+        (or a headless stand-in, see simpleRT_headless.py)
+    """
+    scene = depsgraph.scene
+    meshes, lights = [], []
+    for obj in scene.objects:
+        if obj.hide_render:
+            continue
+        if obj.type == "MESH":
+            verts, tri_index, face_index = mesh_arrays(obj, depsgraph)
+            meshes.append((obj, verts, tri_index, face_index))
+        elif obj.type == "LIGHT":
+            lights.append(obj)
+
+    return SceneSnapshot(
+        meshes,
+        lights,
+        Camera.from_object(scene.camera),
+        scene.simpleRT.ambient_color,
+        scene=scene,
+        depsgraph=depsgraph,
+    )
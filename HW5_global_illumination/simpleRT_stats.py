@@ -0,0 +1,110 @@
+#  simpleRT_stats.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Render statistics: wall time spent in the named stages of a render
+#  (scene snapshot, acceleration structures, the render itself, ...), and
+#  ray counters. The engine keeps the report of its last render in
+#  simpleRT_plugin.last_render for scripts such as simpleRT_batch.py.
+#
+#  Ray counters are off unless a RayStats is set as the stats of the scene
+#  snapshot; the hot loops only test it against None. The snapshot counts
+#  the hits, misses and time of every intersection query and the shadow
+#  rays, the integrators count the rays they spawn by type and the time
+#  they trace, and the engine the time it spends displaying tiles.
+
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """Wall time of the stages of a render, in seconds by stage name
+
+    A stage entered several times adds up.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def as_dict(self):
+        return dict(self.seconds)
+
+
+# types of rays counted by RayStats
+RAY_TYPES = ("camera", "shadow", "diffuse", "reflection", "refraction")
+CAMERA, SHADOW, DIFFUSE, REFLECTION, REFRACTION = range(len(RAY_TYPES))
+
+
+class RayStats:
+    """Rays by type, hits and misses, and the time spent intersecting
+
+    Worker processes count into their own RayStats, merged into the
+    engine's with merge(). Times are summed over processes.
+    """
+
+    def __init__(self):
+        self.rays = [0] * len(RAY_TYPES)
+        self.hits = 0
+        self.misses = 0
+        self.occluded = 0
+        self.intersect_seconds = 0.0
+        self.trace_seconds = 0.0
+        self.display_seconds = 0.0
+
+    def count(self, kind, n=1):
+        """n rays of type kind (one of CAMERA, SHADOW, ...) were spawned"""
+        self.rays[kind] += int(n)
+
+    def add_hits(self, hits, misses, seconds):
+        """closest-hit queries of hits + misses rays, taking seconds"""
+        self.hits += int(hits)
+        self.misses += int(misses)
+        self.intersect_seconds += seconds
+
+    def add_shadow(self, rays, occluded, seconds):
+        """any-hit queries of shadow rays, taking seconds"""
+        self.rays[SHADOW] += int(rays)
+        self.occluded += int(occluded)
+        self.intersect_seconds += seconds
+
+    def merge(self, other):
+        self.rays = [a + b for a, b in zip(self.rays, other.rays)]
+        self.hits += other.hits
+        self.misses += other.misses
+        self.occluded += other.occluded
+        self.intersect_seconds += other.intersect_seconds
+        self.trace_seconds += other.trace_seconds
+        self.display_seconds += other.display_seconds
+
+    def total(self):
+        return sum(self.rays)
+
+    def summary(self, seconds=None):
+        """The counters as a dict, with rays per second over seconds of wall time"""
+        total = self.total()
+        return dict(
+            rays=dict(zip(RAY_TYPES, self.rays)),
+            total_rays=total,
+            hits=self.hits,
+            misses=self.misses,
+            occluded=self.occluded,
+            intersect_seconds=self.intersect_seconds,
+            # tracing that is not intersecting: lighting, sampling, BSDFs
+            shading_seconds=max(self.trace_seconds - self.intersect_seconds, 0.0),
+            display_seconds=self.display_seconds,
+            rays_per_second=total / seconds if seconds else 0.0,
+        )
@@ -0,0 +1,76 @@
+#  simpleRT_tiles.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Splits the frame into rectangular tiles (buckets) rendered and
+#  displayed independently, in scanline, spiral or Hilbert curve order.
+
+from math import atan2, pi
+
+# default edge length of a tile, in pixels
+TILE_SIZE = 64
+TILE_ORDERS = ("SCANLINE", "SPIRAL", "HILBERT")
+
+
+def make_tiles(width, height, tile_size=TILE_SIZE, order="SCANLINE"):
+    """Split a width * height frame into tiles
+
+    Parameters
+    ----------
+    width : int
+    height : int
+    tile_size : int
+        Edge length of a tile; the tiles on the right and top border are
+        smaller when the frame size is not a multiple of it
+    order : str
+        "SCANLINE": row by row from the bottom left corner
+        "SPIRAL": outwards from the centre of the frame
+        "HILBERT": along a Hilbert curve, neighbouring tiles stay close
+
+    Returns
+    -------
+    tiles : list of (x, y, w, h)
+    """
+    cols = -(-width // tile_size)
+    rows = -(-height // tile_size)
+    grid = [(i, j) for j in range(rows) for i in range(cols)]
+
+    if order == "SPIRAL":
+        ci, cj = (cols - 1) / 2, (rows - 1) / 2
+
+        def key(cell):
+            di, dj = cell[0] - ci, cell[1] - cj
+            # ring around the centre first, then counter-clockwise in the ring
+            return max(abs(di), abs(dj)), atan2(dj, di) % (2 * pi)
+
+        grid.sort(key=key)
+    elif order == "HILBERT":
+        n = 1
+        while n < max(cols, rows):
+            n *= 2
+        grid.sort(key=lambda cell: hilbert_index(n, *cell))
+    elif order != "SCANLINE":
+        raise ValueError(f"unknown tile order {order!r}, expected one of {TILE_ORDERS}")
+
+    tiles = []
+    for i, j in grid:
+        x, y = i * tile_size, j * tile_size
+        tiles.append((x, y, min(tile_size, width - x), min(tile_size, height - y)))
+    return tiles
+
+
+def hilbert_index(n, x, y):
+    """distance of cell (x, y) along the Hilbert curve filling an n * n grid"""
+    d = 0
+    s = n // 2
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        # rotate the quadrant so the curve stays continuous
+        if ry == 0:
+            if rx == 1:
+                x, y = n - 1 - x, n - 1 - y
+            x, y = y, x
+        s //= 2
+    return d
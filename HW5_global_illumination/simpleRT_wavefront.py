@@ -0,0 +1,352 @@
+#  simpleRT_wavefront.py
+#
+#  Support file for simpleRT render engine.
+#
+#  Wavefront (breadth-first) version of RT_trace_ray in simpleRT_plugin.py.
+#  Instead of following one ray at a time depth-first, a whole generation
+#  of rays is kept in arrays and every stage (intersect, direct lighting
+#  with shadow rays, ambient, bounce ray generation, compaction) runs as a
+#  batched NumPy kernel over all of them. It evaluates the same estimator
+#  as RT_trace_ray: area-light sampling, diffuse GI, reflection and
+#  transmission, so images agree with the recursive renderer up to noise.
+
+import numpy as np
+
+from simpleRT_adaptive import AOV_ALBEDO, AOV_CHANNELS, AOV_DEPTH, AOV_NORMAL
+from simpleRT_bsdf import DIFFUSE_BRDF, sample_diffuse
+from simpleRT_lighttree import light_groups
+from simpleRT_mis import direct_light
+from simpleRT_sampler import BSDF, ROULETTE, RandomStream
+from simpleRT_stats import DIFFUSE, REFLECTION, REFRACTION
+
+
+# small offset to prevent self-occlusion for secondary rays
+EPS = 1e-3
+# camera rays traced together; bounded so the ray arrays stay small
+CHUNK_SIZE = 1 << 14
+
+
+class WavefrontTracer:
+    """Breadth-first tracer over a SceneSnapshot
+
+    Parameters
+    ----------
+    snapshot : SceneSnapshot
+        The scene; its BVH is built on first use
+    rng : numpy.random.Generator
+        Source of the random numbers (area light and hemisphere samples)
+        of the paths traced without a sample stream
+    roulette_depth : None or int
+        Bounce rays spawned at a remaining depth <= roulette_depth go
+        through Russian roulette, None traces every bounce to the end
+    mis : None or str
+        MIS heuristic of the direct light ("BALANCE" or "POWER"), see
+        simpleRT_mis.py; None samples the lights only
+    """
+
+    def __init__(self, snapshot, rng=None, roulette_depth=None, mis=None):
+        self.snapshot = snapshot
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.roulette_depth = roulette_depth
+        self.mis = mis
+        self.materials = snapshot.materials
+
+        self.lights = snapshot.light_table
+
+    def trace(self, origins, directions, depth, samples=None, aovs=None):
+        """Radiance along a batch of rays, same result as RT_trace_ray per ray
+
+        Parameters
+        ----------
+        origins : numpy.ndarray, (R, 3)
+        directions : numpy.ndarray, (R, 3)
+            Normalized ray directions
+        depth : int
+            Maximum recursion depth
+        samples : SampleStream or None
+            Sample dimensions of the R paths, see simpleRT_sampler.py;
+            None draws from rng
+        aovs : None or numpy.ndarray, (R, AOV_CHANNELS)
+            Gets the first-hit AOVs of the rays that hit something, see
+            simpleRT_adaptive.py
+
+        Returns
+        -------
+        color : numpy.ndarray, (R, 3)
+        """
+        if samples is None:
+            samples = RandomStream(self.rng)
+        origins = np.ascontiguousarray(np.broadcast_to(origins, np.shape(directions)))
+        directions = np.asarray(directions, dtype=np.float64)
+        n_rays = len(directions)
+        color = np.zeros((n_rays, 3))
+
+        # the wavefront: one generation of rays, each carrying the index of
+        # the camera ray it contributes to and its accumulated weight
+        owner = np.arange(n_rays)
+        weight = np.ones((n_rays, 3))
+        for d in range(depth, -1, -1):
+            if len(owner) == 0:
+                break
+            hit = self._intersect(origins, directions)
+            # compact: misses return black
+            origins, directions = origins[hit.ray], directions[hit.ray]
+            owner, weight = owner[hit.ray], weight[hit.ray]
+            samples = samples.take(hit.ray)
+            if aovs is not None and d == depth:
+                aovs[hit.ray, AOV_ALBEDO] = self.materials.diffuse_color[hit.mat]
+                aovs[hit.ray, AOV_NORMAL] = hit.norm
+                aovs[hit.ray, AOV_DEPTH] = np.linalg.norm(hit.loc - origins, axis=1)
+
+            local = self._shade(hit, directions, samples)
+            if self.snapshot.photon_map is not None:
+                # caustics
+                caustics = self.snapshot.photon_map.irradiance(hit.loc, hit.norm)
+                local += self.materials.diffuse_color[hit.mat] * caustics
+            np.add.at(color, owner, weight * local)
+            if d == 0:
+                break
+
+            # diffuse GI of the hits the irradiance cache covers
+            cached = None
+            if self.snapshot.irradiance_cache is not None:
+                irradiance, cached = self._cached_irradiance(hit, d)
+                diffuse = self.materials.diffuse_color[hit.mat]
+                np.add.at(color, owner, weight * diffuse * DIFFUSE_BRDF * irradiance)
+
+            origins, directions, parent, lobe, bounce_weight = self._bounce(
+                hit, directions, samples, cached
+            )
+            owner = owner[parent]
+            weight = weight[parent] * bounce_weight
+            samples = samples.take(parent, lobe)
+
+            # compact: drop the rays that can no longer contribute
+            alive = (weight != 0).any(axis=1)
+            if self.roulette_depth is not None and d <= self.roulette_depth:
+                # Russian roulette on the path throughput, survivors are
+                # divided by their survival probability to stay unbiased
+                survival = np.minimum(weight.max(axis=1), 1.0)
+                samples.start(ROULETTE)
+                alive &= samples.random(len(weight)) < survival
+                weight = weight / np.where(alive, survival, 1)[:, None]
+            origins, directions = origins[alive], directions[alive]
+            owner, weight = owner[alive], weight[alive]
+            samples = samples.take(alive)
+            if self.snapshot.stats is not None:
+                traced = np.bincount(lobe[alive], minlength=3)
+                for kind, n in zip((DIFFUSE, REFLECTION, REFRACTION), traced):
+                    self.snapshot.stats.count(kind, n)
+        return color
+
+    def _intersect(self, origins, directions):
+        """stage 1: closest hits, geometry and material of every hit"""
+        snapshot = self.snapshot
+        tri, t = snapshot.intersect(origins, directions)
+        ray = np.nonzero(tri >= 0)[0]
+        tri = tri[ray]
+        directions = directions[ray]
+
+        loc = origins[ray] + t[ray, None] * directions
+        norm = snapshot.normals[tri]
+        # fix normal direction
+        inside = np.einsum("ij,ij->i", norm, directions) > 0
+        norm = np.where(inside[:, None], -norm, norm)
+
+        mat = snapshot.tri_object[tri]
+        return _Hits(ray, loc, norm, inside, mat)
+
+    def _shade(self, hit, ray_dir, rng):
+        """stage 2: direct lighting through shadow rays, plus ambient"""
+        m = self.materials
+        n_hits = len(hit.ray)
+        diffuse = m.diffuse_color[hit.mat]
+        specular = m.specular_color[hit.mat]
+        hardness = m.specular_hardness[hit.mat]
+
+        if self.mis is not None:
+            color, lit = direct_light(
+                self.lights, self.snapshot.intersect_any, hit.loc, hit.norm, ray_dir,
+                diffuse, specular, hardness, rng, self.mis,
+                self.snapshot.light_tree, self.snapshot.light_samples,
+            )
+            return color + np.where(lit[:, None], 0, diffuse * self.snapshot.ambient_color)
+
+        color = np.zeros((n_hits, 3))
+        lit = np.zeros(n_hits, dtype=bool)
+        shadow_orig = hit.loc + hit.norm * EPS
+        lights = self.lights
+        # every light, or the ones picked from the light tree with their weight
+        groups = light_groups(
+            lights, self.snapshot.light_tree, self.snapshot.light_samples,
+            hit.loc, hit.norm, rng,
+        )
+        for light, rows, scale in groups:
+            loc, norm = hit.loc[rows], hit.norm[rows]
+            light_color = lights.intensity[light] * scale[:, None]
+            light_loc = self._sample_light(light, rng)
+            area = lights.is_area[light]
+            if area.any():
+                to_hit = loc - light_loc
+                to_hit /= np.linalg.norm(to_hit, axis=1, keepdims=True)
+                cos_theta = np.einsum("ij,ij->i", to_hit, lights.normal[light])
+                cos_theta = np.where(area, np.maximum(cos_theta, 0), 1)
+                light_color = light_color * cos_theta[:, None]
+
+            # stage 3: shadow rays, occluded when something is closer than the light
+            light_vec = light_loc - loc
+            dist = np.linalg.norm(light_vec, axis=1)
+            light_dir = light_vec / dist[:, None]
+            visible = ~self.snapshot.intersect_any(shadow_orig[rows], light_dir, dist)
+
+            # Blinn-Phong diffuse and specular
+            i_light = light_color / (dist ** 2)[:, None]
+            n_dot_l = np.einsum("ij,ij->i", norm, light_dir)
+            half = light_dir - ray_dir[rows]
+            half /= np.linalg.norm(half, axis=1, keepdims=True)
+            spec = np.maximum(np.einsum("ij,ij->i", norm, half), 0) ** hardness[rows]
+            shaded = i_light * (
+                diffuse[rows] * n_dot_l[:, None] + specular[rows] * spec[:, None]
+            )
+            color[rows] += np.where(visible[:, None], shaded, 0)
+            lit[rows] |= visible
+
+        # ambient
+        color += np.where(lit[:, None], 0, diffuse * self.snapshot.ambient_color)
+        return color
+
+    def _sample_light(self, light, rng):
+        """one sample point per hit on its light (uniform on the disk of area lights)"""
+        lights = self.lights
+        if not lights.is_area[light].any():
+            return lights.position[light]
+        n = len(light)
+        theta = 2 * np.pi * rng.random(n)
+        r = rng.random(n)
+        # point lights have no size, disk_points() gives their position
+        return lights.disk_points(light, theta, r)
+
+    def _cached_irradiance(self, hit, depth):
+        """irradiance of the hits from the cache, filled first unless frozen
+
+        Hits without diffuse color (glass, mirrors) get no record, the
+        rays of one would be multiplied by 0.
+        """
+        cache = self.snapshot.irradiance_cache
+        irradiance = np.zeros((len(hit.ray), 3))
+        valid = np.zeros(len(hit.ray), dtype=bool)
+        rows = np.nonzero(self.materials.diffuse_color[hit.mat].max(axis=1) > 0)[0]
+        loc, norm = hit.loc[rows], hit.norm[rows]
+        found, covered = cache.lookup(loc, norm, depth)
+        if not cache.frozen and not covered.all():
+            cache.fill(loc[~covered], norm[~covered], depth, self.trace_irradiance)
+            found, covered = cache.lookup(loc, norm, depth)
+        irradiance[rows] = found
+        valid[rows] = covered
+        return irradiance, valid
+
+    def trace_irradiance(self, origins, directions, depth):
+        """trace() of the irradiance cache: radiance and hit distance of rays"""
+        aovs = np.zeros((len(directions), AOV_CHANNELS))
+        rng = RandomStream(self.snapshot.irradiance_cache.rng)
+        if self.snapshot.stats is not None:
+            # the hemisphere rays of the records
+            self.snapshot.stats.count(DIFFUSE, len(directions))
+        radiance = self.trace(origins, directions, depth, rng, aovs)
+        distance = np.where(aovs[:, AOV_DEPTH] > 0, aovs[:, AOV_DEPTH], np.inf)
+        return radiance, distance
+
+    def _bounce(self, hit, ray_dir, rng, cached=None):
+        """stage 4: diffuse, reflection and transmission rays of every hit
+
+        Returns the new origins, directions, the index of the hit each
+        new ray comes from, its lobe (0 diffuse, 1 reflection,
+        2 transmission) and the weight it is multiplied by. The hits
+        in `cached` get their diffuse GI from the irradiance cache, their
+        diffuse rays weigh 0
+        """
+        m = self.materials
+        n_hits = len(hit.ray)
+        norm = hit.norm
+        diffuse = m.diffuse_color[hit.mat]
+        d_dot_n = np.einsum("ij,ij->i", ray_dir, norm)
+
+        # diffuse GI: cosine-weighted directions
+        rng.start(BSDF)
+        u1 = rng.random(n_hits)
+        u2 = rng.random(n_hits)
+        diffuse_dir, diffuse_weight = sample_diffuse(norm, u1, u2)
+        if cached is not None:
+            diffuse_weight = np.where(cached, 0, diffuse_weight)
+
+        # reflectivity / fresnel
+        reflectivity = m.reflectivity(hit.mat, d_dot_n)
+        ior = m.ior[hit.mat]
+        reflect_dir = ray_dir - 2 * norm * d_dot_n[:, None]
+        reflect_dir /= np.linalg.norm(reflect_dir, axis=1, keepdims=True)
+
+        # transmission
+        transmission = m.transmission[hit.mat]
+        ior_ratio = np.where(hit.inside, ior, 1 / ior)
+        under_sqrt = 1 - ior_ratio ** 2 * (1 - d_dot_n ** 2)
+        refract = np.nonzero((transmission > 0) & (under_sqrt > 0))[0]
+        refract_dir = (
+            ior_ratio[refract, None] * (ray_dir[refract] - d_dot_n[refract, None] * norm[refract])
+            - norm[refract] * np.sqrt(under_sqrt[refract])[:, None]
+        )
+
+        above = hit.loc + norm * EPS
+        every = np.arange(n_hits)
+        origins = np.concatenate((above, above, hit.loc[refract] - norm[refract] * EPS))
+        directions = np.concatenate((diffuse_dir, reflect_dir, refract_dir))
+        parent = np.concatenate((every, every, refract))
+        lobe = np.repeat((0, 1, 2), (n_hits, n_hits, len(refract)))
+        weight = np.concatenate((
+            diffuse * diffuse_weight[:, None],
+            np.repeat(reflectivity[:, None], 3, axis=1),
+            np.repeat(((1 - reflectivity) * transmission)[refract, None], 3, axis=1),
+        ))
+        return origins, directions, parent, lobe, weight
+
+
+class _Hits:
+    """hit records of one wavefront stage, indexed like the surviving rays"""
+
+    def __init__(self, ray, loc, norm, inside, mat):
+        self.ray = ray
+        self.loc = loc
+        self.norm = norm
+        self.inside = inside
+        self.mat = mat
+
+
+def render_pass(tracer, width, height, depth, jitter=None, region=None,
+                chunk_size=CHUNK_SIZE):
+    """Trace one sample for every pixel of the frame (or of one tile)
+
+    Parameters
+    ----------
+    tracer : WavefrontTracer
+    width : int
+    height : int
+    depth : int
+        Maximum recursion depth
+    jitter : None or float array of 2 items
+        Subpixel offset of this pass, in pixel units
+    region : None or (x, y, w, h)
+        Only render this rectangle of the frame
+    chunk_size : int
+        Number of camera rays traced together
+
+    Returns
+    -------
+    color : numpy.ndarray, (h, w, 3)
+        (height, width, 3) when no region is given
+    """
+    _, _, w, h = region if region is not None else (0, 0, width, height)
+    origins, directions = tracer.snapshot.camera.rays(width, height, jitter, region)
+    color = np.empty((w * h, 3))
+    for start in range(0, w * h, chunk_size):
+        end = start + chunk_size
+        color[start:end] = tracer.trace(origins[start:end], directions[start:end], depth)
+    return color.reshape(h, w, 3)
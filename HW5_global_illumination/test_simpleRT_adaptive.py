@@ -0,0 +1,66 @@
+#  test_simpleRT_adaptive.py
+#
+#  Sample accumulation and the per-tile budget of adaptive sampling.
+
+import numpy as np
+
+from simpleRT_adaptive import (
+    ACCUM_CHANNELS, COUNT, MAX_SAMPLES_FACTOR, AdaptiveSampler, add_samples, mean_variance,
+    resolve, sample_rounds,
+)
+
+# a 4 x 4 tile, noisy in its left half, flat in its right half
+H = W = 4
+NOISY = (np.arange(H * W) % W) < W // 2
+
+
+def render(accum, samples, adaptive, seed=0):
+    """Sample a tile with sample_rounds(), gray 0.5 plus noise on the left"""
+    rng = np.random.default_rng(seed)
+    for pixels in sample_rounds(accum, samples, adaptive):
+        gray = 0.5 + np.where(NOISY[pixels], rng.normal(0, 0.5, len(pixels)), 0)
+        add_samples(accum, pixels, np.repeat(gray[:, None], 3, axis=1))
+    return accum[:, :, COUNT].ravel()
+
+
+def test_mean_variance():
+    rng = np.random.default_rng(0)
+    colors = rng.random((10, H * W, 3))
+    accum = np.zeros((H, W, ACCUM_CHANNELS))
+    for sample in colors:
+        add_samples(accum, None, sample)
+    luminance = colors @ (0.2126, 0.7152, 0.0722)
+    mean, variance = mean_variance(accum)
+    np.testing.assert_allclose(mean.ravel(), luminance.mean(axis=0))
+    np.testing.assert_allclose(variance.ravel(), luminance.var(axis=0, ddof=1) / 10)
+    np.testing.assert_allclose(resolve(accum)[:, :, :3].reshape(-1, 3), colors.mean(axis=0))
+
+
+def test_budget_goes_to_noisy_pixels():
+    count = render(np.zeros((H, W, ACCUM_CHANNELS)), 16, (4, 0.05))
+    # uniform sampling's budget, spent on the noisy half
+    assert count.sum() == 16 * H * W
+    np.testing.assert_array_equal(count[~NOISY], 4)
+    assert np.all(count[NOISY] > 16)
+    assert np.all(count <= MAX_SAMPLES_FACTOR * 16)
+
+
+def test_converged_tile_stops_early():
+    accum = np.zeros((H, W, ACCUM_CHANNELS))
+    rounds = 0
+    for pixels in sample_rounds(accum, 16, (4, 0.05)):
+        add_samples(accum, pixels, np.full((len(pixels), 3), 0.5))
+        rounds += 1
+    # every pixel converged once its error could be trusted
+    assert rounds == 4
+    np.testing.assert_array_equal(accum[:, :, COUNT], 4)
+
+
+def test_resumed_tile_spends_what_is_left():
+    accum = np.zeros((H, W, ACCUM_CHANNELS))
+    render(accum, 8, None)
+    sampler = AdaptiveSampler(accum, 16, 4, 0.05)
+    assert sampler.budget == 8 * H * W
+    count = render(accum, 16, (4, 0.05), seed=1)
+    assert count.sum() <= 16 * H * W
+    np.testing.assert_array_equal(count[~NOISY], 8)
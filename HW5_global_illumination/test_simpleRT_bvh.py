@@ -0,0 +1,76 @@
+#  test_simpleRT_bvh.py
+#
+#  The BVH queries against a brute-force test of every triangle.
+
+import numpy as np
+import pytest
+
+from simpleRT_bvh import BVH, T_MIN
+
+
+def brute_force(triangles, origins, directions):
+    """Closest triangle and ray parameter of every ray, -1 and inf for a miss"""
+    v0 = triangles[:, 0]
+    e1 = triangles[:, 1] - v0
+    e2 = triangles[:, 2] - v0
+    tri = np.full(len(origins), -1)
+    best = np.full(len(origins), np.inf)
+    for r, (o, d) in enumerate(zip(origins, directions)):
+        p = np.cross(d, e2)
+        det = np.einsum("ij,ij->i", e1, p)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s = o - v0
+            u = np.einsum("ij,ij->i", s, p) / det
+            q = np.cross(s, e1)
+            v = q @ d / det
+            t = np.einsum("ij,ij->i", e2, q) / det
+        t[~((det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > T_MIN))] = np.inf
+        if np.isfinite(t.min()):
+            tri[r], best[r] = t.argmin(), t.min()
+    return tri, best
+
+
+@pytest.fixture
+def scene():
+    rng = np.random.default_rng(7)
+    centers = rng.uniform(-1, 1, (300, 1, 3))
+    triangles = centers + rng.normal(scale=0.1, size=(300, 3, 3))
+    origins = rng.uniform(-1.5, 1.5, (200, 3))
+    # half the rays aim at a triangle, half go anywhere
+    directions = rng.normal(size=(200, 3))
+    directions[::2] = centers[:100, 0] - origins[::2]
+    return triangles, origins, directions
+
+
+def test_closest_hit(scene):
+    triangles, origins, directions = scene
+    bvh = BVH(triangles)
+    expected_tri, expected_t = brute_force(triangles, origins, directions)
+    assert (expected_tri >= 0).sum() > 50
+    for o, d, tri, t in zip(origins, directions, expected_tri, expected_t):
+        hit_tri, hit_t = bvh.closest_hit(o, d)
+        assert hit_tri == tri
+        if tri >= 0:
+            assert hit_t == pytest.approx(t)
+
+
+def test_intersect(scene):
+    triangles, origins, directions = scene
+    bvh = BVH(triangles)
+    expected_tri, expected_t = brute_force(triangles, origins, directions)
+    tri, t = bvh.intersect(origins, directions)
+    np.testing.assert_array_equal(tri, expected_tri)
+    np.testing.assert_allclose(t, expected_t)
+
+
+def test_any_hit(scene):
+    triangles, origins, directions = scene
+    bvh = BVH(triangles)
+    _, expected_t = brute_force(triangles, origins, directions)
+    # half way to the closest hit of half the rays
+    t_max = np.where(np.arange(len(origins)) % 2, expected_t * 0.5, 10.0)
+    expected = expected_t < t_max
+    assert expected.any() and not expected.all()
+    np.testing.assert_array_equal(bvh.intersect_any(origins, directions, t_max), expected)
+    for o, d, t, occluded in zip(origins, directions, t_max, expected):
+        assert bvh.occluded(o, d, t) == occluded
@@ -0,0 +1,19 @@
+#  test_simpleRT_checkpoint.py
+#
+#  A render resumed from a checkpoint against the same render in one go.
+
+import numpy as np
+
+from conftest import HEIGHT, WIDTH
+from simpleRT_adaptive import ACCUM_CHANNELS
+from simpleRT_checkpoint import load_checkpoint, save_checkpoint
+from test_simpleRT_parallel import render
+
+
+def test_resume_is_bit_identical(tracer, tmp_path):
+    path = str(tmp_path / "checkpoint.npz")
+    save_checkpoint(path, render(tracer, 4, workers=0), "key")
+    accum, _ = load_checkpoint(path, "key", (HEIGHT, WIDTH, ACCUM_CHANNELS))
+    assert accum is not None
+    np.testing.assert_array_equal(render(tracer, 8, workers=0, accum=accum),
+                                  render(tracer, 8, workers=0))
@@ -0,0 +1,56 @@
+#  test_simpleRT_denoise.py
+#
+#  The a-trous denoiser on flat noisy images and at normal edges.
+
+import numpy as np
+
+from simpleRT_denoise import denoise
+
+H = W = 32
+
+
+def scene(left_normal, right_normal, seed=0):
+    """Gray 0.2 on the left half, 0.8 on the right, with noise of std 0.1"""
+    truth = np.where(np.arange(W) < W // 2, 0.2, 0.8)[None, :, None] * np.ones((H, W, 3))
+    noisy = truth + np.random.default_rng(seed).normal(0, 0.1, (H, W, 1))
+    albedo = np.full((H, W, 3), 0.7)
+    normal = np.where((np.arange(W) < W // 2)[None, :, None], left_normal, right_normal)
+    normal = normal * np.ones((H, W, 3))
+    depth = np.ones((H, W))
+    # a wide luminance weight, the normals alone keep the halves apart
+    variance = np.full((H, W), 1.0)
+    return truth, noisy, albedo, normal, depth, variance
+
+
+def rmse(a, b):
+    return np.sqrt(np.mean((a - b) ** 2))
+
+
+def test_flat_noisy_image():
+    rng = np.random.default_rng(1)
+    noisy = 0.5 + rng.normal(0, 0.1, (H, W, 1)) * np.ones(3)
+    albedo = np.full((H, W, 3), 0.7)
+    normal = np.zeros((H, W, 3))
+    normal[:, :, 2] = 1
+    out = denoise(noisy, albedo, normal, np.ones((H, W)), np.full((H, W), 0.01))
+    assert rmse(out, 0.5) < rmse(noisy, 0.5) / 4
+    assert abs(out.mean() - noisy.mean()) < 1e-2
+
+
+def test_normal_edges_stay_sharp():
+    truth, noisy, albedo, normal, depth, variance = scene((1, 0, 0), (0, 1, 0))
+    out = denoise(noisy, albedo, normal, depth, variance)
+    edge = slice(W // 2 - 2, W // 2 + 2)
+    assert rmse(out[:, edge], truth[:, edge]) < rmse(noisy[:, edge], truth[:, edge])
+    # the same image on one flat surface is blurred across the middle
+    _, _, _, flat, _, _ = scene((0, 0, 1), (0, 0, 1))
+    blurred = denoise(noisy, albedo, flat, depth, variance)
+    assert rmse(blurred[:, edge], truth[:, edge]) > 2 * rmse(out[:, edge], truth[:, edge])
+
+
+def test_misses_are_kept():
+    truth, noisy, albedo, normal, depth, variance = scene((1, 0, 0), (0, 1, 0))
+    normal[:, :4] = 0
+    albedo[:, :4] = 0
+    out = denoise(noisy, albedo, normal, depth, variance)
+    np.testing.assert_array_equal(out[:, :4], noisy[:, :4])
@@ -0,0 +1,61 @@
+#  test_simpleRT_distributed.py
+#
+#  Renders split into tasks of a shared directory against local renders.
+
+import os
+
+import numpy as np
+import pytest
+
+from conftest import DEPTH, HEIGHT, TILE_SIZE, WIDTH
+from simpleRT_distributed import claim, collect, merge, run_worker, split_tasks, submit
+from simpleRT_sampler import Sampler
+from simpleRT_tiles import make_tiles
+from test_simpleRT_parallel import render
+
+
+@pytest.mark.parametrize("split", ["SAMPLES", "TILES"])
+def test_merge_matches_local_render(tracer, tmp_path, split):
+    tiles = make_tiles(WIDTH, HEIGHT, TILE_SIZE)
+    tasks = split_tasks(tiles, 0, 4, 3, split)
+    assert len(tasks) == 3
+    job_dir = submit(
+        str(tmp_path), tracer, WIDTH, HEIGHT, DEPTH, Sampler(seed=0), 3, "key", tasks
+    )
+    assert run_worker(str(tmp_path), idle_timeout=0, poll=0) == 3
+    key, accum = merge([job_dir])
+    assert key == "key"
+    np.testing.assert_allclose(accum, render(tracer, 4, workers=0), rtol=1e-12, atol=1e-15)
+
+
+def test_collect_renders_while_waiting(tracer, tmp_path):
+    tasks = split_tasks(make_tiles(WIDTH, HEIGHT, TILE_SIZE), 0, 4, 2)
+    job_dir = submit(
+        str(tmp_path), tracer, WIDTH, HEIGHT, DEPTH, Sampler(seed=0), 3, "key", tasks
+    )
+    partials = dict(collect(job_dir, len(tasks), "key", work=True, poll=0, timeout=10))
+    assert sorted(partials) == [0, 1]
+    np.testing.assert_allclose(sum(partials.values()), render(tracer, 4, workers=0),
+                               rtol=1e-12, atol=1e-15)
+
+
+def test_collect_times_out_without_nodes(tracer, tmp_path):
+    tasks = split_tasks(make_tiles(WIDTH, HEIGHT, TILE_SIZE), 0, 4, 2)
+    job_dir = submit(
+        str(tmp_path), tracer, WIDTH, HEIGHT, DEPTH, Sampler(seed=0), 3, "key", tasks
+    )
+    with pytest.raises(TimeoutError):
+        next(collect(job_dir, len(tasks), "key", poll=0.01, timeout=0.05))
+
+
+def test_stale_claims_are_handed_out_again(tracer, tmp_path):
+    tasks = split_tasks(make_tiles(WIDTH, HEIGHT, TILE_SIZE), 0, 4, 2)
+    job_dir = submit(
+        str(tmp_path), tracer, WIDTH, HEIGHT, DEPTH, Sampler(seed=0), 3, "key", tasks
+    )
+    # a node claims a task and dies
+    _, claimed, _ = claim(str(tmp_path))
+    os.utime(claimed, (0, 0))
+    partials = collect(job_dir, len(tasks), "key", work=True, poll=0, timeout=10, stale=1)
+    partials = dict(partials)
+    assert sorted(partials) == [0, 1]
@@ -0,0 +1,67 @@
+#  test_simpleRT_irradiance.py
+#
+#  Interpolated irradiance of the cache against brute-force sampling, on
+#  a floor under a ceiling whose radiance grows along x.
+
+import numpy as np
+
+from simpleRT_bsdf import sample_diffuse
+from simpleRT_irradiance import IrradianceCache
+
+UP = np.array((0.0, 0.0, 1.0))
+
+
+def trace(origins, directions, depth):
+    """radiance 1 + tanh(x) / 2 of the ceiling at z = 1, and the distance to it"""
+    with np.errstate(divide="ignore"):
+        t = np.where(directions[:, 2] > 0, (1 - origins[:, 2]) / directions[:, 2], np.inf)
+    x = origins[:, 0] + np.where(np.isfinite(t), t, 0) * directions[:, 0]
+    radiance = np.where(np.isfinite(t), 1 + np.tanh(x) / 2, 0)
+    return np.repeat(radiance[:, None], 3, axis=1), t
+
+
+def brute_force(points, rays=20000, seed=0):
+    """irradiance of every point from cosine-weighted rays, no cache"""
+    rng = np.random.default_rng(seed)
+    irradiance = []
+    for point in points:
+        directions, _ = sample_diffuse(UP, rng.random(rays), rng.random(rays))
+        radiance, _ = trace(np.tile(point, (rays, 1)), directions, 0)
+        # E = pi * mean of the radiance for cosine-weighted directions
+        irradiance.append(np.pi * radiance.mean(axis=0))
+    return np.array(irradiance)
+
+
+def floor_points(n, seed):
+    rng = np.random.default_rng(seed)
+    points = np.zeros((n, 3))
+    points[:, :2] = rng.uniform(-1, 1, (n, 2))
+    return points, np.tile(UP, (n, 1))
+
+
+def test_lookup_matches_brute_force():
+    cache = IrradianceCache((-1, -1, 0), (1, 1, 1), accuracy=0.25, rays=64)
+    points, normals = floor_points(400, seed=1)
+    cache.fill(points, normals, 1, trace)
+    # records are sparse: most points interpolate
+    assert 0 < len(cache) < len(points) / 2
+
+    points, normals = floor_points(20, seed=2)
+    irradiance, valid = cache.lookup(points, normals, 1)
+    assert valid.mean() > 0.9
+    expected = brute_force(points[valid])
+    np.testing.assert_allclose(irradiance[valid], expected, rtol=0.03)
+
+
+def test_records_by_depth_and_frozen_cache():
+    cache = IrradianceCache((-1, -1, 0), (1, 1, 1), max_depth=2)
+    point = np.zeros(3)
+    first = cache.irradiance_at(point, UP, 2, trace)
+    np.testing.assert_allclose(first, np.pi, rtol=0.05)
+    assert len(cache) == 1
+    # the record is reused at its depth only
+    np.testing.assert_allclose(cache.irradiance_at(point, UP, 2, trace), first, rtol=1e-12)
+    assert not cache.lookup(point[None], UP[None], 1)[1][0]
+    cache.frozen = True
+    assert cache.irradiance_at(point, UP, 1, trace) is None
+    assert len(cache) == 1
@@ -0,0 +1,63 @@
+#  test_simpleRT_lighttree.py
+#
+#  The picks of the light tree against its pdf.
+
+import numpy as np
+import pytest
+
+from simpleRT_headless import light_object
+from simpleRT_lights import LightTable
+from simpleRT_lighttree import LightTree
+
+N_LIGHTS = 12
+
+
+@pytest.fixture
+def tree():
+    rng = np.random.default_rng(3)
+    lights = [
+        light_object("Point.%02d" % i, energy=float(e), location=loc)
+        for i, (e, loc) in enumerate(zip(
+            rng.uniform(1, 50, N_LIGHTS), rng.uniform((-4, -4, -1), (4, 4, 3), (N_LIGHTS, 3))
+        ))
+    ]
+    lights.append(light_object(
+        "Area", type="AREA", energy=30.0, size=1.0, location=(0, 0, 2.5)
+    ))
+    return LightTree(LightTable(lights))
+
+
+def hits(n, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform((-2, -2, 0), (2, 2, 0), (n, 3))
+    normals = np.tile((0.0, 0.0, 1.0), (n, 1))
+    return points, normals
+
+
+def test_pdf_sums_to_one(tree):
+    points, normals = hits(20)
+    total = sum(
+        tree.pdf(np.full(len(points), i), points, normals) for i in range(N_LIGHTS + 1)
+    )
+    np.testing.assert_allclose(total, 1)
+
+
+def test_sample_returns_its_pdf(tree):
+    points, normals = hits(200)
+    light, pdf = tree.sample(points, normals, np.random.default_rng(1).random(200))
+    np.testing.assert_allclose(pdf, tree.pdf(light, points, normals))
+    assert np.all(pdf > 0)
+
+
+def test_picks_follow_the_pdf(tree):
+    n = 20000
+    points, normals = hits(1)
+    points, normals = np.repeat(points, n, axis=0), np.repeat(normals, n, axis=0)
+    light, _ = tree.sample(points, normals, np.random.default_rng(2).random(n))
+    frequency = np.bincount(light, minlength=N_LIGHTS + 1) / n
+    pdf = np.array([tree.pdf([i], points[:1], normals[:1])[0] for i in range(N_LIGHTS + 1)])
+    assert np.all(np.abs(frequency - pdf) <= 4 * np.sqrt(pdf * (1 - pdf) / n))
+    # lights under the surface can never light it and are never picked
+    below = tree.lights.position[:, 2] < 0
+    assert below.any()
+    np.testing.assert_array_equal(pdf[below], 0)
@@ -0,0 +1,80 @@
+#  test_simpleRT_mis.py
+#
+#  MIS direct light against estimates of a single sampling technique.
+
+import numpy as np
+import pytest
+
+from simpleRT_bsdf import blinn_phong, sample_diffuse
+from simpleRT_headless import light_object
+from simpleRT_lights import LightTable
+from simpleRT_mis import direct_light
+from simpleRT_sampler import RandomStream
+
+N = 40000
+
+
+def unoccluded(origins, directions, t_max):
+    return np.zeros(len(origins), dtype=bool)
+
+
+@pytest.fixture
+def hits():
+    """N copies of one diffuse hit on the floor, under a 1 m area light"""
+    lights = LightTable([light_object(
+        "Light", type="AREA", energy=40.0, size=1.0, location=(0.3, 0, 1.5)
+    )])
+    loc = np.zeros((N, 3))
+    norm = np.tile((0.0, 0.0, 1.0), (N, 1))
+    ray_dir = np.tile((0.0, 0.6, -0.8), (N, 1))
+    diffuse = np.tile((0.8, 0.5, 0.2), (N, 1))
+    return lights, loc, norm, ray_dir, diffuse
+
+
+def light_sampling(lights, loc, norm, ray_dir, diffuse, rng):
+    """One light sample per hit, the estimator of RT_trace_ray"""
+    light_loc = lights.disk_points(0, 2 * np.pi * rng.random(N), rng.random(N))
+    light_vec = light_loc - loc
+    dist = np.linalg.norm(light_vec, axis=1)
+    light_dir = light_vec / dist[:, None]
+    cos_light = np.maximum(-light_dir @ lights.normal[0], 0)
+    f = blinn_phong(norm, -ray_dir, light_dir, diffuse, np.zeros_like(diffuse), np.ones(N))
+    return lights.intensity[0] * f * (cos_light / dist ** 2)[:, None]
+
+
+def bsdf_sampling(lights, loc, norm, diffuse, rng):
+    """One cosine-weighted direction per hit, intersected with the light disk"""
+    direction, _ = sample_diffuse(norm, rng.random(N), rng.random(N))
+    t, _ = lights.intersect_disk(0, loc, direction)
+    radiance = lights.intensity[0] / lights.area[0]
+    # diffuse * cos / pdf with pdf = cos / pi
+    return np.where(np.isfinite(t)[:, None], radiance * diffuse * np.pi, 0)
+
+
+@pytest.mark.parametrize("heuristic", ["BALANCE", "POWER"])
+def test_matches_single_technique(hits, heuristic):
+    lights, loc, norm, ray_dir, diffuse = hits
+    rng = np.random.default_rng(1)
+    light = light_sampling(lights, loc, norm, ray_dir, diffuse, rng)
+    bsdf = bsdf_sampling(lights, loc, norm, diffuse, rng)
+    color, lit = direct_light(
+        lights, unoccluded, loc, norm, ray_dir, diffuse, np.zeros((N, 3)), np.ones(N),
+        RandomStream(rng), heuristic,
+    )
+    assert lit.all()
+    # the weights never make MIS noisier than the worse technique alone
+    assert np.all(color.std(axis=0) <= np.maximum(light.std(axis=0), bsdf.std(axis=0)))
+    for estimate in (light, bsdf):
+        error = 4 * np.sqrt(color.var(axis=0) / N + estimate.var(axis=0) / N)
+        assert np.all(np.abs(color.mean(axis=0) - estimate.mean(axis=0)) < error)
+
+
+def test_occluded_light_is_dark(hits):
+    lights, loc, norm, ray_dir, diffuse = hits
+    color, lit = direct_light(
+        lights, lambda o, d, t: np.ones(len(o), dtype=bool), loc[:10], norm[:10],
+        ray_dir[:10], diffuse[:10], np.zeros((10, 3)), np.ones(10),
+        RandomStream(np.random.default_rng(0)),
+    )
+    assert not lit.any()
+    np.testing.assert_array_equal(color, 0)
@@ -0,0 +1,26 @@
+#  test_simpleRT_parallel.py
+#
+#  Renders with and without worker processes.
+
+import numpy as np
+
+from conftest import DEPTH, HEIGHT, TILE_SIZE, WIDTH
+from simpleRT_parallel import render_tiles
+from simpleRT_sampler import Sampler
+
+
+def render(tracer, samples, workers, accum=None):
+    """Accumulation buffer of a finished render_tiles() run"""
+    frame = None
+    for _, _, _, frame in render_tiles(
+        tracer, WIDTH, HEIGHT, DEPTH, samples, Sampler(seed=0), workers,
+        tile_size=TILE_SIZE, seed=3, accum=accum,
+    ):
+        frame = frame.copy()
+    return frame
+
+
+def test_workers_do_not_change_the_image(tracer):
+    single = render(tracer, 2, workers=0)
+    assert single[:, :, :3].any()
+    np.testing.assert_array_equal(render(tracer, 2, workers=2), single)
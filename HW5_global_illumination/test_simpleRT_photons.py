@@ -0,0 +1,87 @@
+#  test_simpleRT_photons.py
+#
+#  Flux of the emitted and stored photons, and the radius schedule and
+#  density estimate of the progressive passes.
+
+from math import pi
+
+import numpy as np
+
+import simpleRT_photons
+from simpleRT_headless import light_object
+from simpleRT_lights import LightTable
+from simpleRT_photons import build_photon_map, emit_photons, specular_bounds, trace_photons
+
+# total flux spread over the [-1, 1]^2 square of the fake passes
+FLUX = 8.0
+
+
+def test_emitted_flux_matches_the_target_solid_angle():
+    lights = LightTable([
+        light_object("Near", energy=20.0, location=(0, 0, 2)),
+        light_object("Far", energy=60.0, location=(3, -1, 4)),
+    ])
+    center, radius = np.zeros(3), 0.5
+    rng = np.random.default_rng(0)
+    origins, directions, flux = emit_photons(lights, 5000, (center, radius), rng)
+    # every direction is inside the cone of the sphere seen from its light
+    to_center = center - origins
+    dist = np.linalg.norm(to_center, axis=1)
+    cos = np.einsum("ij,ij->i", directions, to_center) / dist
+    assert np.all(cos >= np.sqrt(1 - (radius / dist) ** 2) - 1e-12)
+    # white lights picked by I * solid angle: the photons share the flux evenly
+    solid_angle = 2 * pi * (1 - np.sqrt(1 - radius ** 2 / np.sum(lights.position ** 2, axis=1)))
+    expected = lights.intensity.T @ solid_angle
+    np.testing.assert_allclose(flux.sum(axis=0), expected, rtol=1e-12)
+
+
+def test_stored_photons_keep_their_flux(snapshot):
+    # roulette decides whether a photon goes on, never how much it carries
+    count = 2000
+    _, _, emitted = emit_photons(
+        snapshot.light_table, count, specular_bounds(snapshot), np.random.default_rng(1)
+    )
+    position, direction, flux = trace_photons(snapshot, count, np.random.default_rng(1))
+    assert len(flux) > 0
+    assert np.all(np.isin(flux[:, 0], emitted[:, 0]))
+    # inside the room
+    assert np.all(position.min(axis=0) > np.array((-1, -1, 0)) - 1e-9)
+    assert np.all(position.max(axis=0) < np.array((1, 1, 2)) + 1e-9)
+    np.testing.assert_allclose(np.linalg.norm(direction, axis=1), 1)
+
+
+def fake_passes(monkeypatch):
+    """replace the traced photons by ones spread evenly over the z = 0 square"""
+    def trace(snapshot, count, rng):
+        position = np.zeros((count, 3))
+        position[:, :2] = rng.uniform(-1, 1, (count, 2))
+        direction = np.tile((0.0, 0.0, -1.0), (count, 1))
+        return position, direction, np.full((count, 3), FLUX / count)
+    monkeypatch.setattr(simpleRT_photons, "trace_photons", trace)
+
+
+def test_radius_schedule(monkeypatch):
+    fake_passes(monkeypatch)
+    alpha = 0.5
+    photon_map = build_photon_map(None, photons=100, passes=5, radius=0.2, alpha=alpha)
+    radii = np.unique(photon_map.radius)[::-1]
+    expected = [0.2]
+    for i in range(4):
+        expected.append(expected[-1] * np.sqrt((i + 1 + alpha) / (i + 2)))
+    np.testing.assert_allclose(radii, expected, rtol=1e-12)
+    np.testing.assert_allclose(photon_map.cell_size, 0.2)
+
+
+def test_density_conserves_flux(monkeypatch):
+    fake_passes(monkeypatch)
+    photon_map = build_photon_map(None, photons=20000, passes=4, radius=0.1)
+    rng = np.random.default_rng(5)
+    points = np.zeros((50, 3))
+    points[:, :2] = rng.uniform(-0.8, 0.8, (50, 2))
+    up = np.tile((0.0, 0.0, 1.0), (50, 1))
+    irradiance = photon_map.irradiance(points, up)
+    # the flux over the area of the square
+    np.testing.assert_allclose(irradiance.mean(axis=0), FLUX / 4, rtol=0.03)
+    np.testing.assert_allclose(irradiance, FLUX / 4, rtol=0.3)
+    # photons arriving from below the surface are not gathered
+    np.testing.assert_array_equal(photon_map.irradiance(points, -up), 0)
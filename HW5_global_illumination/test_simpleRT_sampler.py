@@ -0,0 +1,70 @@
+#  test_simpleRT_sampler.py
+#
+#  Stratification and per-pixel decorrelation of the samplers.
+
+import numpy as np
+import pytest
+
+from simpleRT_sampler import BSDF, CAMERA, Sampler
+
+N = 64
+
+
+def pixel_points(sampler, pixel, stage=CAMERA, bounce=0):
+    """The first N samples of a pixel in the first pair of dimensions of stage"""
+    indices = np.arange(N)
+    stream = sampler.stream(np.full(N, pixel), indices)
+    stream.start(stage, bounce)
+    return stream.random((2, N)).T
+
+
+@pytest.mark.parametrize("method", ["SOBOL", "HALTON"])
+def test_one_sample_per_stratum(method):
+    for pixel in (0, 17, 1000):
+        points = pixel_points(Sampler(method, seed=5), pixel)
+        assert np.all((points >= 0) & (points < 1))
+        # Halton's second dimension has base 3, N is a power of 2
+        for dim in (0, 1) if method == "SOBOL" else (0,):
+            np.testing.assert_array_equal(np.bincount((points[:, dim] * N).astype(int)), 1)
+
+
+def test_sobol_pairs_are_stratified_in_2d():
+    for stage, bounce in ((CAMERA, 0), (BSDF, 0), (BSDF, 3)):
+        points = pixel_points(Sampler("SOBOL", seed=1), 42, stage, bounce)
+        cells = (points * 8).astype(int)
+        np.testing.assert_array_equal(np.bincount(cells[:, 0] * 8 + cells[:, 1]), 1)
+
+
+@pytest.mark.parametrize("method", ["SOBOL", "HALTON"])
+def test_pixels_are_decorrelated(method):
+    sampler = Sampler(method)
+    pixels = np.arange(4096)
+    first = sampler.stream(pixels, np.zeros(4096, dtype=np.int64))
+    first.start(BSDF)
+    u = first.random(4096)
+    # the first sample of every pixel is uniform over the image
+    counts = np.bincount((u * 16).astype(int), minlength=16)
+    assert np.all(np.abs(counts - 256) < 4 * 16)
+    # and unrelated to the one of the next pixel
+    assert abs(np.corrcoef(u[:-1], u[1:])[0, 1]) < 0.1
+    # nor is the Sobol sequence of a pixel that of its neighbor; Halton
+    # rotates the same sequence per pixel
+    if method == "SOBOL":
+        a, b = pixel_points(sampler, 10), pixel_points(sampler, 11)
+        assert abs(np.corrcoef(a[:, 0], b[:, 0])[0, 1]) < 0.4
+
+
+def test_seed_and_single_paths():
+    a = pixel_points(Sampler("SOBOL", seed=1), 3)
+    np.testing.assert_array_equal(pixel_points(Sampler("SOBOL", seed=1), 3), a)
+    assert not np.array_equal(pixel_points(Sampler("SOBOL", seed=2), 3), a)
+    # a stream of one path draws the same numbers as its batch
+    stream = Sampler("SOBOL", seed=1).stream(np.array([3]), np.array([5]))
+    stream.start(CAMERA)
+    assert stream.random() == a[5, 0]
+    assert stream.random() == a[5, 1]
+
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        Sampler("STRATIFIED")
@@ -0,0 +1,96 @@
+#  test_simpleRT_scene.py
+#
+#  The triangle soup of a snapshot of the headless Cornell box.
+
+import pickle
+
+import numpy as np
+from simpleRT_headless import Depsgraph, cornell_box
+from simpleRT_scene import snapshot_scene
+
+# the room faces inward, every wall is one quad: normal, axis and its
+# coordinate on the wall
+WALLS = {
+    "Floor": ((0, 0, 1), 2, 0),
+    "Ceiling": ((0, 0, -1), 2, 2),
+    "Back": ((0, -1, 0), 1, 1),
+    "Left": ((1, 0, 0), 0, -1),
+    "Right": ((-1, 0, 0), 0, 1),
+}
+ROOM = np.array([(-1, -1, 0), (1, 1, 2)])
+
+
+def triangles_of(snapshot, name):
+    index = [obj.name for obj in snapshot.objects].index(name)
+    return snapshot.tri_object == index
+
+
+def test_triangle_count(snapshot):
+    # 5 walls of 2 triangles, a box of 12 and a 24 x 12 UV sphere
+    assert len(snapshot) == 5 * 2 + 12 + (2 * 24 + 10 * 24 * 2)
+    assert snapshot.triangles.shape == (len(snapshot), 3, 3)
+    assert snapshot.normals.shape == snapshot.tri_object.shape + (3,)
+    assert snapshot.tri_face.shape == snapshot.tri_object.shape
+
+
+def test_wall_vertices_and_normals(snapshot):
+    for name, (normal, axis, value) in WALLS.items():
+        rows = triangles_of(snapshot, name)
+        assert rows.sum() == 2
+        np.testing.assert_allclose(snapshot.normals[rows], [normal, normal], atol=1e-12)
+        np.testing.assert_allclose(snapshot.triangles[rows][..., axis], value, atol=1e-12)
+        # and spans the room along the other two axes
+        others = np.delete(snapshot.triangles[rows].reshape(-1, 3), axis, axis=1)
+        np.testing.assert_allclose(others.min(axis=0), np.delete(ROOM[0], axis))
+        np.testing.assert_allclose(others.max(axis=0), np.delete(ROOM[1], axis))
+
+
+def test_box_is_in_world_space(snapshot):
+    rows = triangles_of(snapshot, "Box")
+    c, s = np.cos(0.3), np.sin(0.3)
+    corners = np.array([
+        (x, y, z) for x in (-0.3, 0.3) for y in (-0.3, 0.3) for z in (-0.6, 0.6)
+    ])
+    expected = corners @ np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]]).T + (-0.4, 0.3, 0.6)
+    found = np.unique(snapshot.triangles[rows].reshape(-1, 3).round(9), axis=0)
+    np.testing.assert_allclose(found, np.unique(expected.round(9), axis=0))
+    # face normals point out of the box
+    centroids = snapshot.triangles[rows].mean(axis=1)
+    outward = np.einsum("ij,ij->i", snapshot.normals[rows], centroids - (-0.4, 0.3, 0.6))
+    assert np.all(outward > 0)
+
+
+def test_material_of_every_triangle(snapshot):
+    diffuse = snapshot.materials.diffuse_color[snapshot.tri_object]
+    np.testing.assert_allclose(diffuse[triangles_of(snapshot, "Left")], [[0.7, 0.1, 0.1]] * 2)
+    np.testing.assert_allclose(diffuse[triangles_of(snapshot, "Right")], [[0.1, 0.6, 0.1]] * 2)
+    glass = triangles_of(snapshot, "Glass")
+    np.testing.assert_array_equal(diffuse[glass], 0)
+    assert np.all(snapshot.materials.transmission[snapshot.tri_object[glass]] == 1)
+
+
+def test_hidden_objects_are_skipped():
+    scene = cornell_box(resolution=(8, 8))
+    for obj in scene.objects:
+        if obj.name in ("Glass", "Light"):
+            obj.hide_render = True
+    snapshot = snapshot_scene(Depsgraph(scene))
+    assert "Glass" not in [obj.name for obj in snapshot.objects]
+    assert len(snapshot) == 5 * 2 + 12
+    assert len(snapshot.light_table) == 0
+
+
+def test_pickled_snapshot_keeps_the_arrays(snapshot):
+    copy = pickle.loads(pickle.dumps(snapshot))
+    # bpy objects stay behind, referred to by name
+    assert copy.objects == [obj.name for obj in snapshot.objects]
+    assert copy.lights == ["Light"]
+    assert copy.scene is None and copy.depsgraph is None
+    for name in ("triangles", "normals", "tri_object", "tri_face"):
+        np.testing.assert_array_equal(getattr(copy, name), getattr(snapshot, name))
+    # and the BVH, for the worker processes
+    origins = np.tile(snapshot.camera.location, (3, 1))
+    directions = [(0, 1, 0), (0.2, 1, -0.3), (-0.2, 1, 0.3)]
+    np.testing.assert_array_equal(
+        copy.bvh.intersect(origins, directions)[0], snapshot.bvh.intersect(origins, directions)[0]
+    )
@@ -0,0 +1,118 @@
+#  test_simpleRT_wavefront.py
+#
+#  The wavefront tracer against RT_trace_ray. The plugin needs Blender, so
+#  trace_ray() below is a scalar port of RT_trace_ray on NumPy arrays
+#  (light sampling, no roulette, cache nor photons). Both draw their random
+#  numbers in a different order, they agree within sampling noise.
+
+from math import sqrt
+
+import numpy as np
+
+from conftest import DEPTH, HEIGHT, WIDTH
+from simpleRT_bsdf import sample_diffuse
+from simpleRT_wavefront import WavefrontTracer
+
+EPS = 1e-3
+# camera rays per pixel
+SAMPLES = 64
+
+
+def direct_light(snapshot, loc, norm, ray_dir, mat, rng):
+    """RT_direct_light without MIS, ambient when no light is visible"""
+    lights, materials = snapshot.light_table, snapshot.materials
+    diffuse = materials.diffuse_color[mat]
+    specular = materials.specular_color[mat]
+    hardness = float(materials.specular_hardness[mat])
+    color = np.zeros(3)
+    no_light_hit = True
+    for i in range(len(lights)):
+        light_color = lights.intensity[i]
+        light_loc = lights.position[i]
+        if lights.is_area[i]:
+            theta = 2 * np.pi * rng.random()
+            light_loc = lights.disk_points(i, theta, rng.random())
+            to_hit = (loc - light_loc) / np.linalg.norm(loc - light_loc)
+            cos_theta = float(to_hit @ lights.normal[i])
+            light_color = light_color * max(cos_theta, 0)
+        light_vec = light_loc - loc
+        dist = np.linalg.norm(light_vec)
+        light_dir = light_vec / dist
+        if snapshot.occluded(loc + norm * EPS, light_dir, dist):
+            continue
+        i_light = light_color / dist ** 2
+        color += diffuse * i_light * float(norm @ light_dir)
+        half = light_dir - ray_dir
+        half /= np.linalg.norm(half)
+        color += specular * i_light * float(norm @ half) ** hardness
+        no_light_hit = False
+    if no_light_hit:
+        color += diffuse * snapshot.ambient_color
+    return color
+
+
+def trace_ray(snapshot, origin, ray_dir, depth, rng):
+    """RT_trace_ray of one ray"""
+    has_hit, loc, norm, _, obj, _ = snapshot.ray_cast(origin, ray_dir)
+    if not has_hit:
+        return np.zeros(3)
+    inside = norm @ ray_dir > 0
+    if inside:
+        norm = -norm
+    materials = snapshot.materials
+    mat = materials.index[obj.name]
+    color = direct_light(snapshot, loc, norm, ray_dir, mat, rng)
+    if depth == 0:
+        return color
+
+    # diffuse GI
+    direction, diffuse_weight = sample_diffuse(norm, rng.random(), rng.random())
+    weight = materials.diffuse_color[mat] * diffuse_weight
+    if weight.any():
+        color += weight * trace_ray(snapshot, loc + norm * EPS, direction, depth - 1, rng)
+
+    # fresnel reflection
+    reflectivity = materials.mirror_reflectivity[mat]
+    if materials.use_fresnel[mat]:
+        r0 = ((1 - materials.ior[mat]) / (1 + materials.ior[mat])) ** 2
+        reflectivity = r0 + (1 - r0) * (1 + ray_dir @ norm) ** 5
+    if reflectivity > 0:
+        direction = ray_dir - 2 * norm * (ray_dir @ norm)
+        direction /= np.linalg.norm(direction)
+        color += reflectivity * trace_ray(snapshot, loc + norm * EPS, direction, depth - 1, rng)
+
+    # refraction
+    transmission = materials.transmission[mat]
+    if transmission > 0:
+        ratio = materials.ior[mat] if inside else 1 / materials.ior[mat]
+        under_sqrt = 1 - ratio ** 2 * (1 - (ray_dir @ -norm) ** 2)
+        if under_sqrt > 0:
+            direction = ratio * (ray_dir - (ray_dir @ norm) * norm) - norm * sqrt(under_sqrt)
+            weight = (1 - reflectivity) * transmission
+            color += weight * trace_ray(snapshot, loc - norm * EPS, direction, depth - 1, rng)
+    return color
+
+
+def block_means(colors):
+    """Mean and variance of the mean of the samples of the 2 x 2 blocks of pixels"""
+    blocks = colors.reshape(2, HEIGHT // 2, 2, WIDTH // 2, SAMPLES, 3)
+    blocks = blocks.transpose(0, 2, 1, 3, 4, 5).reshape(4, -1, 3)
+    return blocks.mean(axis=1), blocks.var(axis=1) / blocks.shape[1]
+
+
+def test_matches_trace_ray(snapshot):
+    _, directions = snapshot.camera.rays(WIDTH, HEIGHT)
+    directions = np.repeat(directions, SAMPLES, axis=0)
+    origin = np.asarray(snapshot.camera.location, dtype=np.float64)
+    tracer = WavefrontTracer(snapshot, rng=np.random.default_rng(1))
+    wavefront = tracer.trace(origin, directions, DEPTH)
+    rng = np.random.default_rng(2)
+    scalar = np.array([
+        trace_ray(snapshot, origin, direction, DEPTH, rng) for direction in directions
+    ])
+
+    wavefront_mean, wavefront_var = block_means(wavefront)
+    scalar_mean, scalar_var = block_means(scalar)
+    assert np.all(scalar_mean > 0)
+    # within 4 standard deviations of the difference
+    assert np.all(np.abs(wavefront_mean - scalar_mean) < 4 * np.sqrt(wavefront_var + scalar_var))